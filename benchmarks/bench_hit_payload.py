@@ -0,0 +1,194 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+cost of a hook hit message, before the thread goes to sleep
+
+    python benchmarks/bench_hit_payload.py [hits]
+
+spawns a python child that keeps calling libc usleep, loads lib/core.js in
+it and measures from an Interceptor callback on every call:
+
+    full    - the old hit: backtrace, symbols, telescope of every register
+              and the pc instruction, sent as json
+    rescan  - _sendInfos with the map marked dirty on every hit, what each
+              hit did before the map calls were hooked: enumerateRangesSync
+              and a diff against the ranges the host knows
+    hit     - _sendInfos as it runs now, the ranges are only rescanned after
+              a map call returned
+
+agent time is measured around building and sending the message, host time
+is the decode of the last set_context frame received (see bench_protocol.py).
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+import timeit
+
+import frida
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from lib import protocol  # noqa: E402
+
+# appended to core.js
+AGENT = """
+var benchMode = null;
+var benchHits = 0;
+var benchLimit = 0;
+var benchElapsed = 0;
+
+function benchTelescope(value) {
+    var range = Process.findRangeByAddress(value);
+    if (range === null) {
+        return null;
+    }
+    if (range.protection.indexOf('r') < 0) {
+        return [-1, ''];
+    }
+    try {
+        var str = value.readUtf8String();
+        if (str !== null && str.length > 3) {
+            return [0, str];
+        }
+    } catch (e) {
+    }
+    var w = value.readPointer();
+    return [Process.findRangeByAddress(w) !== null ? 1 : 2, w];
+}
+
+function benchFullPayload(p, ctx) {
+    var regs = {};
+    for (var reg in ctx) {
+        var t = benchTelescope(ctx[reg]);
+        regs[reg] = {'value': ctx[reg], 'isValidPointer': t !== null, 'telescope': t};
+    }
+    regs['pc']['symbol'] = DebugSymbol.fromAddress(ctx.pc);
+    var inst = Instruction.parse(ctx.pc);
+    regs['pc']['instruction'] = {'size': inst.size, 'groups': inst.groups, 'thumb': false};
+    return {
+        'tid': Process.getCurrentThreadId(), 'reason': 0, 'ptr': p, 'is_java': false,
+        'context': regs,
+        'backtrace': {'bt': Thread.backtrace(ctx, Backtracer.ACCURATE).map(DebugSymbol.fromAddress),
+                      'type': 'native'}
+    };
+}
+
+var benchUsleep = Module.getExportByName(null, 'usleep');
+// the frida interceptor, Interceptor.attach is a dwarf hook and stops the thread
+wrappedInterceptor.attach(benchUsleep, {
+    onEnter: function() {
+        if (benchMode === null) {
+            return;
+        }
+        if (benchMode === 'rescan') {
+            api._rangesDirty = true;
+        }
+        var started = Date.now();
+        if (benchMode === 'full') {
+            send({'full': benchFullPayload(benchUsleep, this.context)});
+        } else {
+            getDwarf()._sendInfos(REASON_HOOK, benchUsleep, this.context);
+        }
+        benchElapsed += Date.now() - started;
+        benchHits++;
+        if (benchHits === benchLimit) {
+            send({'done': benchElapsed / benchHits, 'ranges': Process.enumerateRangesSync('---').length});
+            benchMode = null;
+        }
+    }
+});
+
+rpc.exports.benchstart = function(m, count) {
+    benchHits = 0;
+    benchElapsed = 0;
+    benchLimit = count;
+    benchMode = m;
+};
+"""
+
+# time.sleep doesn't go through usleep, call it directly
+TARGET = 'import ctypes\nlibc = ctypes.CDLL(None)\nwhile True:\n    libc.usleep(100)\n'
+
+
+class Bench(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.frame = None
+        self.deltas = 0
+        self.agent_ms = 0
+        self.ranges = 0
+
+    def on_message(self, message, data):
+        if protocol.is_frame(message, data):
+            kind = protocol.peek_type(data)
+            if kind == 'set_context':
+                self.frame = data
+            elif kind == 'ranges_delta':
+                self.deltas += 1
+            return
+        payload = message.get('payload', {})
+        if not isinstance(payload, dict):
+            return
+        if 'full' in payload:
+            hit = payload['full']
+            self.frame = protocol.encode('set_context', tid=hit['tid'], seq=1, meta=hit)
+        elif 'done' in payload:
+            self.agent_ms = payload['done']
+            self.ranges = payload['ranges']
+            self.done.set()
+
+    def run(self, script, mode, hits):
+        self.done.clear()
+        self.deltas = 0
+        script.exports_sync.benchstart(mode, hits)
+        self.done.wait()
+        # let the frames still in flight land
+        time.sleep(0.2)
+
+        frame = self.frame
+        decode = min(timeit.repeat(lambda: protocol.decode(frame), number=1000, repeat=5)) / 1000
+        print('%-6s %6d bytes  agent %7.3f ms/hit  host decode %7.2f us  %d ranges, %d deltas' % (
+            mode, len(frame), self.agent_ms, decode * 1e6, self.ranges, self.deltas))
+
+
+def main():
+    hits = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with open(os.path.join(ROOT, 'lib', 'core.js'), 'r') as f:
+        source = f.read() + AGENT
+    child = subprocess.Popen([sys.executable, '-c', TARGET])
+    try:
+        # give the child time to load libc
+        time.sleep(0.5)
+        session = frida.attach(child.pid)
+        bench = Bench()
+        script = session.create_script(source, runtime='v8')
+        script.on('message', bench.on_message)
+        script.load()
+
+        bench.run(script, 'full', hits)
+        bench.run(script, 'rescan', hits)
+        bench.run(script, 'hit', hits)
+
+        session.detach()
+    finally:
+        child.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+latency of an api call handed to a thread paused in a hook
+
+    python benchmarks/bench_paused_api.py [calls]
+
+spawns a python child that keeps calling libc usleep, pauses it in an
+Interceptor callback and measures round trips with:
+
+    polling  - the old handoff: rpc export sets next_api and sleeps until the
+               paused thread, itself sleeping 10ms at a time, fills next_api_result
+    message  - the current handoff: a tid tagged recv per request and an
+               api_result message back, resolved on the frida thread
+"""
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import frida
+
+AGENT = """
+var hc = null;
+var api = {
+    ping: function() { return Process.id; },
+    release: function() { return null; }
+};
+
+function loopPolling(tid) {
+    recv('' + tid, function() {}).wait();
+    while (hc.next_api === null) {
+        Thread.sleep(0.01);
+    }
+    hc.next_api_result = api[hc.next_api[0]].apply(null, hc.next_api[1]);
+    var released = hc.next_api[0] === 'release';
+    hc.next_api = null;
+    if (!released) {
+        loopPolling(tid);
+    }
+}
+
+function loopMessage(tid) {
+    while (true) {
+        var request = null;
+        recv('' + tid, function(payload) { request = payload; }).wait();
+        if (request.api === 'release') {
+            send({'id': request.id, 'result': null});
+            break;
+        }
+        send({'id': request.id, 'result': api[request.api].apply(null, request.args)});
+    }
+}
+
+var mode = null;
+Interceptor.attach(Module.getExportByName(null, 'usleep'), {
+    onEnter: function() {
+        if (mode === null || hc !== null) {
+            return;
+        }
+        var tid = Process.getCurrentThreadId();
+        hc = {'tid': tid, 'next_api': null, 'next_api_result': 'dwarf_handler'};
+        send({'paused': tid});
+        if (mode === 'polling') {
+            loopPolling(tid);
+        } else {
+            loopMessage(tid);
+        }
+        mode = null;
+        hc = null;
+    }
+});
+
+rpc.exports = {
+    setMode: function(m) {
+        mode = m;
+    },
+    api: function(tid, name, args) {
+        while (hc.next_api !== null) {
+            Thread.sleep(.5);
+        }
+        hc.next_api = [name, args];
+        while (hc.next_api_result === 'dwarf_handler') {
+            Thread.sleep(0.01);
+        }
+        var ret = hc.next_api_result;
+        hc.next_api_result = 'dwarf_handler';
+        return ret;
+    }
+};
+"""
+
+# time.sleep doesn't go through usleep, call it directly
+TARGET = 'import ctypes\nlibc = ctypes.CDLL(None)\nwhile True:\n    libc.usleep(1000)\n'
+
+
+class Bench(object):
+    def __init__(self):
+        self.paused = threading.Event()
+        self.tid = 0
+        self.waiters = {}
+        self.next_id = 0
+
+    def on_message(self, message, data):
+        payload = message.get('payload', {})
+        if 'paused' in payload:
+            self.tid = payload['paused']
+            self.paused.set()
+        elif 'id' in payload:
+            waiter = self.waiters.pop(payload['id'])
+            waiter[1] = payload['result']
+            waiter[0].set()
+
+    def call_polling(self, script, api):
+        script.post({'type': str(self.tid)})
+        return script.exports.api(self.tid, api, [])
+
+    def call_message(self, script, api):
+        self.next_id += 1
+        waiter = [threading.Event(), None]
+        self.waiters[self.next_id] = waiter
+        script.post({'type': str(self.tid), 'id': self.next_id, 'api': api, 'args': []})
+        waiter[0].wait()
+        return waiter[1]
+
+    def run(self, script, mode, calls):
+        self.paused.clear()
+        script.exports.set_mode(mode)
+        self.paused.wait()
+
+        call = self.call_polling if mode == 'polling' else self.call_message
+        samples = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            call(script, 'ping')
+            samples.append((time.perf_counter() - started) * 1000)
+        call(script, 'release')
+
+        samples.sort()
+        print('%-8s median %7.2f ms  p95 %7.2f ms  max %7.2f ms' % (
+            mode, statistics.median(samples), samples[int(len(samples) * .95) - 1], samples[-1]))
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    child = subprocess.Popen([sys.executable, '-c', TARGET])
+    try:
+        session = frida.attach(child.pid)
+        bench = Bench()
+        script = session.create_script(AGENT)
+        script.on('message', bench.on_message)
+        script.load()
+
+        bench.run(script, 'polling', calls)
+        bench.run(script, 'message', calls)
+
+        session.detach()
+    finally:
+        child.kill()
+
+
+if __name__ == '__main__':
+    main()
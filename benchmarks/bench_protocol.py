@@ -0,0 +1,117 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+decoder benchmark: legacy ':::' string messages vs binary frames
+
+    python benchmarks/bench_protocol.py
+
+both paths include the frida envelope parse (the json.loads frida does on
+the message before handing it to _on_message).
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib import protocol  # noqa: E402
+
+
+def _context_payload():
+    regs = {}
+    for i in range(29):
+        regs['x%d' % i] = {
+            'value': '0x%x' % (0x7fb0000000 + i * 0x1000),
+            'isValidPointer': True,
+            'telescope': [2, 'libc.so!malloc+0x%x' % i]
+        }
+    regs['pc'] = {
+        'value': '0x7fb1234560', 'isValidPointer': True,
+        'instruction': {'size': 4, 'groups': [], 'thumb': False},
+        'symbol': {'name': 'open', 'moduleName': 'libc.so', 'address': '0x7fb1234560'}
+    }
+    backtrace = [{'address': '0x%x' % (0x7fb0000000 + i), 'name': 'fn_%d' % i,
+                  'moduleName': 'libtarget.so', 'fileName': '', 'lineNumber': 0} for i in range(16)]
+    return {'tid': 1234, 'ptr': '0x7fb1234560', 'reason': 0, 'is_java': False,
+            'context': regs, 'backtrace': {'bt': backtrace, 'type': 'native'}}
+
+
+def _tracer_payload():
+    return [['call', '0x%x' % (0x7fb0000000 + i * 4), '0x%x' % (0x7fb1000000 + i * 8), i % 8]
+            for i in range(512)]
+
+
+def _legacy_message(cmd, payload, joined=False):
+    # what the old agent produced: cmd:::json or cmd:::a,b,c,d,...
+    if joined:
+        body = ','.join(str(v) for event in payload for v in event)
+    else:
+        body = json.dumps(payload)
+    return json.dumps({'type': 'send', 'payload': cmd + ':::' + body})
+
+
+def _framed_message(cmd, payload):
+    return json.dumps({'type': 'send', 'payload': protocol.FRAME_MARKER}), \
+        protocol.encode(cmd, tid=1234, seq=1, meta=payload)
+
+
+def _decode_legacy(envelope, joined=False):
+    message = json.loads(envelope)
+    parts = message['payload'].split(':::')
+    if joined:
+        # regroup the flattened events like the trace panel has to
+        values = parts[1].split(',')
+        return [values[i:i + 4] for i in range(0, len(values), 4)]
+    return json.loads(parts[1])
+
+
+def _decode_framed(envelope, data):
+    message = json.loads(envelope)
+    if protocol.is_frame(message, data):
+        return protocol.decode(data).meta
+    return None
+
+
+def _bench(name, legacy, framed, number):
+    legacy_t = min(timeit.repeat(legacy, number=number, repeat=5)) / number
+    framed_t = min(timeit.repeat(framed, number=number, repeat=5)) / number
+    print('%-12s legacy %8.2f us  framed %8.2f us  (%.2fx)' %
+          (name, legacy_t * 1e6, framed_t * 1e6, legacy_t / framed_t))
+
+
+def main():
+    context = _context_payload()
+    legacy_ctx = _legacy_message('set_context', context)
+    framed_ctx = _framed_message('set_context', context)
+    print('set_context  legacy %d bytes, framed %d + %d bytes' %
+          (len(legacy_ctx), len(framed_ctx[0]), len(framed_ctx[1])))
+    _bench('set_context',
+           lambda: _decode_legacy(legacy_ctx),
+           lambda: _decode_framed(*framed_ctx), 2000)
+
+    tracer = _tracer_payload()
+    legacy_trace = _legacy_message('tracer', tracer, joined=True)
+    framed_trace = _framed_message('tracer', tracer)
+    print('tracer       legacy %d bytes, framed %d + %d bytes' %
+          (len(legacy_trace), len(framed_trace[0]), len(framed_trace[1])))
+    _bench('tracer',
+           lambda: _decode_legacy(legacy_trace, joined=True),
+           lambda: _decode_framed(*framed_trace), 2000)
+
+
+if __name__ == '__main__':
+    main()
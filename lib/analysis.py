@@ -0,0 +1,730 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import hashlib
+import json
+import os
+import struct
+import threading
+from array import array
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from capstone import (Cs, CsError, CS_ARCH_ARM, CS_ARCH_ARM64, CS_ARCH_X86, CS_MODE_32,
+                      CS_MODE_64, CS_MODE_ARM, CS_MODE_THUMB, CS_MODE_LITTLE_ENDIAN)
+
+from lib.elf import ELF
+
+# results are kept across runs, unlike .tmp
+ANALYSIS_PATH = '.analysis'
+ANALYSIS_VERSION = 1
+ANALYSIS_MAGIC = b'DWAN'
+
+# edge kinds
+EDGE_FALL = 0
+EDGE_JUMP = 1
+EDGE_CALL = 2
+
+# instruction flow
+FLOW_NONE = 0
+FLOW_CALL = 1
+# call switching between arm and thumb, blx #imm
+FLOW_CALL_SWITCH = 2
+FLOW_JUMP = 3
+FLOW_BRANCH = 4
+FLOW_END = 5
+
+# per byte flags of the module image
+_INSN = 1
+_THUMB = 2
+_LEADER = 4
+_FUNCTION = 8
+# the run before this instruction stopped because it reached it
+_FALL_IN = 16
+
+# dynamic tags holding code pointers
+DT_INIT = 12
+DT_FINI = 13
+DT_INIT_ARRAY = 25
+DT_FINI_ARRAY = 26
+DT_INIT_ARRAYSZ = 27
+DT_FINI_ARRAYSZ = 28
+DT_PREINIT_ARRAY = 32
+DT_PREINIT_ARRAYSZ = 33
+
+ARM_CONDITIONS = ('eq', 'ne', 'cs', 'hs', 'cc', 'lo', 'mi', 'pl', 'vs', 'vc',
+                  'hi', 'ls', 'ge', 'lt', 'gt', 'le', 'al')
+# longest first, bl must not eat blx
+ARM_FLOW_MNEMONICS = ('blx', 'bx', 'bl', 'b', 'cbnz', 'cbz', 'pop', 'ldr', 'mov',
+                      'tbb', 'tbh', 'udf', 'bkpt')
+
+X86_END = ('ret', 'retf', 'retn', 'iret', 'iretd', 'iretq', 'hlt', 'ud2', 'int3')
+ARM64_END = ('ret', 'retaa', 'retab', 'br', 'braa', 'braaz', 'brab', 'brabz',
+             'eret', 'brk', 'hlt', 'udf')
+ARM64_BRANCH = ('cbz', 'cbnz', 'tbz', 'tbnz')
+ARM64_CALL = ('bl', 'blr', 'blraa', 'blraaz', 'blrab', 'blrabz')
+
+
+def immediate_target(op_str):
+    """ int value of the last operand when it's an immediate, branch targets
+    """
+    operand = op_str.rsplit(',', 1)[-1].strip()
+    if operand.startswith('#'):
+        operand = operand[1:]
+    try:
+        return int(operand, 0)
+    except ValueError:
+        return None
+
+
+def flow_x86(mnemonic, op_str):
+    # prefixes as bnd, notrack, rep come first
+    mnemonic = mnemonic.rsplit(' ', 1)[-1]
+    if mnemonic in X86_END:
+        return FLOW_END
+    if mnemonic in ('jmp', 'ljmp'):
+        return FLOW_JUMP
+    if mnemonic.startswith('j') or mnemonic.startswith('loop'):
+        return FLOW_BRANCH
+    if mnemonic in ('call', 'lcall'):
+        return FLOW_CALL
+    return FLOW_NONE
+
+
+def flow_arm64(mnemonic, op_str):
+    if mnemonic in ARM64_END:
+        return FLOW_END
+    if mnemonic == 'b':
+        return FLOW_JUMP
+    if mnemonic.startswith('b.') or mnemonic.startswith('bc.') or mnemonic in ARM64_BRANCH:
+        return FLOW_BRANCH
+    if mnemonic in ARM64_CALL:
+        return FLOW_CALL
+    return FLOW_NONE
+
+
+def split_arm(mnemonic):
+    """ (flow mnemonic, condition) or (None, None), beq.w -> (b, eq)
+    """
+    mnemonic = mnemonic.split('.', 1)[0]
+    for base in ARM_FLOW_MNEMONICS:
+        if mnemonic.startswith(base):
+            condition = mnemonic[len(base):]
+            if condition == '' or condition in ARM_CONDITIONS:
+                return base, '' if condition == 'al' else condition
+    if mnemonic.startswith('ldm'):
+        condition = mnemonic[-2:]
+        if condition in ARM_CONDITIONS and mnemonic[3:] not in ('ia', 'ib', 'da', 'db', 'fd', 'fa', 'ed', 'ea'):
+            return 'ldm', '' if condition == 'al' else condition
+        return 'ldm', ''
+    return None, None
+
+
+def flow_arm(mnemonic, op_str):
+    base, condition = split_arm(mnemonic)
+    if base is None:
+        return FLOW_NONE
+    # a conditional way out of the block keeps falling through
+    leave = FLOW_BRANCH if condition else FLOW_END
+    if base == 'b':
+        return FLOW_BRANCH if condition else FLOW_JUMP
+    if base == 'bl':
+        return FLOW_CALL
+    if base == 'blx':
+        return FLOW_CALL_SWITCH if immediate_target(op_str) is not None else FLOW_CALL
+    if base in ('cbz', 'cbnz'):
+        return FLOW_BRANCH
+    if base == 'bx':
+        return leave
+    if base in ('pop', 'ldm'):
+        return leave if 'pc' in op_str else FLOW_NONE
+    if base in ('ldr', 'mov'):
+        return leave if op_str.startswith('pc') else FLOW_NONE
+    # tbb, tbh, udf, bkpt
+    return leave
+
+
+class ModuleAnalysis(object):
+    """ functions, basic blocks and edges of a module
+
+        everything is kept as offsets from the module base in flat sorted
+        arrays, so the same results serve any load address. edges are
+        grouped by source block: the successors of block i are
+        edge_targets[edge_index[i]:edge_index[i + 1]]
+    """
+
+    class InvalidAnalysisError(Exception):
+        """ Raised when a cached analysis can't be read
+        """
+
+    # name, typecode
+    ARRAYS = (('functions', 'Q'), ('block_starts', 'Q'), ('block_ends', 'Q'),
+              ('edge_index', 'I'), ('edge_targets', 'Q'), ('edge_kinds', 'B'))
+
+    def __init__(self, name, base, size, arch):
+        self.name = name
+        self.base = base
+        self.size = size
+        self.arch = arch
+        self.functions = array('Q')
+        self.block_starts = array('Q')
+        self.block_ends = array('Q')
+        # 1 for thumb blocks
+        self.block_modes = bytearray()
+        self.edge_index = array('I', [0])
+        self.edge_targets = array('Q')
+        self.edge_kinds = array('B')
+
+    def __contains__(self, address):
+        return self.base <= address < self.base + self.size
+
+    def block_index(self, address):
+        """ index of the block holding address or -1
+        """
+        offset = address - self.base
+        i = bisect.bisect_right(self.block_starts, offset) - 1
+        if i >= 0 and offset < self.block_ends[i]:
+            return i
+        return -1
+
+    def block_at(self, address):
+        """ (start, end, thumb) of the block holding address or None
+        """
+        i = self.block_index(address)
+        if i < 0:
+            return None
+        return self.base + self.block_starts[i], self.base + self.block_ends[i], self.block_modes[i] == 1
+
+    def is_function(self, address):
+        offset = address - self.base
+        i = bisect.bisect_left(self.functions, offset)
+        return i < len(self.functions) and self.functions[i] == offset
+
+    def function_start(self, address):
+        """ closest function start at or before address or None
+        """
+        i = bisect.bisect_right(self.functions, address - self.base) - 1
+        if i < 0:
+            return None
+        return self.base + self.functions[i]
+
+    def successors(self, address):
+        """ [(target, kind)] leaving the block holding address
+        """
+        i = self.block_index(address)
+        if i < 0:
+            return []
+        return [(self.base + self.edge_targets[e], self.edge_kinds[e])
+                for e in range(self.edge_index[i], self.edge_index[i + 1])]
+
+    def function_blocks(self, address):
+        """ sorted [(start, end)] reachable from the function at address without calls
+        """
+        first = self.block_index(address)
+        if first < 0:
+            return []
+        seen = {first}
+        stack = [first]
+        while stack:
+            i = stack.pop()
+            for e in range(self.edge_index[i], self.edge_index[i + 1]):
+                if self.edge_kinds[e] == EDGE_CALL:
+                    continue
+                j = self.block_index(self.base + self.edge_targets[e])
+                if j >= 0 and j not in seen and not self.is_function(self.base + self.block_starts[j]):
+                    seen.add(j)
+                    stack.append(j)
+        return [(self.base + self.block_starts[i], self.base + self.block_ends[i]) for i in sorted(seen)]
+
+    def save(self, path):
+        arrays = [(name, getattr(self, name)) for name, _ in ModuleAnalysis.ARRAYS]
+        header = json.dumps({
+            'name': self.name,
+            'size': self.size,
+            'arch': self.arch,
+            'counts': [len(values) for _, values in arrays]
+        }).encode('utf8')
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # written aside and renamed, a killed ui never leaves half a cache
+        with open(path + '.part', 'wb') as f:
+            f.write(ANALYSIS_MAGIC + struct.pack('<II', ANALYSIS_VERSION, len(header)) + header)
+            for _, values in arrays:
+                values.tofile(f)
+            f.write(bytes(self.block_modes))
+        os.replace(path + '.part', path)
+
+    @staticmethod
+    def load(path, base):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise ModuleAnalysis.InvalidAnalysisError(str(e))
+        if data[:4] != ANALYSIS_MAGIC or len(data) < 12:
+            raise ModuleAnalysis.InvalidAnalysisError('not an analysis file')
+        version, header_size = struct.unpack('<II', data[4:12])
+        if version != ANALYSIS_VERSION:
+            raise ModuleAnalysis.InvalidAnalysisError('unsupported analysis version')
+        try:
+            header = json.loads(data[12:12 + header_size].decode('utf8'))
+            analysis = ModuleAnalysis(header['name'], base, header['size'], header['arch'])
+            offset = 12 + header_size
+            for (name, typecode), count in zip(ModuleAnalysis.ARRAYS, header['counts']):
+                values = array(typecode)
+                values.frombytes(data[offset:offset + count * values.itemsize])
+                offset += count * values.itemsize
+                setattr(analysis, name, values)
+            analysis.block_modes = bytearray(data[offset:offset + len(analysis.block_starts)])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ModuleAnalysis.InvalidAnalysisError(str(e))
+        if len(analysis.block_modes) != len(analysis.block_starts) or \
+                len(analysis.edge_index) != len(analysis.block_starts) + 1:
+            raise ModuleAnalysis.InvalidAnalysisError('truncated analysis file')
+        return analysis
+
+
+class ModuleAnalyzer(object):
+    """ recursive descent over the code of a loaded module
+
+        roots are the exports and symbols, the elf entry, init/fini and the
+        init arrays. every root is decoded linearly up to the first way out
+        (return, jump, undecodable bytes, code decoded already), branch and
+        call targets go back to the work list. on arm the thumb bit of the
+        root and blx #imm switch the capstone mode of the single handle, as
+        Emulator.hook_code does when the cpu mode changes.
+
+        the module is read once, state is a flag byte per module byte plus
+        flat arrays, so big libraries stay in a few times their size.
+        results are cached in ANALYSIS_PATH keyed by a hash of the module
+        file (checked against the mapped header) or of its code
+    """
+
+    class AnalysisError(Exception):
+        """ Raised when the module can't be read or decoded
+        """
+
+    # first decode window of a run, doubled while the run goes on
+    DECODE_WINDOW = 0x40
+    MAX_DECODE_WINDOW = 0x1000
+
+    def __init__(self, dwarf, module, path=ANALYSIS_PATH):
+        self._dwarf = dwarf
+        self.name = module['name']
+        self.base = int(module['base'], 16) if isinstance(module['base'], str) else module['base']
+        self.size = module['size']
+        self.file_path = module.get('path')
+        self.arch = dwarf.arch
+        self.path = path
+
+        # filled by read_image, spans are the executable (start, end) offsets
+        self.image = None
+        self.spans = []
+        self._flags = None
+        self._span_starts = []
+        self._work = array('Q')
+        self._leaders = array('Q')
+        self._functions = array('Q')
+        self._run_ends = array('Q')
+        self._edge_sources = array('Q')
+        self._edge_targets = array('Q')
+        self._edge_kinds = array('B')
+
+    def capstone(self):
+        """ (capstone handle, flow function) for the target arch
+        """
+        if self.arch == 'arm64':
+            return Cs(CS_ARCH_ARM64, CS_MODE_LITTLE_ENDIAN), flow_arm64
+        if self.arch == 'arm':
+            return Cs(CS_ARCH_ARM, CS_MODE_ARM), flow_arm
+        if self.arch == 'ia32':
+            return Cs(CS_ARCH_X86, CS_MODE_32), flow_x86
+        if self.arch == 'x64':
+            return Cs(CS_ARCH_X86, CS_MODE_64), flow_x86
+        raise ModuleAnalyzer.AnalysisError('unsupported arch ' + str(self.arch))
+
+    def module_ranges(self):
+        """ [(start offset, end offset, protection)] of the mapped ranges of the module
+        """
+        ranges = []
+        for _range in self._dwarf.memory_map.ranges:
+            start = int(_range['base'], 16)
+            end = start + _range['size']
+            if start < self.base + self.size and self.base < end:
+                ranges.append((max(start, self.base) - self.base,
+                               min(end, self.base + self.size) - self.base, _range['protection']))
+        if not ranges:
+            # no map yet, assume a single readable and executable blob
+            ranges.append((0, self.size, 'r-x'))
+        return ranges
+
+    def read_image(self, cancel=None, progress=None):
+        """ the mapped module, unreadable bytes zeroed. None when cancelled
+
+        :param progress: progress(done, total)
+        """
+        ranges = self.module_ranges()
+        self.spans = [(start, end) for start, end, protection in ranges if 'x' in protection]
+        self._span_starts = [start for start, _ in self.spans]
+        image = bytearray(self.size)
+        readable = [(start, end) for start, end, protection in ranges if 'r' in protection]
+        total = sum(end - start for start, end in readable)
+        done = 0
+        for start, end in readable:
+            result = self._dwarf.read_memory_ex(self.base + start, end - start, cancel=cancel)
+            if result.cancelled:
+                return None
+            image[start:end] = result.data
+            done += end - start
+            if progress is not None:
+                progress(done, total)
+        self.image = image
+        return image
+
+    def _file_key(self, header):
+        """ hash of the module file when it's the one mapped, else None
+        """
+        if not self.file_path or not os.path.isfile(self.file_path) or not header:
+            return None
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(('%s-%d-' % (self.arch, ANALYSIS_VERSION)).encode('utf8'))
+        try:
+            with open(self.file_path, 'rb') as f:
+                # an elf header isn't relocated, a different file shows up here
+                if f.read(len(header)) != header:
+                    return None
+                f.seek(0)
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return 'file-' + digest.hexdigest()
+
+    def _code_key(self):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(('%s-%d-%d-' % (self.arch, ANALYSIS_VERSION, self.size)).encode('utf8'))
+        view = memoryview(self.image)
+        for start, end in self.spans:
+            digest.update(struct.pack('<QQ', start, end))
+            digest.update(view[start:end])
+        view.release()
+        return 'code-' + digest.hexdigest()
+
+    def _cached(self, key):
+        path = os.path.join(self.path, key + '.bin')
+        if not os.path.exists(path):
+            return None
+        try:
+            return ModuleAnalysis.load(path, self.base)
+        except ModuleAnalysis.InvalidAnalysisError:
+            return None
+
+    def run(self, cancel=None, progress=None, status=None):
+        """ ModuleAnalysis of the module, from the cache when possible
+
+        :param progress: progress(done, total)
+        :param status: status(str)
+        :return: ModuleAnalysis or None when cancelled
+        """
+        cs, flow = self.capstone()
+
+        header = self._dwarf.read_memory(self.base, min(0x40, self.size))
+        key = self._file_key(header)
+        if key is not None:
+            analysis = self._cached(key)
+            if analysis is not None:
+                return analysis
+
+        if status is not None:
+            status('reading %s' % self.name)
+        if self.read_image(cancel=cancel, progress=progress) is None:
+            return None
+
+        if key is None:
+            key = self._code_key()
+            analysis = self._cached(key)
+            if analysis is not None:
+                return analysis
+
+        if status is not None:
+            status('analyzing %s' % self.name)
+        analysis = self._analyze(cs, flow, cancel=cancel, progress=progress)
+        if analysis is None:
+            return None
+        try:
+            analysis.save(os.path.join(self.path, key + '.bin'))
+        except OSError:
+            # a read only working dir costs the cache, not the results
+            pass
+        return analysis
+
+    def _span_end(self, offset):
+        """ end offset of the executable span holding offset, 0 if none
+        """
+        i = bisect.bisect_right(self._span_starts, offset) - 1
+        if i >= 0 and offset < self.spans[i][1]:
+            return self.spans[i][1]
+        return 0
+
+    def _pointer(self, value):
+        """ module offset of a code pointer or -1, relocated or not
+        """
+        if self.base <= value < self.base + self.size:
+            return value - self.base
+        return -1
+
+    def _roots(self):
+        """ [(offset, thumb)] the descent starts from
+        """
+        roots = []
+        thumb_bit = self.arch == 'arm'
+
+        found = self._dwarf.symbols.module_at(self.base)
+        if found is not None:
+            table = self._dwarf.symbols.table(*found)
+            if table is not None:
+                for address in table.addresses:
+                    roots.append((address - self.base, thumb_bit and address & 1))
+
+        if not ELF.is_valid_elf(self.image):
+            return roots
+        elf = ELF(self.image)
+        bias = elf.load_bias()
+
+        def offset_of(vaddr):
+            # link time address, unless the loader relocated it in place
+            if self.base <= vaddr < self.base + self.size:
+                return vaddr - self.base
+            return vaddr - bias
+
+        def add_vaddr(vaddr):
+            if vaddr:
+                roots.append((offset_of(vaddr), thumb_bit and vaddr & 1))
+
+        add_vaddr(elf.e_entry)
+        dynamic = elf.dynamic(self.image)
+        for tag in (DT_INIT, DT_FINI):
+            for vaddr in dynamic.get(tag, []):
+                add_vaddr(vaddr)
+
+        pointer_size = int(elf.bits / 8)
+        for tag, size_tag in ((DT_PREINIT_ARRAY, DT_PREINIT_ARRAYSZ), (DT_INIT_ARRAY, DT_INIT_ARRAYSZ),
+                              (DT_FINI_ARRAY, DT_FINI_ARRAYSZ)):
+            if tag not in dynamic or size_tag not in dynamic:
+                continue
+            # the entries are relocated, absolute addresses
+            start = offset_of(dynamic[tag][0])
+            for i in range(max(start, 0), start + dynamic[size_tag][0], pointer_size):
+                offset = self._pointer(int.from_bytes(self.image[i:i + pointer_size], 'little'))
+                if offset >= 0:
+                    roots.append((offset, thumb_bit and offset & 1))
+        return roots
+
+    def _push(self, offset, thumb, function=False):
+        if thumb:
+            offset &= ~1
+        if not self._span_end(offset):
+            return False
+        flags = self._flags
+        if function and not flags[offset] & _FUNCTION:
+            flags[offset] |= _FUNCTION
+            self._functions.append(offset)
+        if not flags[offset] & _LEADER:
+            flags[offset] |= _LEADER
+            self._leaders.append(offset)
+        if not flags[offset] & _INSN:
+            self._work.append(offset << 1 | (1 if thumb else 0))
+        return True
+
+    def _edge(self, source, target, kind):
+        self._edge_sources.append(source)
+        self._edge_targets.append(target)
+        self._edge_kinds.append(kind)
+
+    def _descend(self, cs, flow, offset, thumb):
+        """ decode a run from offset, bytes decoded
+        """
+        flags = self._flags
+        image = self.image
+        base = self.base
+        span_end = self._span_end(offset)
+        if flags[offset] & _INSN or not span_end:
+            return 0
+
+        if self.arch == 'arm':
+            # track arm <-> thumb switches like the emulator does
+            mode = CS_MODE_THUMB if thumb else CS_MODE_ARM
+            if cs.mode != mode:
+                cs.mode = mode
+        insn_flag = _INSN | (_THUMB if thumb else 0)
+
+        start = offset
+        window = ModuleAnalyzer.DECODE_WINDOW
+        while offset < span_end:
+            decoded = False
+            code = bytes(image[offset:min(offset + window, span_end)])
+            for address, size, mnemonic, op_str in cs.disasm_lite(code, base + offset):
+                decoded = True
+                if flags[offset] & _INSN:
+                    # reached code decoded before, fall into it
+                    if not flags[offset] & _LEADER:
+                        self._leaders.append(offset)
+                    flags[offset] |= _LEADER | _FALL_IN
+                    self._run_ends.append(offset)
+                    return offset - start
+                flags[offset] |= insn_flag
+                kind = flow(mnemonic, op_str)
+                source = offset
+                offset += size
+                if kind == FLOW_NONE:
+                    continue
+
+                target = immediate_target(op_str) if kind != FLOW_END else None
+                if target is not None:
+                    target -= base
+                    if kind in (FLOW_CALL, FLOW_CALL_SWITCH):
+                        switch = kind == FLOW_CALL_SWITCH
+                        if 0 <= target < self.size and self._push(target, thumb != switch, function=True):
+                            self._edge(source, target & ~1 if thumb != switch else target, EDGE_CALL)
+                    elif 0 <= target < self.size and self._push(target, thumb):
+                        self._edge(source, target, EDGE_JUMP)
+
+                if kind == FLOW_BRANCH:
+                    # the fall through starts a block of its own
+                    if offset < span_end and not flags[offset] & _LEADER:
+                        flags[offset] |= _LEADER
+                        self._leaders.append(offset)
+                elif kind in (FLOW_JUMP, FLOW_END):
+                    self._run_ends.append(offset)
+                    return offset - start
+            if not decoded:
+                break
+            window = min(window * 2, ModuleAnalyzer.MAX_DECODE_WINDOW)
+        # undecodable bytes or the end of the span
+        self._run_ends.append(offset)
+        return offset - start
+
+    def _analyze(self, cs, flow, cancel=None, progress=None):
+        self._flags = bytearray(self.size)
+        for offset, thumb in self._roots():
+            self._push(offset, thumb, function=True)
+
+        total = sum(end - start for start, end in self.spans)
+        done = 0
+        runs = 0
+        work = self._work
+        while work:
+            if cancel is not None and cancel.is_set():
+                return None
+            item = work.pop()
+            done += self._descend(cs, flow, item >> 1, item & 1 == 1)
+            runs += 1
+            if progress is not None and runs % 4096 == 0:
+                progress(min(done, total), total)
+
+        analysis = self._build()
+        if progress is not None:
+            progress(total, total)
+        return analysis
+
+    def _build(self):
+        flags = self._flags
+        analysis = ModuleAnalysis(self.name, self.base, self.size, self.arch)
+        analysis.functions = array('Q', sorted(offset for offset in self._functions if flags[offset] & _INSN))
+
+        leaders = array('Q', sorted(offset for offset in self._leaders if flags[offset] & _INSN))
+        run_ends = array('Q', sorted(self._run_ends))
+        starts = analysis.block_starts
+        ends = analysis.block_ends
+        falls = bytearray(len(leaders))
+        for i, leader in enumerate(leaders):
+            j = bisect.bisect_right(run_ends, leader)
+            run_end = run_ends[j] if j < len(run_ends) else self.size
+            following = leaders[i + 1] if i + 1 < len(leaders) else self.size
+            end = min(run_end, following)
+            starts.append(leader)
+            ends.append(end)
+            if end == following and (end < run_end or flags[end] & _FALL_IN):
+                falls[i] = 1
+        analysis.block_modes = bytearray(1 if flags[start] & _THUMB else 0 for start in starts)
+
+        # edges grouped by source block, counted first then placed
+        sources = array('I', (max(bisect.bisect_right(starts, source) - 1, 0) for source in self._edge_sources))
+        index = array('I', bytes(4 * (len(starts) + 1)))
+        for i in range(len(starts)):
+            index[i + 1] = falls[i]
+        for block in sources:
+            index[block + 1] += 1
+        for i in range(len(starts)):
+            index[i + 1] += index[i]
+
+        cursor = array('I', index)
+        targets = array('Q', bytes(8 * index[-1]))
+        kinds = array('B', bytes(index[-1]))
+        for i in range(len(starts)):
+            if falls[i]:
+                targets[cursor[i]] = ends[i]
+                kinds[cursor[i]] = EDGE_FALL
+                cursor[i] += 1
+        for block, target, kind in zip(sources, self._edge_targets, self._edge_kinds):
+            targets[cursor[block]] = target
+            kinds[cursor[block]] = kind
+            cursor[block] += 1
+
+        analysis.edge_index = index
+        analysis.edge_targets = targets
+        analysis.edge_kinds = kinds
+        return analysis
+
+
+class AnalysisThread(QThread):
+    """ runs a ModuleAnalyzer off the gui thread
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    onStatus = pyqtSignal(str, name='onStatus')
+    # ModuleAnalysis
+    onFinished = pyqtSignal(object, name='onFinished')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, analyzer, parent=None):
+        super().__init__(parent=parent)
+        self.analyzer = analyzer
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, done, total):
+        self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+    def run(self):
+        try:
+            analysis = self.analyzer.run(cancel=self._cancel, progress=self._on_progress,
+                                         status=self.onStatus.emit)
+        except (ModuleAnalyzer.AnalysisError, CsError) as e:
+            self.onError.emit(str(e))
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            # dwarf waits on a signal to allow another run on the module
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
+            return
+        if analysis is None:
+            self.onError.emit('cancelled')
+        else:
+            self.onFinished.emit(analysis)
@@ -231,11 +231,11 @@ class AndroidSession(Session):
             self._on_java_classes()
 
     def _on_proc_resume(self, tid=0):
+        self.dwarf.dwarf_api('release', tid)
+
         if tid == 0:
             self.dwarf.contexts.clear()
 
-        self.dwarf.dwarf_api('release', tid)
-
     def _on_proc_restart(self):
         self.dwarf.dwarf_api('restart')
         self._on_proc_resume()
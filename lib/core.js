@@ -37,6 +37,21 @@ var MEMORY_ACCESS_WRITE = 2;
 var MEMORY_ACCESS_EXECUTE = 4;
 var MEMORY_WATCH_SINGLESHOT = 8;
 
+// memory scans walk ranges in chunks of this size
+var SCAN_CHUNK_SIZE = 16 * 1024 * 1024;
+// max addresses in a memoryscan_batch frame
+var SCAN_BATCH_SIZE = 4096;
+// readValues reads this much around values close to each other
+var VALUE_READ_BLOCK = 64 * 1024;
+// pages read at once by pageHashes
+var PAGE_HASH_BLOCK = 256;
+// multi pattern scans read and walk this much per timer tick
+var MULTI_SCAN_CHUNK_SIZE = 1024 * 1024;
+// hits rescan the ranges at least this often (ms), new anonymous mappings aren't hooked
+var RANGES_RESCAN_INTERVAL = 1000;
+// the map changes are pushed to the host this often (ms) while nothing hits
+var RANGES_PUSH_INTERVAL = 250;
+
 function isDefined(value) {
     return (value !== undefined) && (value !== null) && (typeof value !== 'undefined');
 }
@@ -97,13 +112,13 @@ function Dwarf() {
                 var returnval = {'memory': {'operation': operation, 'address': address}};
                 if ((watcher.flags & MEMORY_ACCESS_READ) && (operation === 'read')) {
                     MemoryAccessMonitor.disable();
-                    loggedSend('watcher:::' + JSON.stringify(returnval) + ':::' + tid);
+                    loggedSend('watcher', returnval, null, tid);
                 } else if ((watcher.flags & MEMORY_ACCESS_WRITE) && (operation === 'write')) {
                     MemoryAccessMonitor.disable();
-                    loggedSend('watcher:::' + JSON.stringify(returnval) + ':::' + tid);
+                    loggedSend('watcher', returnval, null, tid);
                 } else if ((watcher.flags & MEMORY_ACCESS_EXECUTE) && (operation === 'execute')) {
                     MemoryAccessMonitor.disable();
-                    loggedSend('watcher:::' + JSON.stringify(returnval) + ':::' + tid);
+                    loggedSend('watcher', returnval, null, tid);
                 } else {
                     watcher = null;
                 }
@@ -163,19 +178,19 @@ function Dwarf() {
                         var operation = exception['memory']['operation'];
                         if ((watcher.flags & MEMORY_ACCESS_READ) && (operation === 'read')) {
                             watcher.restore();
-                            loggedSend('watcher:::' + JSON.stringify(exception) + ':::' + tid);
+                            loggedSend('watcher', exception, null, tid);
                         } else if ((watcher.flags & MEMORY_ACCESS_WRITE) && (operation === 'write')) {
                             watcher.restore();
-                            loggedSend('watcher:::' + JSON.stringify(exception) + ':::' + tid);
+                            loggedSend('watcher', exception, null, tid);
                         } else if ((watcher.flags & MEMORY_ACCESS_EXECUTE) && (operation === 'execute')) {
                             watcher.restore();
-                            loggedSend('watcher:::' + JSON.stringify(exception) + ':::' + tid);
+                            loggedSend('watcher', exception, null, tid);
                         } else {
                             watcher = null;
                         }
                     } else {
                         watcher.restore();
-                        loggedSend('watcher:::' + JSON.stringify(exception) + ':::' + tid);
+                        loggedSend('watcher', exception, null, tid);
                     }
                 } else {
                     watcher = null;
@@ -231,34 +246,91 @@ function Dwarf() {
     };
 
     this._loopApi = function (that) {
+        var tid = Process.getCurrentThreadId();
         if (DEBUG) {
-            _log('[' + Process.getCurrentThreadId() + '] looping api');
+            _log('[' + tid + '] looping api');
+        }
+
+        var hook_context = getDwarf().hook_contexts[tid];
+        if (typeof hook_context === 'undefined') {
+            return;
         }
-        var op = recv('' + Process.getCurrentThreadId(), function(payload) {});
-        op.wait();
 
-        var hook_context = getDwarf().hook_contexts[Process.getCurrentThreadId()];
+        // py side posts {type: tid, id, api, args} and waits for the api_result
+        // tagged with the same id. nothing polls, the thread just blocks in recv
+        while (true) {
+            var request = null;
+            recv('' + tid, function(payload) {
+                request = payload;
+            }).wait();
 
-        if (typeof hook_context !== 'undefined') {
-            while (hook_context.next_api === null) {
-                Thread.sleep(0.01);
+            if (request === null || typeof request['api'] === 'undefined') {
+                continue;
             }
 
             if (DEBUG) {
-                _log('[' + Process.getCurrentThreadId() + '] executing ' + hook_context.next_api[0]);
+                _log('[' + tid + '] executing ' + request['api'] + ' | request: ' + request['id']);
+            }
+
+            var args = request['args'];
+            if (typeof args === 'undefined' || args === null) {
+                args = [];
+            }
+
+            var result = null;
+            var error = null;
+            var released;
+            try {
+                if (request['api'] === 'apiBatch') {
+                    result = getDwarf()._apiBatch(that, args);
+                } else {
+                    result = api[request['api']].apply(that, args);
+                }
+            } catch (e) {
+                _log_err('loopApi ' + request['api'], e);
+                error = e.toString();
             }
 
-            hook_context.next_api_result = api[hook_context.next_api[0]].apply(that, hook_context.next_api[1]);
+            if (request['api'] === 'apiBatch') {
+                released = args.some(function(call) {
+                    return call[0] === 'release';
+                });
+            } else {
+                released = request['api'] === 'release';
+            }
 
-            if (hook_context.next_api[0] !== 'release') {
-                // invalidate
-                hook_context.next_api = null;
+            if (isDefined(result) && result.constructor.name === 'ArrayBuffer') {
+                loggedSend('api_result', {'id': request['id'], 'error': error, 'raw': true}, result, tid);
+            } else {
+                if (typeof result === 'undefined') {
+                    result = null;
+                }
+                loggedSend('api_result', {'id': request['id'], 'error': error, 'result': result}, null, tid);
+            }
 
-                getDwarf()._loopApi(that);
+            if (released) {
+                break;
             }
         }
     };
 
+    this._apiBatch = function(that, calls) {
+        var results = [];
+        for (var i = 0; i < calls.length; i++) {
+            var args = calls[i][1];
+            if (typeof args === 'undefined' || args === null) {
+                args = [];
+            }
+            try {
+                results.push(api[calls[i][0]].apply(that, args));
+            } catch (e) {
+                _log_err('apiBatch ' + calls[i][0], e);
+                results.push(null);
+            }
+        }
+        return results;
+    };
+
     this._onHook = function (reason, p, context, hook, java_handle) {
         if (DEBUG) {
             _log('[' + Process.getCurrentThreadId() + '] onHook ' + p + ' - reason: ' + reason);
@@ -355,76 +427,32 @@ function Dwarf() {
             "reason": reason
         };
 
-        var bt = null;
-
         if (ctx !== null) {
             if (DEBUG) {
                 _log('[' + tid + '] sendInfos - preparing infos for valid context');
             }
 
-            data['context'] = ctx;
+            // the host map must be current when the context lands. the map
+            // is only rescanned when something may have changed it
+            if (api._rangesChanged()) {
+                api._sendRangesDelta();
+            }
+
+            data['ptr'] = p;
             var pc = this.procedure_call_register;
             if (typeof ctx[pc] !== 'undefined') {
-                var symb;
-                try {
-                    symb = DebugSymbol.fromAddress(ctx[pc]);
-                } catch (e) {
-                    _log_err('_sendInfos', e);
-                }
-                if (symb === null || typeof symb === 'undefined') {
-                    symb = {};
-                }
-
-                if (DEBUG) {
-                    _log('[' + tid + '] sendInfos - preparing native backtrace');
-                }
-
-                bt = {'bt': api.nativeBacktrace(ctx), 'type': 'native'};
-                data['ptr'] = p;
-                data['is_java'] = false;
-                data['backtrace'] = bt;
-
-                var newCtx = {};
-                if (DEBUG) {
-                    _log('[' + tid + '] sendInfos - preparing context registers');
-                }
+                // registers only. backtrace, telescope and symbols are pulled by the
+                // host with contextDetails once something shows them
+                var regs = {};
                 for (var reg in ctx) {
-                    var val = ctx[reg];
-                    var isValidPtr = api.isValidPointer(val);
-                    var ts = null;
-                    if (isValidPtr) {
-                        ts = api.getAddressTs(val);
-                    }
-                    newCtx[reg] = {
-                        'value': val,
-                        'isValidPointer': isValidPtr,
-                        'telescope': ts
-                    };
-                    if (reg === pc) {
-                        newCtx[reg]['symbol'] = symb;
-                        try {
-                            var inst = Instruction.parse(p);
-                            newCtx[reg]['instruction'] = {
-                                'size': inst.size,
-                                'groups': inst.groups,
-                                'thumb': inst.groups.indexOf('thumb') >= 0 ||
-                                    inst.groups.indexOf('thumb2') >= 0
-                            };
-                        } catch (e) {
-                            _log_err('_sendInfos', e);
-                        }
-                    }
-                    data['context'] = newCtx;
+                    regs[reg] = ctx[reg];
                 }
+                data['is_java'] = false;
+                data['context'] = regs;
             } else {
                 // java hook
                 data['is_java'] = true;
-                data['ptr'] = p;
-                if (DEBUG) {
-                    _log('[' + tid + '] sendInfos - preparing java backtrace');
-                }
-                bt = {'bt': api.javaBacktrace(), 'type': 'java'};
-                data['backtrace'] = bt;
+                data['context'] = ctx;
             }
         } else if (ctx === null) {
             data['arch'] = Process.arch;
@@ -433,18 +461,22 @@ function Dwarf() {
             data['modules'] = Process.enumerateModulesSync();
             data['pid'] = Process.id;
             data['pointerSize'] = Process.pointerSize;
+            data['pageSize'] = Process.pageSize;
             data['ranges'] = Process.enumerateRangesSync('---');
+            api._setKnownRanges(data['ranges']);
         }
 
         if (DEBUG) {
             _log('[' + tid + '] sendInfos - dispatching infos');
         }
 
-        loggedSend('set_context:::' + JSON.stringify(data));
+        loggedSend('set_context', data, null, tid);
     };
 
     this.start = function () {
         Process.setExceptionHandler(getDwarf()._handleException);
+        api._watchRanges();
+        api._rangesPushTimer = setInterval(api._pushRanges, RANGES_PUSH_INTERVAL);
 
         // windows onload code
         if (Process.platform === 'windows') {
@@ -476,7 +508,7 @@ function Dwarf() {
                         for (var s in getDwarf().onLoads) {
                             if (w.indexOf(s) >= 0) {
                                 var hook = getDwarf().onLoads[s];
-                                loggedSend("onload_callback:::" + hook.module + ':::' + 0 + ':::' + Process.getCurrentThreadId());
+                                loggedSend('onload_callback', {'module': hook.module, 'base': 0});
                                 getDwarf()._onHook(REASON_HOOK, this.context.pc, this.context, hook, null);
                             }
                         }
@@ -490,7 +522,7 @@ function Dwarf() {
                         for (var s in getDwarf().onLoads) {
                             if (w.indexOf(s) >= 0) {
                                 var hook = getDwarf().onLoads[s];
-                                loggedSend("onload_callback:::" + hook.module + ':::' + 0 + ':::' + Process.getCurrentThreadId());
+                                loggedSend('onload_callback', {'module': hook.module, 'base': 0});
                                 getDwarf()._onHook(REASON_HOOK, this.context.pc, this.context, hook, null);
                             }
                         }
@@ -504,7 +536,7 @@ function Dwarf() {
                         for (var s in getDwarf().onLoads) {
                             if (w.indexOf(s) >= 0) {
                                 var hook = getDwarf().onLoads[s];
-                                loggedSend("onload_callback:::" + hook.module + ':::' + 0 + ':::' + Process.getCurrentThreadId());
+                                loggedSend('onload_callback', {'module': hook.module, 'base': 0});
                                 getDwarf()._onHook(REASON_HOOK, this.context.pc, this.context, hook, null);
                             }
                         }
@@ -518,7 +550,7 @@ function Dwarf() {
                         for (var s in getDwarf().onLoads) {
                             if (w.indexOf(s) >= 0) {
                                 var hook = getDwarf().onLoads[s];
-                                loggedSend("onload_callback:::" + hook.module + ':::' + 0 + ':::' + Process.getCurrentThreadId());
+                                loggedSend('onload_callback', {'module': hook.module, 'base': 0});
                                 getDwarf()._onHook(REASON_HOOK, this.context.pc, this.context, hook, null);
                             }
                         }
@@ -552,7 +584,7 @@ function Dwarf() {
 
                 wrappedInterceptor.attach(phdr_tgds_ptr, function (args) {
                     if (hook !== null) {
-                        loggedSend("onload_callback:::" + hook.module + ':::' + args[2] + ':::' + Process.getCurrentThreadId());
+                        loggedSend('onload_callback', {'module': hook.module, 'base': args[2]});
                         getDwarf()._onHook(REASON_HOOK, this.context.pc, this.context, hook, null);
                         hook = null;
                     }
@@ -581,6 +613,19 @@ function Dwarf() {
 
 function DwarfApi() {
     this._traced_tid = 0;
+    // running memoryScanStart scans by id
+    this._scans = {};
+    // base -> size, protection and file of the ranges the host knows about
+    this._knownRanges = null;
+    // page -> range, dropped when the map changes
+    this._rangeCache = {};
+    // the next context sends a delta
+    this._rangesDirty = true;
+    // u32 set by the map call hooks, native side
+    this._rangesDirtyFlag = null;
+    this._rangesWatchModule = null;
+    this._rangesScannedAt = 0;
+    this._rangesPushTimer = null;
 
     this._detach = function() {
         for (var h in getDwarf().hooks) {
@@ -590,34 +635,111 @@ function DwarfApi() {
             }
         }
         wrappedInterceptor.detachAll();
+        if (api._rangesPushTimer !== null) {
+            clearInterval(api._rangesPushTimer);
+            api._rangesPushTimer = null;
+        }
         api.release();
         // wait all contexts to be released
     };
 
+    this._patternLength = function(pattern) {
+        return pattern.split(' ').filter(function(token) {
+            return token.length > 0;
+        }).length;
+    };
+
     this._internalMemoryScan = function(start, size, pattern) {
-        if (size > 4096) {
-            // scan in chunks of 4096
-            var _start = parseInt(start);
-            var end = _start + size;
-            var result = [];
-            var _break = false;
-            while (true) {
-                var s = 4096;
-                if (_start + s > end) {
-                    s = end - _start;
-                    _break = true;
-                }
-                result = result.concat(Memory.scanSync(start, s, pattern));
-                if (_break || result.length >= 100) {
-                    break;
+        start = ptr(start);
+        var overlap = Math.max(api._patternLength(pattern) - 1, 0);
+        var result = [];
+        var offset = 0;
+        while (offset < size) {
+            var s = Math.min(SCAN_CHUNK_SIZE, size - offset);
+            // chunks overlap by pattern length - 1 so boundary matches aren't lost,
+            // a match is taken by the chunk it starts in
+            var matches = Memory.scanSync(start.add(offset), Math.min(s + overlap, size - offset), pattern);
+            var chunkEnd = start.add(offset + s);
+            for (var i = 0; i < matches.length; i++) {
+                if (matches[i].address.compare(chunkEnd) < 0) {
+                    result.push(matches[i]);
                 }
-                start = start.add(size);
-                _start += s;
             }
-            return result;
-        } else {
-            return Memory.scanSync(start, size, pattern);
+            offset += s;
+        }
+        return result;
+    };
+
+    this._scanBatch = function(scan, rangeIndex, matches) {
+        var raw = new ArrayBuffer(matches.length * 8);
+        var view = new DataView(raw);
+        for (var i = 0; i < matches.length; i++) {
+            view.setUint32(i * 8, matches[i].and(0xffffffff).toUInt32(), true);
+            view.setUint32(i * 8 + 4, matches[i].shr(32).and(0xffffffff).toUInt32(), true);
         }
+        loggedSend('memoryscan_batch', {'id': scan.id, 'range': rangeIndex}, raw);
+    };
+
+    this._scanNext = function(scan) {
+        if (scan.cancelled || scan.range >= scan.ranges.length) {
+            delete api._scans[scan.id];
+            loggedSend('memoryscan_complete', {
+                'id': scan.id, 'matches': scan.matches, 'scanned': scan.scanned, 'cancelled': scan.cancelled
+            });
+            return;
+        }
+
+        var range = scan.ranges[scan.range];
+        var size = range['size'];
+        var s = Math.min(SCAN_CHUNK_SIZE, size - scan.offset);
+        var start = ptr(range['base']).add(scan.offset);
+        var chunkEnd = start.add(s);
+        var pending = [];
+        var done = false;
+
+        var next = function() {
+            // onError may be followed by onComplete
+            if (done) {
+                return;
+            }
+            done = true;
+            if (pending.length > 0) {
+                api._scanBatch(scan, scan.range, pending);
+                pending = [];
+            }
+            scan.offset += s;
+            scan.scanned += s;
+            if (scan.offset >= size) {
+                loggedSend('memoryscan_progress', {
+                    'id': scan.id, 'range': scan.range, 'ranges': scan.ranges.length,
+                    'scanned': scan.scanned, 'total': scan.total
+                });
+                scan.range += 1;
+                scan.offset = 0;
+            }
+            api._scanNext(scan);
+        };
+
+        Memory.scan(start, Math.min(s + scan.overlap, size - scan.offset), scan.pattern, {
+            onMatch: function(address, matchSize) {
+                if (scan.cancelled) {
+                    return 'stop';
+                }
+                if (address.compare(chunkEnd) < 0) {
+                    pending.push(address);
+                    scan.matches += 1;
+                    if (pending.length >= SCAN_BATCH_SIZE) {
+                        api._scanBatch(scan, scan.range, pending);
+                        pending = [];
+                    }
+                }
+            },
+            onError: function(reason) {
+                // unreadable chunk, move on
+                next();
+            },
+            onComplete: next
+        });
     };
 
     this.addWatcher = function(pt, flags) {
@@ -635,7 +757,7 @@ function DwarfApi() {
                 }
                 getDwarf().memory_watchers[pt] = new MemoryWatcher(pt, range.protection, flags);
                 getDwarf().memory_addresses.push({ 'base': pt, 'size': 1 });
-                loggedSend('watcher_added:::' + pt + ':::' + flags);
+                loggedSend('watcher_added', {'ptr': pt, 'flags': flags});
             }
             MemoryAccessMonitor.enable(getDwarf().memory_addresses, { onAccess: getDwarf()._onMemoryAccess });
             return;
@@ -647,7 +769,7 @@ function DwarfApi() {
                 return;
             }
             getDwarf().memory_watchers[pt] = new MemoryWatcher(pt, range.protection, flags);
-            loggedSend('watcher_added:::' + pt + ':::' + flags);
+            loggedSend('watcher_added', {'ptr': pt, 'flags': flags});
         }
         getDwarf().memory_watchers[pt].watch();
     };
@@ -669,15 +791,15 @@ function DwarfApi() {
         if (hook.interceptor !== null) {
             hook.interceptor.detach();
             delete getDwarf().hooks[key];
-            loggedSend('hook_deleted:::native:::' + key);
+            loggedSend('hook_deleted', {'type': 'native', 'key': key});
         } else if (hook.javaClassMethod !== null) {
             api.hookJavaConstructor(hook.javaClassMethod, null, true);
             api.hookJavaMethod(hook.javaClassMethod, null, true);
             delete getDwarf().hooks[key];
-            loggedSend('hook_deleted:::java:::' + key);
+            loggedSend('hook_deleted', {'type': 'java', 'key': key});
         } else if (hook.module !== null) {
             delete getDwarf().onLoads[hook.module];
-            loggedSend('hook_deleted:::onload:::' + hook.module);
+            loggedSend('hook_deleted', {'type': 'onload', 'key': hook.module});
         }
     };
 
@@ -695,19 +817,19 @@ function DwarfApi() {
 
     this.enumerateJavaClasses = function() {
         Java.performNow(function() {
-            loggedSend('enumerate_java_classes_start:::');
+            loggedSend('enumerate_java_classes_start');
             try {
                 Java.enumerateLoadedClasses({
                     onMatch: function(className) {
-                        send('enumerate_java_classes_match:::' + className);
+                        loggedSend('enumerate_java_classes_match', className);
                     },
                     onComplete: function() {
-                        send('enumerate_java_classes_complete:::');
+                        loggedSend('enumerate_java_classes_complete');
                     }
                 });
             } catch(e) {
                 _log_err('enumerateJavaClasses', e);
-                loggedSend('enumerate_java_classes_complete:::');
+                loggedSend('enumerate_java_classes_complete');
             }
         });
     };
@@ -726,8 +848,7 @@ function DwarfApi() {
                         "TOKEN").match(/\sTOKEN(.*)\(/)[1]);
                 });
                 var result = getDwarf().uniqueBy(parsedMethods, JSON.stringify);
-                loggedSend('enumerate_java_methods_complete:::' + className + ':::' +
-                    JSON.stringify(result));
+                loggedSend('enumerate_java_methods_complete', {'className': className, 'methods': result});
             });
         }
     };
@@ -819,6 +940,152 @@ function DwarfApi() {
         return [2, w];
     };
 
+    this._findRangeCached = function(pt, cache) {
+        // ranges found stay cached until the map changes, misses only for this call
+        var page = pt.and(ptr(Process.pageSize - 1).not()).toString();
+        if (typeof api._rangeCache[page] !== 'undefined') {
+            return api._rangeCache[page];
+        }
+        if (typeof cache[page] !== 'undefined') {
+            return cache[page];
+        }
+        var range = null;
+        try {
+            range = Process.findRangeByAddress(pt);
+        } catch (e) {
+            range = null;
+        }
+        if (range === null || typeof range === 'undefined') {
+            cache[page] = null;
+            return null;
+        }
+        api._rangeCache[page] = range;
+        return range;
+    };
+
+    this._isPrintableString = function(str) {
+        for (var i = 0; i < str.length; i++) {
+            var c = str.charCodeAt(i);
+            if ((c < 0x20 && c !== 0x09 && c !== 0x0a && c !== 0x0d) || (c >= 0x7f && c < 0xa0)) {
+                return false;
+            }
+        }
+        return true;
+    };
+
+    this._telescopeEntry = function(pt, cache) {
+        // [0, string], [1, pointer], [2, value] or [-1, ''] as getAddressTs
+        var range = api._findRangeCached(pt, cache);
+        if (range === null || range.protection.indexOf('r') < 0) {
+            return [-1, ''];
+        }
+        var w;
+        try {
+            w = pt.readPointer();
+        } catch (e) {
+            return [-1, ''];
+        }
+        try {
+            var s = pt.readUtf8String();
+            if (s !== null && s.length > 1 && api._isPrintableString(s)) {
+                return [0, s];
+            }
+        } catch (e) {}
+        if (api._findRangeCached(w, cache) !== null) {
+            return [1, w];
+        }
+        return [2, w];
+    };
+
+    this._telescope = function(addresses, depth, cache) {
+        var result = [];
+        for (var i = 0; i < addresses.length; i++) {
+            var chain = [];
+            var pt;
+            try {
+                pt = ptr(addresses[i]);
+            } catch (e) {
+                result.push([[-1, '']]);
+                continue;
+            }
+            for (var level = 0; level < depth; level++) {
+                var entry = api._telescopeEntry(pt, cache);
+                chain.push(entry);
+                if (entry[0] !== 1) {
+                    break;
+                }
+                pt = entry[1];
+            }
+            result.push(chain);
+        }
+        return result;
+    };
+
+    this.telescope = function(addresses, depth) {
+        // for every address the chain of [type, value] entries, following pointers up to depth
+        if (!isNumber(depth) || depth < 1) {
+            depth = 1;
+        }
+        return api._telescope(addresses, depth, {});
+    };
+
+    this.contextDetails = function(tid) {
+        // what the hit message leaves out: backtrace and, for native contexts,
+        // registers with telescope, pc symbol and instruction
+        var hc = getDwarf().hook_contexts[tid];
+        if (typeof hc === 'undefined' || hc === null) {
+            return null;
+        }
+        var ctx = hc.context;
+        var pc = getDwarf().procedure_call_register;
+        if (ctx === null || typeof ctx[pc] === 'undefined') {
+            return {'backtrace': {'bt': api.javaBacktrace(), 'type': 'java'}};
+        }
+
+        // all the registers share the range lookups
+        var regs = [];
+        var values = [];
+        for (var reg in ctx) {
+            regs.push(reg);
+            values.push(ctx[reg]);
+        }
+        var rangeCache = {};
+        var telescope = api._telescope(values, 1, rangeCache);
+        var context = {};
+        for (var r = 0; r < regs.length; r++) {
+            var isValidPtr = api._findRangeCached(ptr(values[r]), rangeCache) !== null;
+            context[regs[r]] = {
+                'value': values[r],
+                'isValidPointer': isValidPtr,
+                'telescope': isValidPtr ? telescope[r][0] : null
+            };
+        }
+
+        var symb = null;
+        try {
+            symb = DebugSymbol.fromAddress(ctx[pc]);
+        } catch (e) {
+            _log_err('contextDetails', e);
+        }
+        context[pc]['symbol'] = symb === null ? {} : symb;
+        try {
+            var inst = Instruction.parse(ctx[pc]);
+            context[pc]['instruction'] = {
+                'size': inst.size,
+                'groups': inst.groups,
+                'thumb': inst.groups.indexOf('thumb') >= 0 ||
+                    inst.groups.indexOf('thumb2') >= 0
+            };
+        } catch (e) {
+            _log_err('contextDetails', e);
+        }
+
+        return {
+            'context': context,
+            'backtrace': {'bt': api.nativeBacktrace(ctx), 'type': 'native'}
+        };
+    };
+
     this.getInstruction = function(address) {
         try {
             var instruction = Instruction.parse(ptr(address));
@@ -931,7 +1198,7 @@ function DwarfApi() {
                 hook.logic = logic;
             }
             getDwarf().onLoads[m] = hook;
-            loggedSend('hook_onload_callback:::' + m);
+            loggedSend('hook_onload_callback', m);
         }
     };
 
@@ -1135,7 +1402,7 @@ function DwarfApi() {
     };
 
     this.log = function(what) {
-        loggedSend('log:::' + what);
+        loggedSend('log', '' + what);
     };
 
     this.nativeBacktrace = function(ctx) {
@@ -1150,7 +1417,7 @@ function DwarfApi() {
         } catch (e) {
             _log_err('memoryScan', e);
         }
-        loggedSend('memoryscan_result:::' + JSON.stringify(result));
+        loggedSend('memoryscan_result', result);
     };
 
     this.memoryScanList = function(ranges, pattern) {
@@ -1166,7 +1433,159 @@ function DwarfApi() {
                 break;
             }
         }
-        loggedSend('memoryscan_result:::' + JSON.stringify(result));
+        loggedSend('memoryscan_result', result);
+    };
+
+    /**
+     * async scan of many ranges, results are streamed back as 'memoryscan_batch'
+     * frames (raw u64 addresses), 'memoryscan_progress' once per range and a final
+     * 'memoryscan_complete'. ranges is a list of {base, size} or null to scan
+     * every readable range
+     */
+    this.memoryScanStart = function(scanId, ranges, pattern) {
+        if (!isDefined(ranges)) {
+            ranges = Process.enumerateRangesSync('r--');
+        }
+        var scan = {
+            'id': scanId,
+            'ranges': ranges,
+            'pattern': pattern,
+            'overlap': Math.max(api._patternLength(pattern) - 1, 0),
+            'range': 0,
+            'offset': 0,
+            'scanned': 0,
+            'total': 0,
+            'matches': 0,
+            'cancelled': false
+        };
+        for (var i = 0; i < ranges.length; i++) {
+            scan.total += ranges[i]['size'];
+        }
+        api._scans[scanId] = scan;
+        api._scanNext(scan);
+        return ranges.length;
+    };
+
+    this._scanMultiBatch = function(scan, rangeIndex, matches, needles) {
+        var raw = new ArrayBuffer(matches.length * 12);
+        var view = new DataView(raw);
+        for (var i = 0; i < matches.length; i++) {
+            view.setUint32(i * 12, matches[i].and(0xffffffff).toUInt32(), true);
+            view.setUint32(i * 12 + 4, matches[i].shr(32).and(0xffffffff).toUInt32(), true);
+            view.setUint32(i * 12 + 8, needles[i], true);
+        }
+        loggedSend('memoryscan_batch', {'id': scan.id, 'range': rangeIndex, 'needles': true}, raw);
+    };
+
+    this._multiScanChunk = function(scan, start, size, onHit) {
+        var data = null;
+        try {
+            data = new Uint8Array(Memory.readByteArray(start, size));
+        } catch (e) {
+            data = null;
+        }
+        if (data !== null) {
+            scan.state = scan.scanner.scan(data, start, scan.state, onHit);
+            return;
+        }
+        if (size <= Process.pageSize) {
+            // unreadable, restart the automaton after the hole
+            scan.state = 0;
+            return;
+        }
+        for (var offset = 0; offset < size; offset += Process.pageSize) {
+            api._multiScanChunk(scan, start.add(offset), Math.min(Process.pageSize, size - offset), onHit);
+        }
+    };
+
+    this._multiScanNext = function(scan) {
+        if (scan.cancelled || scan.range >= scan.ranges.length) {
+            delete api._scans[scan.id];
+            loggedSend('memoryscan_complete', {
+                'id': scan.id, 'matches': scan.matches, 'scanned': scan.scanned, 'cancelled': scan.cancelled,
+                'counts': scan.counts
+            });
+            return;
+        }
+
+        var range = scan.ranges[scan.range];
+        var size = range['size'];
+        var s = Math.min(MULTI_SCAN_CHUNK_SIZE, size - scan.offset);
+        var matches = [];
+        var needles = [];
+
+        api._multiScanChunk(scan, ptr(range['base']).add(scan.offset), s, function(address, needle) {
+            matches.push(address);
+            needles.push(needle);
+            scan.counts[needle] += 1;
+            scan.matches += 1;
+            if (matches.length >= SCAN_BATCH_SIZE) {
+                api._scanMultiBatch(scan, scan.range, matches, needles);
+                matches = [];
+                needles = [];
+            }
+        });
+        if (matches.length > 0) {
+            api._scanMultiBatch(scan, scan.range, matches, needles);
+        }
+
+        scan.offset += s;
+        scan.scanned += s;
+        if (scan.offset >= size) {
+            loggedSend('memoryscan_progress', {
+                'id': scan.id, 'range': scan.range, 'ranges': scan.ranges.length,
+                'scanned': scan.scanned, 'total': scan.total
+            });
+            scan.range += 1;
+            scan.offset = 0;
+            scan.state = 0;
+        }
+        // yield so cancel and other api calls get through
+        setTimeout(function() {
+            api._multiScanNext(scan);
+        }, 0);
+    };
+
+    /**
+     * like memoryScanStart but looking for many needles in a single pass,
+     * needles is a list of {bytes, mask} where mask holds the bits that must match.
+     * batches carry the needle index of every hit and the completion the
+     * per needle counts
+     */
+    this.memoryScanMultiStart = function(scanId, ranges, needles) {
+        if (!isDefined(ranges)) {
+            ranges = Process.enumerateRangesSync('r--');
+        }
+        var scan = {
+            'id': scanId,
+            'ranges': ranges,
+            'scanner': new MultiPatternScanner(needles),
+            'state': 0,
+            'range': 0,
+            'offset': 0,
+            'scanned': 0,
+            'total': 0,
+            'matches': 0,
+            'counts': needles.map(function() { return 0; }),
+            'cancelled': false
+        };
+        for (var i = 0; i < ranges.length; i++) {
+            scan.total += ranges[i]['size'];
+        }
+        api._scans[scanId] = scan;
+        setTimeout(function() {
+            api._multiScanNext(scan);
+        }, 0);
+        return ranges.length;
+    };
+
+    this.memoryScanCancel = function(scanId) {
+        var scan = api._scans[scanId];
+        if (isDefined(scan)) {
+            scan.cancelled = true;
+            return true;
+        }
+        return false;
     };
 
     this.isPrintable = function (char) {
@@ -1250,6 +1669,88 @@ function DwarfApi() {
         }
     };
 
+    /**
+     * read size bytes at base + every offset, offsets sorted ascending.
+     * nearby values share a single read. returns offsets.length * size bytes
+     * followed by one readable flag (0/1) per offset
+     */
+    this.readValues = function(base, offsets, size) {
+        base = ptr(base);
+        var out = new Uint8Array(offsets.length * (size + 1));
+        var flags = offsets.length * size;
+        var block = null;
+        var blockStart = 0;
+        for (var i = 0; i < offsets.length; i++) {
+            var offset = offsets[i];
+            if (block === null || offset < blockStart || offset + size > blockStart + block.length) {
+                block = null;
+                var address = base.add(offset);
+                // up to a block, down to the value alone when we hit unmapped pages
+                var pageLeft = Process.pageSize - address.and(Process.pageSize - 1).toInt32();
+                var lengths = [VALUE_READ_BLOCK, Math.max(pageLeft, size), size];
+                for (var l = 0; l < lengths.length && block === null; l++) {
+                    try {
+                        block = new Uint8Array(Memory.readByteArray(address, lengths[l]));
+                        blockStart = offset;
+                    } catch (e) {
+                        block = null;
+                    }
+                }
+                if (block === null) {
+                    continue;
+                }
+            }
+            out.set(block.subarray(offset - blockStart, offset - blockStart + size), i * size);
+            out[flags + i] = 1;
+        }
+        return out.buffer;
+    };
+
+    /**
+     * two 32 bit hashes of every page in [base, base + size), base page aligned.
+     * returns pages * 8 bytes followed by one readable flag (0/1) per page
+     */
+    this.pageHashes = function(base, size) {
+        base = ptr(base);
+        var pageSize = Process.pageSize;
+        var pages = Math.ceil(size / pageSize);
+        var out = new ArrayBuffer(pages * 9);
+        var hashes = new DataView(out);
+        var flags = new Uint8Array(out, pages * 8);
+        for (var start = 0; start < pages; start += PAGE_HASH_BLOCK) {
+            var count = Math.min(PAGE_HASH_BLOCK, pages - start);
+            var block = null;
+            try {
+                block = Memory.readByteArray(base.add(start * pageSize), count * pageSize);
+            } catch (e) {
+                block = null;
+            }
+            for (var p = 0; p < count; p++) {
+                var words = null;
+                if (block !== null) {
+                    words = new Uint32Array(block, p * pageSize, pageSize / 4);
+                } else {
+                    // something in the block is unmapped, go page by page
+                    try {
+                        words = new Uint32Array(Memory.readByteArray(base.add((start + p) * pageSize), pageSize));
+                    } catch (e) {
+                        continue;
+                    }
+                }
+                var h1 = 0x811c9dc5;
+                var h2 = 0x5bd1e995;
+                for (var i = 0; i < words.length; i++) {
+                    h1 = Math.imul(h1 ^ words[i], 0x01000193);
+                    h2 = Math.imul(h2 + words[i], 0x5bd1e995) ^ (h2 >>> 15);
+                }
+                hashes.setUint32((start + p) * 8, h1 >>> 0, true);
+                hashes.setUint32((start + p) * 8 + 4, h2 >>> 0, true);
+                flags[start + p] = 1;
+            }
+        }
+        return out;
+    };
+
     this.readPointer = function(pt) {
         try {
             return Memory.readPointer(ptr(pt));
@@ -1264,13 +1765,13 @@ function DwarfApi() {
             for (var t in getDwarf().hook_contexts) {
                 tid = getDwarf().hook_contexts[t].tid;
                 console.log('resuming := ' + tid);
-                loggedSend('release:::' + tid)
+                loggedSend('release', null, null, tid);
             }
         } else {
             var hc = getDwarf().hook_contexts[tid];
             if (typeof hc !== 'undefined') {
                 console.log('resuming := ' + hc.tid);
-                loggedSend('release:::' + hc.tid)
+                loggedSend('release', null, null, hc.tid);
             }
         }
     };
@@ -1279,14 +1780,14 @@ function DwarfApi() {
         if (!getDwarf().proc_resumed) {
             getDwarf().proc_resumed = true;
             console.log('Resuming process...');
-            loggedSend('resume:::0');
+            loggedSend('resume');
         } else {
             console.log('Error: Process already resumed');
         }
     }
 
     this.releaseFromJs = function (tid) {
-        send('release_js:::' + tid);
+        loggedSend('release_js', null, null, tid);
     };
 
     this.removeWatcher = function(pt) {
@@ -1301,7 +1802,7 @@ function DwarfApi() {
                 });
             }
             delete getDwarf().memory_watchers[pt];
-            loggedSend('watcher_removed:::' + pt);
+            loggedSend('watcher_removed', pt);
             return true;
         }
         return false;
@@ -1335,12 +1836,12 @@ function DwarfApi() {
         }
 
         if (data.constructor.name === 'ArrayBuffer') {
-            loggedSend('set_data:::' + key, data)
+            loggedSend('set_data', {'key': key}, data);
         } else {
             if (data.constructor.name === 'Object') {
                 data = JSON.stringify(data,null,4);
             }
-            loggedSend('set_data:::' + key + ':::' + data)
+            loggedSend('set_data', {'key': key, 'data': '' + data});
         }
     };
 
@@ -1417,7 +1918,7 @@ function DwarfApi() {
                 },
 
                 onReceive: function(events) {
-                    loggedSend('tracer:::' + Stalker.parse(events, {
+                    loggedSend('tracer', Stalker.parse(events, {
                         annotate: true,
                         stringify: true
                     }));
@@ -1448,24 +1949,143 @@ function DwarfApi() {
     };
 
     this.updateModules = function() {
-        loggedSend('update_modules:::' + Process.getCurrentThreadId() + ':::' +
-            JSON.stringify(Process.enumerateModulesSync()))
+        loggedSend('update_modules', Process.enumerateModulesSync());
     };
 
     this.updateRanges = function() {
         try {
-            loggedSend('update_ranges:::' + Process.getCurrentThreadId() + ':::' +
-                JSON.stringify(Process.enumerateRangesSync('---')))
+            api._rangesScanned();
+            var ranges = Process.enumerateRangesSync('---');
+            api._setKnownRanges(ranges);
+            loggedSend('update_ranges', ranges);
         } catch (e) {
             _log_err('updateRanges', e);
         }
     };
 
+    this._rangeKey = function(range) {
+        var key = range.size + ':' + range.protection;
+        if (isDefined(range.file)) {
+            key += ':' + range.file.path + ':' + range.file.offset;
+        }
+        return key;
+    };
+
+    this._setKnownRanges = function(ranges) {
+        api._rangeCache = {};
+        api._knownRanges = {};
+        for (var i = 0; i < ranges.length; i++) {
+            api._knownRanges[ranges[i].base.toString()] = api._rangeKey(ranges[i]);
+        }
+    };
+
+    this._watchRanges = function() {
+        // the hooks only set a flag from native code. mmap and VirtualAlloc
+        // are left alone: the js heap grows through them and hooking them
+        // deadlocks the agent, new mappings are picked up by the timed rescan.
+        // module loads protect their relro/sections, so they are seen anyway
+        if (typeof CModule === 'undefined') {
+            return;
+        }
+        var names;
+        if (Process.platform === 'windows') {
+            names = ['VirtualFree', 'VirtualFreeEx', 'VirtualProtect', 'VirtualProtectEx', 'UnmapViewOfFile'];
+        } else {
+            names = ['munmap', 'mremap', 'mprotect'];
+        }
+        var flag = Memory.alloc(4);
+        var cm;
+        try {
+            cm = new CModule('extern volatile int ranges_dirty;\n' +
+                'void on_leave (void * ic) { ranges_dirty = 1; }\n', {'ranges_dirty': flag});
+        } catch (e) {
+            // no compiler in this runtime, _log_err isn't usable this early
+            return;
+        }
+        for (var i = 0; i < names.length; i++) {
+            var p = api.findExport(names[i]);
+            if (p === null || p.isNull()) {
+                continue;
+            }
+            try {
+                wrappedInterceptor.attach(p, {'onLeave': cm.on_leave});
+            } catch (e) {
+            }
+        }
+        api._rangesDirtyFlag = flag;
+        api._rangesWatchModule = cm;
+    };
+
+    this._pushRanges = function() {
+        // keeps the host map current when no hook hits. nothing is sent before
+        // the host got the full map with the first infos
+        if (api._knownRanges === null || !api._rangesChanged()) {
+            return;
+        }
+        api._sendRangesDelta();
+    };
+
+    this._rangesChanged = function() {
+        if (api._rangesDirty || Date.now() - api._rangesScannedAt >= RANGES_RESCAN_INTERVAL) {
+            return true;
+        }
+        return api._rangesDirtyFlag !== null && api._rangesDirtyFlag.readU32() !== 0;
+    };
+
+    this._rangesScanned = function() {
+        // cleared before the scan, a map call racing with it dirties again
+        api._rangesDirty = false;
+        api._rangesScannedAt = Date.now();
+        if (api._rangesDirtyFlag !== null) {
+            api._rangesDirtyFlag.writeU32(0);
+        }
+    };
+
+    this._sendRangesDelta = function() {
+        // only what changed since the host got the map: changed ranges are
+        // removed by base and added back
+        try {
+            api._rangesScanned();
+            if (api._knownRanges === null) {
+                api.updateRanges();
+                return;
+            }
+            var ranges = Process.enumerateRangesSync('---');
+            var seen = {};
+            var added = [];
+            var removed = [];
+            for (var i = 0; i < ranges.length; i++) {
+                var base = ranges[i].base.toString();
+                seen[base] = true;
+                var known = api._knownRanges[base];
+                if (known !== api._rangeKey(ranges[i])) {
+                    if (isDefined(known)) {
+                        removed.push(base);
+                    }
+                    added.push(ranges[i]);
+                }
+            }
+            for (var knownBase in api._knownRanges) {
+                if (!seen[knownBase]) {
+                    removed.push(knownBase);
+                }
+            }
+            if (added.length > 0 || removed.length > 0) {
+                api._setKnownRanges(ranges);
+                loggedSend('ranges_delta', {'added': added, 'removed': removed});
+            }
+        } catch (e) {
+            _log_err('_sendRangesDelta', e);
+        }
+    };
+
     this.writeBytes = function(pt, what) {
         try {
             pt = ptr(pt);
 
             Memory.protect(pt, what.length, 'rwx');
+            // frida protects without going through the hooked calls
+            api._rangesDirty = true;
 
             if (typeof what === 'string') {
                 api.writeUtf8(pt, fromHexString());
@@ -1667,7 +2287,7 @@ function DwarfKernel() {
             var len = fs.allocateRw(Process.pointerSize);
             var read;
             while ((read = fs.getline(buf, len, f)) !== -1) {
-                loggedSend("ftrace:::" + Memory.readUtf8String(Memory.readPointer(buf)));
+                loggedSend('ftrace', Memory.readUtf8String(Memory.readPointer(buf)));
             }
             fs.fclose(f);
         };
@@ -1817,7 +2437,7 @@ function DwarfKernel() {
 
     this.enable = function() {
         if (this.available(true)) {
-            loggedSend('enable_kernel:::')
+            loggedSend('enable_kernel');
         } else {
             console.log('dwarf module not loaded');
         }
@@ -1854,26 +2474,26 @@ function DwarfKernel() {
 
 function Emulator() {
     this.clean = function() {
-        loggedSend('emulator:::clean')
+        loggedSend('emulator', ['clean']);
     };
 
     this.setup = function(tid) {
         if (typeof tid !== 'number') {
             tid = Process.getCurrentThreadId();
         }
-        loggedSend('emulator:::setup:::' + tid);
+        loggedSend('emulator', ['setup', tid]);
     };
 
     this.start = function(until) {
-        loggedSend('emulator:::start:::' + until)
+        loggedSend('emulator', ['start', '' + until]);
     };
 
     this.step = function() {
-        loggedSend('emulator:::start:::0')
+        loggedSend('emulator', ['start', '0']);
     };
 
     this.stop = function() {
-        loggedSend('emulator:::stop')
+        loggedSend('emulator', ['stop']);
     };
 }
 
@@ -1894,9 +2514,6 @@ function HookContext(tid) {
     this.hold_context = true;
     this.context = null;
     this.java_handle = null;
-
-    this.next_api = null;
-    this.next_api_result = 'dwarf_handler';
 }
 
 function JavaHelper() {
@@ -1944,7 +2561,7 @@ function JavaHelper() {
                 var hook;
                 if (!restore) {
                     if (!internal) {
-                        loggedSend('hook_java_callback:::' + classMethod);
+                        loggedSend('hook_java_callback', classMethod);
                     }
                     hook = new Hook();
                     hook.javaClassMethod = classMethod;
@@ -2078,7 +2695,7 @@ function JavaHelper() {
     this.traceImplementation = function(className, method) {
         return function() {
             var classMethod = className + '.' + method;
-            loggedSend('java_trace:::enter:::' + classMethod + ':::' + JSON.stringify(arguments));
+            loggedSend('java_trace', {'event': 'enter', 'method': classMethod, 'data': JSON.stringify(arguments)});
             var ret = this[method].apply(this, arguments);
             var traceRet = ret;
             if (typeof traceRet === 'object') {
@@ -2086,7 +2703,7 @@ function JavaHelper() {
             } else if (typeof traceRet === 'undefined') {
                 traceRet = "";
             }
-            loggedSend('java_trace:::leave:::' + classMethod + ':::' + traceRet);
+            loggedSend('java_trace', {'event': 'leave', 'method': classMethod, 'data': '' + traceRet});
             return ret;
         }
     }
@@ -2127,6 +2744,15 @@ function MemoryWatcher(address, perm, flags) {
     };
 }
 
+// apis for paused threads are delivered by message to their _loopApi,
+// everything reaching rpc runs right here
+var _dispatchApi = function(that, tid, api_funct, args) {
+    if (api_funct === 'apiBatch') {
+        return getDwarf()._apiBatch(that, args);
+    }
+    return api[api_funct].apply(that, args);
+};
+
 rpc.exports = {
     api: function(tid, api_funct, args) {
         if (DEBUG) {
@@ -2137,32 +2763,14 @@ rpc.exports = {
             args = [];
         }
 
-        if (Object.keys(getDwarf().hook_contexts).length > 0) {
-            var hc = getDwarf().hook_contexts[tid];
-            if (typeof hc !== 'undefined') {
-
-                // wait for other apis to return
-                while (hc.next_api !== null) {
-                    Thread.sleep(.5);
-                }
-
-                hc.next_api = [api_funct, args];
-                if (DEBUG) {
-                    _log('[' + tid + '] RPC-API: ' + api_funct + ' waiting for api result');
-                }
-                while (hc.next_api_result === 'dwarf_handler') {
-                    Thread.sleep(0.01);
-                }
-                var ret = hc.next_api_result;
-                if (DEBUG) {
-                    _log('[' + tid + '] RPC-API: ' + api_funct + ' api result: ' + ret);
-                }
-                hc.next_api_result = 'dwarf_handler';
-                return ret;
-            }
+        return _dispatchApi(this, tid, api_funct, args);
+    },
+    apiBatch: function(tid, calls) {
+        if (DEBUG) {
+            _log('[' + tid + '] RPC-API: batch of ' + calls.length);
         }
 
-        return api[api_funct].apply(this, args)
+        return _dispatchApi(this, tid, 'apiBatch', calls);
     },
     debug: function(debug) {
         DEBUG = debug;
@@ -2272,11 +2880,11 @@ var InterceptorWrapper = function() {
             if (!(pt instanceof Hook)) {
                 try {
                     getDwarf().hooks[dethumbedPtr] = hook;
-                    loggedSend('hook_native_callback:::' +
-                        getDwarf()._dethumbify(hook.nativePtr) + ':::' +
-                        getDwarf()._ba2hex(bytes) + ':::' +
-                        _logic + ':::' + hook.condition
-                    );
+                    loggedSend('hook_native_callback', {
+                        'ptr': getDwarf()._dethumbify(hook.nativePtr),
+                        'logic': _logic,
+                        'condition': hook.condition
+                    }, bytes);
                 } catch(e) {
                     _log_err('InterceptorWrapper.attach', e);
                 }
@@ -2287,8 +2895,9 @@ var InterceptorWrapper = function() {
             return false;
         }
     };
-    this._attach = function(pt, cb) {
-        return wrappedInterceptor._attach(pt, cb);
+    this._attach = function(pt, cb, data) {
+        // newer frida attach through here with the data argument
+        return wrappedInterceptor._attach.apply(wrappedInterceptor, arguments);
     };
     this.detachAll = function() {
         for (var hook in getDwarf().hooks) {
@@ -2379,16 +2988,300 @@ var ThreadWrapper = function() {
         wrappedThread.sleep(delay);
     };
 
+    this._backtrace = function() {
+        // newer frida backtrace through Thread._backtrace
+        return wrappedThread._backtrace.apply(wrappedThread, arguments);
+    };
+
     this._init();
 };
 Thread = new ThreadWrapper();
 
-var loggedSend = function(w, p) {
+/**
+ Aho-Corasick automaton over the longest fully known run (atom) of every needle.
+ hits on an atom are verified against the whole masked needle, reading
+ straight from memory when the needle crosses the chunk we are walking
+ **/
+function MultiPatternScanner(needles) {
+    this.needles = needles;
+    this.atoms = [];
+
+    for (var n = 0; n < needles.length; n++) {
+        var mask = needles[n]['mask'];
+        var best = -1;
+        var bestLength = 0;
+        var run = 0;
+        for (var i = 0; i < mask.length; i++) {
+            run = mask[i] === 0xff ? run + 1 : 0;
+            if (run > bestLength) {
+                bestLength = run;
+                best = i - run + 1;
+            }
+        }
+        if (bestLength > 0) {
+            this.atoms.push({
+                'needle': n,
+                'offset': best,
+                'bytes': needles[n]['bytes'].slice(best, best + bestLength)
+            });
+        }
+    }
+
+    // trie
+    var rows = [this._row()];
+    var outputs = [[]];
+    for (var a = 0; a < this.atoms.length; a++) {
+        var state = 0;
+        var bytes = this.atoms[a]['bytes'];
+        for (var b = 0; b < bytes.length; b++) {
+            if (rows[state][bytes[b]] === -1) {
+                rows.push(this._row());
+                outputs.push([]);
+                rows[state][bytes[b]] = rows.length - 1;
+            }
+            state = rows[state][bytes[b]];
+        }
+        outputs[state].push(a);
+    }
+
+    // failure links, turning the trie into a dfa
+    var fail = new Int32Array(rows.length);
+    var queue = [];
+    for (var c = 0; c < 256; c++) {
+        if (rows[0][c] === -1) {
+            rows[0][c] = 0;
+        } else {
+            fail[rows[0][c]] = 0;
+            queue.push(rows[0][c]);
+        }
+    }
+    while (queue.length > 0) {
+        var r = queue.shift();
+        for (c = 0; c < 256; c++) {
+            var s = rows[r][c];
+            if (s === -1) {
+                rows[r][c] = rows[fail[r]][c];
+            } else {
+                queue.push(s);
+                fail[s] = rows[fail[r]][c];
+                outputs[s] = outputs[s].concat(outputs[fail[s]]);
+            }
+        }
+    }
+
+    this.table = new Int32Array(rows.length * 256);
+    this.terminal = new Uint8Array(rows.length);
+    for (r = 0; r < rows.length; r++) {
+        this.table.set(rows[r], r * 256);
+        this.terminal[r] = outputs[r].length > 0 ? 1 : 0;
+    }
+    this.outputs = outputs;
+}
+
+MultiPatternScanner.prototype._row = function() {
+    var row = new Int32Array(256);
+    row.fill(-1);
+    return row;
+};
+
+MultiPatternScanner.prototype._verify = function(needle, data, offset) {
+    var bytes = needle['bytes'];
+    var mask = needle['mask'];
+    for (var i = 0; i < bytes.length; i++) {
+        if ((data[offset + i] & mask[i]) !== bytes[i]) {
+            return false;
+        }
+    }
+    return true;
+};
+
+/**
+ walk data (read at base) starting from state, onHit(address, needleIndex) for
+ every match. returns the state to carry into the next contiguous chunk
+ **/
+MultiPatternScanner.prototype.scan = function(data, base, state, onHit) {
+    var table = this.table;
+    var terminal = this.terminal;
+    var length = data.length;
+    for (var i = 0; i < length; i++) {
+        state = table[state * 256 + data[i]];
+        if (terminal[state] === 0) {
+            continue;
+        }
+        var out = this.outputs[state];
+        for (var k = 0; k < out.length; k++) {
+            var atom = this.atoms[out[k]];
+            var needle = this.needles[atom['needle']];
+            var start = i - atom['bytes'].length + 1 - atom['offset'];
+            var address = start < 0 ? base.sub(-start) : base.add(start);
+            var matched = false;
+            if (start >= 0 && start + needle['bytes'].length <= length) {
+                matched = this._verify(needle, data, start);
+            } else {
+                try {
+                    matched = this._verify(needle,
+                        new Uint8Array(Memory.readByteArray(address, needle['bytes'].length)), 0);
+                } catch (e) {
+                    matched = false;
+                }
+            }
+            if (matched) {
+                onHit(address, atom['needle']);
+            }
+        }
+    }
+    return state;
+};
+
+/**
+ agent -> py frames. keep in sync with lib/protocol.py
+
+ 'DW' | version u8 | flags u8 | type u16 | reserved u16 | tid u32 | seq u32 | meta_len u32
+ meta (utf-8 json)
+ raw
+ **/
+function DwarfProtocol() {
+    this.MARKER = 'dwarf';
+    this.VERSION = 1;
+    this.HEADER_SIZE = 20;
+
+    this.FLAG_META = 1;
+    this.FLAG_RAW = 2;
+
+    this.TYPES = {
+        'backtrace': 1,
+        'emulator': 2,
+        'enable_kernel': 3,
+        'enumerate_java_classes_start': 4,
+        'enumerate_java_classes_match': 5,
+        'enumerate_java_classes_complete': 6,
+        'enumerate_java_methods_complete': 7,
+        'ftrace': 8,
+        'hook_deleted': 9,
+        'hook_java_callback': 10,
+        'hook_native_callback': 11,
+        'hook_onload_callback': 12,
+        'java_trace': 13,
+        'log': 14,
+        'memoryscan_result': 15,
+        'onload_callback': 16,
+        'release': 17,
+        'release_js': 18,
+        'resume': 19,
+        'set_context': 20,
+        'set_data': 21,
+        'tracer': 22,
+        'update_modules': 23,
+        'update_ranges': 24,
+        'watcher': 25,
+        'watcher_added': 26,
+        'watcher_removed': 27,
+        'api_result': 28,
+        'memoryscan_batch': 29,
+        'memoryscan_progress': 30,
+        'memoryscan_complete': 31,
+        'ranges_delta': 32
+    };
+
+    this.seq = 0;
+
+    this._utf8Length = function(str) {
+        var len = 0;
+        for (var i = 0; i < str.length; i++) {
+            var c = str.charCodeAt(i);
+            if (c < 0x80) {
+                len += 1;
+            } else if (c < 0x800) {
+                len += 2;
+            } else if (c >= 0xd800 && c < 0xdc00 && i + 1 < str.length) {
+                // surrogate pair
+                len += 4;
+                i++;
+            } else {
+                len += 3;
+            }
+        }
+        return len;
+    };
+
+    this._utf8Write = function(u8, offset, str) {
+        for (var i = 0; i < str.length; i++) {
+            var c = str.charCodeAt(i);
+            if (c < 0x80) {
+                u8[offset++] = c;
+            } else if (c < 0x800) {
+                u8[offset++] = 0xc0 | (c >> 6);
+                u8[offset++] = 0x80 | (c & 0x3f);
+            } else if (c >= 0xd800 && c < 0xdc00 && i + 1 < str.length) {
+                c = 0x10000 + ((c - 0xd800) << 10) + (str.charCodeAt(++i) - 0xdc00);
+                u8[offset++] = 0xf0 | (c >> 18);
+                u8[offset++] = 0x80 | ((c >> 12) & 0x3f);
+                u8[offset++] = 0x80 | ((c >> 6) & 0x3f);
+                u8[offset++] = 0x80 | (c & 0x3f);
+            } else {
+                u8[offset++] = 0xe0 | (c >> 12);
+                u8[offset++] = 0x80 | ((c >> 6) & 0x3f);
+                u8[offset++] = 0x80 | (c & 0x3f);
+            }
+        }
+        return offset;
+    };
+
+    this.encode = function(type, meta, raw, tid) {
+        var typeId = this.TYPES[type];
+        if (typeof typeId === 'undefined') {
+            throw new Error('unknown message type: ' + type);
+        }
+
+        var flags = 0;
+        var metaStr = null;
+        var metaLen = 0;
+        if (isDefined(meta)) {
+            flags |= this.FLAG_META;
+            metaStr = JSON.stringify(meta);
+            metaLen = this._utf8Length(metaStr);
+        }
+        var rawLen = 0;
+        if (isDefined(raw)) {
+            flags |= this.FLAG_RAW;
+            rawLen = raw.byteLength;
+        }
+
+        var frame = new ArrayBuffer(this.HEADER_SIZE + metaLen + rawLen);
+        var view = new DataView(frame);
+        view.setUint8(0, 0x44); // D
+        view.setUint8(1, 0x57); // W
+        view.setUint8(2, this.VERSION);
+        view.setUint8(3, flags);
+        view.setUint16(4, typeId, true);
+        view.setUint16(6, 0, true);
+        view.setUint32(8, tid, true);
+        view.setUint32(12, this.seq, true);
+        view.setUint32(16, metaLen, true);
+        this.seq = (this.seq + 1) >>> 0;
+
+        var u8 = new Uint8Array(frame);
+        if (metaStr !== null) {
+            this._utf8Write(u8, this.HEADER_SIZE, metaStr);
+        }
+        if (rawLen > 0) {
+            u8.set(new Uint8Array(raw), this.HEADER_SIZE + metaLen);
+        }
+        return frame;
+    };
+}
+var protocol = new DwarfProtocol();
+
+var loggedSend = function(type, meta, raw, tid) {
+    if (typeof tid === 'undefined' || tid === null) {
+        tid = Process.getCurrentThreadId();
+    }
+
     if (DEBUG) {
-        _log('[' + Process.getCurrentThreadId() + '] sending data to py side | ' + w);
+        _log('[' + tid + '] sending data to py side | ' + type);
     }
 
-    return send(w, p);
+    return send(protocol.MARKER, protocol.encode(type, meta, raw, parseInt(tid)));
 };
 
 /**
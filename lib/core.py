@@ -14,22 +14,38 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
+import bisect
 import os
-import binascii
+import itertools
 import json
+import shutil
+import threading
 
 from frida.core import Session
 
 import frida
 from PyQt5.QtCore import QObject, pyqtSignal, QThread
-from PyQt5.QtWidgets import QFileDialog, QApplication
+from PyQt5.QtWidgets import QFileDialog
 
-from lib import utils
+from lib import utils, protocol, prefs
+from lib.analysis import AnalysisThread, ModuleAnalyzer
 from lib.context import Context
+from lib.disasm_cache import DisasmCache
 from lib.emulator import Emulator
 
 from lib.hook import Hook
 from lib.kernel import Kernel
+from lib.memory_map import MemoryMap
+from lib.memory_reader import MemoryReader
+from lib.message_pipeline import MessagePipeline
+from lib.page_cache import PageCache
+from lib.pointer_scanner import PointerScanner, PointerScanThread
+from lib.process_dump import ProcessDumper, stream_memory
+from lib.prefs import Prefs
+from lib.rpc_worker import RpcWorker
+from lib.snapshot import SnapshotThread
+from lib.symbols import SymbolIndex
+from lib.xrefs import XrefIndexer, XrefThread
 
 from ui.dialog_input import InputDialog
 
@@ -56,7 +72,17 @@ class EmulatorThread(QThread):
                 self.onError.emit(error)
 
 
+class _ApiWaiter(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
 class Dwarf(QObject):
+    # seconds to wait for a paused thread to answer an api
+    PAUSED_API_TIMEOUT = 30
+
     class NoDeviceAssignedError(Exception):
         """ Raised when no Device
         """
@@ -82,6 +108,8 @@ class Dwarf(QObject):
     onWatcherRemoved = pyqtSignal(str, name='onWatcherRemoved')
     # ranges + modules
     onSetRanges = pyqtSignal(list, name='onSetRanges')
+    # added ranges, removed bases
+    onRangesDelta = pyqtSignal(list, list, name='onRangesDelta')
     onSetModules = pyqtSignal(list, name='onSetModules')
     onHitOnLoad = pyqtSignal(list, name='onHitOnLoad')
     onLogToConsole = pyqtSignal(str, name='onLogToConsole')
@@ -89,6 +117,7 @@ class Dwarf(QObject):
     onThreadResumed = pyqtSignal(int, name='onThreadResumed')
     onRequestJsThreadResume = pyqtSignal(int, name='onRequestJsThreadResume')
     onApplyContext = pyqtSignal(dict, name='onApplyContext')
+    onContextDetails = pyqtSignal(dict, name='onContextDetails')
     # java
     onEnumerateJavaClassesStart = pyqtSignal(name='onEnumerateJavaClassesStart')
     onEnumerateJavaClassesMatch = pyqtSignal(str, name='onEnumerateJavaClassesMatch')
@@ -96,7 +125,7 @@ class Dwarf(QObject):
     onEnumerateJavaMethodsComplete = pyqtSignal(list, name='onEnumerateJavaMethodsComplete')
     # trace
     onJavaTraceEvent = pyqtSignal(list, name='onJavaTraceEvent')
-    onTraceData = pyqtSignal(str, name='onTraceData')
+    onTraceData = pyqtSignal(list, name='onTraceData')
     onSetData = pyqtSignal(list, name='onSetData')
     # emulator
     onEmulator = pyqtSignal(list, name='onEmulator')
@@ -104,6 +133,14 @@ class Dwarf(QObject):
     onBackTrace = pyqtSignal(dict, name='onBackTrace')
 
     onMemoryScanResult = pyqtSignal(list, name='onMemoryScanResult')
+    # scan id, range index, addresses, needle index of each address (multi pattern scans only)
+    onMemoryScanBatch = pyqtSignal(int, int, list, list, name='onMemoryScanBatch')
+    onMemoryScanProgress = pyqtSignal(dict, name='onMemoryScanProgress')
+    onMemoryScanComplete = pyqtSignal(dict, name='onMemoryScanComplete')
+    # SnapshotDiff
+    onSnapshotDiff = pyqtSignal(object, name='onSnapshotDiff')
+    onModuleAnalyzed = pyqtSignal(object, name='onModuleAnalyzed')
+    onXrefsIndexed = pyqtSignal(object, name='onXrefsIndexed')
 
     # ************************************************************************
     # **************************** Init **************************************
@@ -133,6 +170,8 @@ class Dwarf(QObject):
 
         # hooks
         self.hooks = {}
+        # sorted native hook addresses, see native_hooks_in
+        self._native_hook_addresses = []
         self.on_loads = {}
         self.java_hooks = {}
         self.temporary_input = ''
@@ -144,6 +183,9 @@ class Dwarf(QObject):
         self._pointer_size = 0
         self.contexts = {}
         self.context_tid = 0
+        # tid -> contextDetails of the current stop
+        self._context_details = {}
+        self._context_details_pending = set()
         self._platform = ''
         self.loading_library = None
 
@@ -158,6 +200,47 @@ class Dwarf(QObject):
         self._emu_thread.emulator = self.emulator
         self._emu_queue = []
 
+        # async rpc
+        self._rpc_worker = RpcWorker(self)
+        self._rpc_worker.onRequestDone.connect(self._on_async_done)
+        self._async_callbacks = {}
+
+        # apis handed to paused threads
+        self._api_request_ids = itertools.count(1)
+        self._scan_ids = itertools.count(1)
+        self._api_waiters = {}
+        self._api_waiters_lock = threading.Lock()
+
+        # target memory
+        self._prefs = Prefs()
+        self._page_cache = PageCache(
+            self._read_memory_remote,
+            budget=self._prefs.get(prefs.MEMORY_CACHE_SIZE, PageCache.DEFAULT_BUDGET))
+        # filled before anyone else hears about new ranges
+        self._memory_map = MemoryMap()
+        self.onSetRanges.connect(self._memory_map.set_ranges)
+        self.onSetRanges.connect(self._page_cache.set_ranges)
+        self._symbols = SymbolIndex(self)
+        self.onSetModules.connect(self._symbols.set_modules)
+        self._disasm_cache = DisasmCache()
+        self._page_cache.add_listener(self._disasm_cache.invalidate)
+        self._memory_reader = MemoryReader(self._read_bytes)
+        self._process_dumper = None
+        self._snapshot = None
+        self._snapshot_thread = None
+        self._pointer_scan = None
+        # module name -> ModuleAnalysis / AnalysisThread
+        self._analyses = {}
+        self._analysis_threads = {}
+        # module name -> XrefIndex / XrefThread
+        self._xref_indexes = {}
+        self._xref_threads = {}
+
+        # agent messages
+        self._message_pipeline = MessagePipeline(self)
+        self._message_pipeline.onMessagesReady.connect(self._on_messages_ready)
+        self._message_pipeline.onBackPressure.connect(self._on_back_pressure)
+
         # connect to self
         self.onApplyContext.connect(self._on_apply_context)
         self.onEmulator.connect(self._on_emulator)
@@ -184,6 +267,8 @@ class Dwarf(QObject):
 
         # hooks
         self.hooks = {}
+        # sorted native hook addresses, see native_hooks_in
+        self._native_hook_addresses = []
         self.on_loads = {}
         self.java_hooks = {}
         self.temporary_input = ''
@@ -251,6 +336,11 @@ class Dwarf(QObject):
     # ************************************************************************
     # **************************** Functions *********************************
     # ************************************************************************
+    def message_stats(self):
+        """ back pressure statistics of the agent message pipeline
+        """
+        return self._message_pipeline.stats()
+
     def is_address_watched(self, ptr):
         ptr = utils.parse_ptr(ptr)
         if ptr in self._watchers:
@@ -312,6 +402,20 @@ class Dwarf(QObject):
         self.load_script(script)
 
     def detach(self):
+        self._rpc_worker.cancel_all()
+        if self._process_dumper is not None:
+            self._process_dumper.cancel()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.cancel()
+        if self._pointer_scan is not None:
+            self._pointer_scan.cancel()
+        for thread in list(self._analysis_threads.values()) + list(self._xref_threads.values()):
+            thread.cancel()
+        self._analysis_threads.clear()
+        self._analyses.clear()
+        self._xref_threads.clear()
+        self._xref_indexes.clear()
+        self._async_callbacks.clear()
         if self._script is not None:
             self.dwarf_api('_detach')
             self._script.unload()
@@ -319,6 +423,21 @@ class Dwarf(QObject):
             self._process.detach()
             if self._spawned:
                 self.device.kill(self.pid)
+        self.stop_workers()
+
+    def stop_workers(self):
+        """ stop and wait for the rpc worker and the message pipeline,
+            both start again with the next request or message
+        """
+        # a paused thread won't answer anymore, don't hold the rpc worker up to PAUSED_API_TIMEOUT
+        with self._api_waiters_lock:
+            waiters = list(self._api_waiters.values())
+            self._api_waiters.clear()
+        for waiter in waiters:
+            waiter.error = 'detached'
+            waiter.event.set()
+        self._rpc_worker.stop()
+        self._message_pipeline.stop()
 
     def load_script(self, script=None):
         try:
@@ -404,6 +523,13 @@ class Dwarf(QObject):
                 return
         return self.dwarf_api('addWatcher', ptr)
 
+    def native_hooks_in(self, start, end):
+        """ native hooks placed in [start, end)
+        """
+        first = bisect.bisect_left(self._native_hook_addresses, start)
+        last = bisect.bisect_left(self._native_hook_addresses, end)
+        return [self.hooks[address] for address in self._native_hook_addresses[first:last]]
+
     def dump_memory(self, file_path=None, ptr=0, length=0):
         if ptr == 0:
             ptr, inp = InputDialog.input_pointer(self._app_window)
@@ -425,11 +551,285 @@ class Dwarf(QObject):
                 if len(r) == 0 or len(r[0]) == 0:
                     return
                 file_path = r[0]
-            data = self.read_memory(ptr, length)
-            if data is not None:
-                with open(file_path, 'wb') as f:
+            with open(file_path, 'wb') as f:
+                def on_data(address, data):
+                    f.seek(address - ptr)
                     f.write(data)
 
+                unreadable = stream_memory(self, ptr, length, on_data)
+                # holes at the end are still part of the dump
+                f.truncate(length)
+            if unreadable:
+                self.log('dump 0x%x: %d unreadable bytes left zeroed' % (ptr, unreadable))
+
+    def dump_process(self, path=None):
+        """ stream every readable range to a dump directory (see lib/process_dump.py)
+        """
+        if self._process_dumper is not None:
+            self.log('a process dump is already running')
+            return
+        if path is None:
+            path = QFileDialog.getExistingDirectory(self._app_window, caption='Save process dump to')
+            if not path:
+                return
+
+        self._process_dumper = ProcessDumper(self, path)
+        self._process_dumper.onProgress.connect(self._on_process_dump_progress)
+        self._process_dumper.onFinished.connect(self._on_process_dump_finished)
+        self._process_dumper.onCancelled.connect(self._on_process_dump_cancelled)
+        self._process_dumper.onError.connect(self._on_process_dump_error)
+        self._app_window.show_progress('dumping process...')
+        self._process_dumper.start()
+
+    def _on_process_dump_progress(self, percent):
+        self._app_window.set_status_text('dumping process... %d%%' % percent)
+
+    def _on_process_dump_finished(self, path, unreadable):
+        self._process_dumper = None
+        self._app_window.hide_progress()
+        self.log('process dumped to %s (%d unreadable bytes skipped)' % (path, unreadable))
+
+    def _on_process_dump_cancelled(self, path):
+        self._process_dumper = None
+        self._app_window.hide_progress()
+        self.log('process dump cancelled, %s is incomplete' % path)
+
+    def _on_process_dump_error(self, error):
+        self._process_dumper = None
+        self._app_window.hide_progress()
+        self.log('process dump failed: ' + error)
+
+    def take_snapshot(self, ranges=None):
+        """ save the pages of ranges (default: every rw range) to diff them later
+        """
+        if self._snapshot_thread is not None:
+            self.log('a snapshot is already running')
+            return
+        if ranges is None:
+            ranges = self.dwarf_api('getRanges')
+            if not ranges:
+                self.log('unable to retrieve ranges')
+                return
+            ranges = [(int(_range['base'], 16), _range['size']) for _range in ranges
+                      if 'r' in _range['protection'] and 'w' in _range['protection']]
+
+        if self._snapshot is not None:
+            self._snapshot.close()
+            shutil.rmtree(self._snapshot.path, ignore_errors=True)
+            self._snapshot = None
+
+        self._snapshot_thread = SnapshotThread(self)
+        self._snapshot_thread.onProgress.connect(self._on_snapshot_progress)
+        self._snapshot_thread.onSnapshotTaken.connect(self._on_snapshot_taken)
+        self._snapshot_thread.onSnapshotDiff.connect(self._on_snapshot_diff)
+        self._snapshot_thread.onError.connect(self._on_snapshot_error)
+        self._app_window.show_progress('taking snapshot...')
+        self._snapshot_thread.take(ranges, os.path.join('.tmp', 'snapshot_%d' % self.pid))
+
+    def diff_snapshot(self):
+        """ compare the last snapshot with the target, see onSnapshotDiff
+        """
+        if self._snapshot is None:
+            self.log('take a snapshot first')
+            return
+        if self._snapshot_thread is not None:
+            self.log('a snapshot is already running')
+            return
+
+        self._snapshot_thread = SnapshotThread(self)
+        self._snapshot_thread.onProgress.connect(self._on_snapshot_progress)
+        self._snapshot_thread.onSnapshotDiff.connect(self._on_snapshot_diff)
+        self._snapshot_thread.onError.connect(self._on_snapshot_error)
+        self._app_window.show_progress('diffing snapshot...')
+        self._snapshot_thread.diff(self._snapshot)
+
+    def _on_snapshot_progress(self, percent):
+        self._app_window.set_status_text('snapshot... %d%%' % percent)
+
+    def _on_snapshot_taken(self, snapshot):
+        self._snapshot_thread = None
+        self._snapshot = snapshot
+        self._app_window.hide_progress()
+        self.log('snapshot of %d ranges taken' % len(snapshot.ranges))
+
+    def _on_snapshot_diff(self, diff):
+        self._snapshot_thread = None
+        self._app_window.hide_progress()
+        self.log('snapshot diff: %d changed pages, %d changed bytes' % (len(diff.pages), diff.changed_bytes))
+        self.onSnapshotDiff.emit(diff)
+
+    def _on_snapshot_error(self, error):
+        self._snapshot_thread = None
+        self._app_window.hide_progress()
+        self.log('snapshot failed: ' + error)
+
+    def pointer_scan(self, ptr):
+        """ look for pointer paths from module bases to ptr (see lib/pointer_scanner.py)
+        """
+        if self._pointer_scan is not None:
+            self.log('a pointer scan is already running')
+            return
+        ptr = utils.parse_ptr(ptr)
+        accept, options = InputDialog.input(
+            self._app_window, hint='pointer scan 0x%x: max depth, max offset' % ptr,
+            input_content='5, 0x1000')
+        if not accept:
+            return
+        try:
+            max_depth, max_offset = [utils.parse_ptr(option.strip()) for option in options.split(',')]
+        except ValueError:
+            self.log('pointer scan: expected max depth, max offset')
+            return
+
+        scanner = PointerScanner(self, os.path.join('.tmp', 'pointer_scan_%d' % self.pid),
+                                 max_depth=max_depth, max_offset=max_offset)
+        self._pointer_scan = PointerScanThread(scanner, ptr)
+        self._pointer_scan.onProgress.connect(self._on_pointer_scan_progress)
+        self._pointer_scan.onStatus.connect(self._on_pointer_scan_status)
+        self._pointer_scan.onFinished.connect(self._on_pointer_scan_finished)
+        self._pointer_scan.onError.connect(self._on_pointer_scan_error)
+        self._app_window.show_progress('pointer scan...')
+        self._pointer_scan.start()
+
+    def _on_pointer_scan_progress(self, percent):
+        self._app_window.set_status_text('pointer scan... %d%%' % percent)
+
+    def _on_pointer_scan_status(self, status):
+        self._app_window.show_progress('pointer scan: ' + status)
+
+    def _on_pointer_scan_finished(self, paths):
+        scan = self._pointer_scan
+        self._pointer_scan = None
+        self._app_window.hide_progress()
+        self.log('pointer scan 0x%x: %d paths' % (scan.target, len(paths)))
+        for path in paths[:50]:
+            self.log(str(path))
+        if not paths:
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self._app_window, caption='Save pointer paths',
+                                                   filter='*.json')
+        if file_path:
+            scan.scanner.save(file_path, scan.target, paths)
+
+    def _on_pointer_scan_error(self, error):
+        self._pointer_scan = None
+        self._app_window.hide_progress()
+        self.log('pointer scan failed: ' + error)
+
+    def analyze_module(self, name):
+        """ functions, basic blocks and edges of a module, in background (see lib/analysis.py)
+        """
+        if name in self._analysis_threads:
+            self.log('%s is already being analyzed' % name)
+            return
+        found = self._symbols.module_by_name(name)
+        if found is None:
+            self.log('unknown module ' + name)
+            return
+        base, module = found
+
+        thread = AnalysisThread(ModuleAnalyzer(self, dict(module, base=base)))
+        thread.onProgress.connect(
+            lambda percent, name=name: self._app_window.set_status_text('analyzing %s... %d%%' % (name, percent)))
+        thread.onStatus.connect(self._app_window.set_status_text)
+        thread.onFinished.connect(self._on_module_analyzed)
+        thread.onError.connect(lambda error, name=name: self._on_module_analysis_error(name, error))
+        self._analysis_threads[name] = thread
+        thread.start()
+
+    def _on_module_analyzed(self, analysis):
+        self._analysis_threads.pop(analysis.name, None)
+        self._analyses[analysis.name] = analysis
+        self._app_window.set_status_text('')
+        self.log('%s: %d functions, %d basic blocks, %d edges' % (
+            analysis.name, len(analysis.functions), len(analysis.block_starts), len(analysis.edge_targets)))
+        self.onModuleAnalyzed.emit(analysis)
+
+    def _on_module_analysis_error(self, name, error):
+        self._analysis_threads.pop(name, None)
+        self._app_window.set_status_text('')
+        self.log('analysis of %s failed: %s' % (name, error))
+
+    def analysis(self, address):
+        """ ModuleAnalysis of the module holding address, None if not analyzed
+        """
+        found = self._symbols.module_at(utils.parse_ptr(address))
+        if found is None:
+            return None
+        analysis = self._analyses.get(found[1]['name'])
+        if analysis is None or analysis.base != found[0]:
+            return None
+        return analysis
+
+    def index_xrefs(self, name):
+        """ code and data references of a module, in background (see lib/xrefs.py)
+        """
+        if name in self._xref_threads:
+            self.log('%s is already being indexed' % name)
+            return
+        found = self._symbols.module_by_name(name)
+        if found is None:
+            self.log('unknown module ' + name)
+            return
+        base, module = found
+
+        thread = XrefThread(XrefIndexer(self, dict(module, base=base)))
+        thread.onProgress.connect(
+            lambda percent, name=name: self._app_window.set_status_text('indexing %s... %d%%' % (name, percent)))
+        thread.onStatus.connect(self._app_window.set_status_text)
+        thread.onFinished.connect(self._on_xrefs_indexed)
+        thread.onError.connect(lambda error, name=name: self._on_xrefs_index_error(name, error))
+        self._xref_threads[name] = thread
+        thread.start()
+
+    def _on_xrefs_indexed(self, index):
+        thread = self._xref_threads.pop(index.name, None)
+        if thread is not None and thread.indexer.analysis is not None:
+            self._analyses[index.name] = thread.indexer.analysis
+        self._xref_indexes[index.name] = index
+        self._app_window.set_status_text('')
+        self.log('%s: %d references indexed' % (index.name, len(index)))
+        self.onXrefsIndexed.emit(index)
+
+    def _on_xrefs_index_error(self, name, error):
+        self._xref_threads.pop(name, None)
+        self._app_window.set_status_text('')
+        self.log('xref index of %s failed: %s' % (name, error))
+
+    def xrefs_to(self, address):
+        """ sorted [(source, kind)] referencing address out of every indexed module,
+            None when no module is indexed
+        """
+        if not self._xref_indexes:
+            return None
+        address = utils.parse_ptr(address)
+        xrefs = []
+        for index in self._xref_indexes.values():
+            found = self._symbols.module_by_name(index.name)
+            if found is not None and found[0] == index.base:
+                xrefs.extend(index.references(address))
+        return sorted(xrefs)
+
+    def recheck_pointer_paths(self, file_path=None):
+        """ resolve saved pointer paths in this run, keeps the ones leading to the given address
+        """
+        if file_path is None:
+            file_path, _ = QFileDialog.getOpenFileName(self._app_window, caption='Load pointer paths',
+                                                       filter='*.json')
+            if not file_path:
+                return
+        try:
+            _, paths = PointerScanner.load(file_path)
+        except PointerScanner.PointerScanError as e:
+            self.log('unable to load pointer paths: ' + str(e))
+            return
+
+        target, _ = InputDialog.input_pointer(self._app_window, hint='target address, empty to list all')
+        checked = PointerScanner.recheck(self, paths, target or None)
+        self.log('%d of %d pointer paths left' % (len(checked), len(paths)))
+        for path, address in checked[:50]:
+            self.log('%s = %s' % (path, hex(address) if address is not None else '??'))
+
     def dwarf_api(self, api, args=None, tid=0):
         if self.pid == 0 or self.process is None:
             return
@@ -439,17 +839,175 @@ class Dwarf(QObject):
             args = [args]
         if self._script is None:
             return None
+
+        if api == 'release':
+            # a paused thread can only be released from its own api loop
+            release_tid = utils.parse_ptr(args[0]) if args else 0
+            if release_tid == 0:
+                for context_tid in list(self.contexts.keys()):
+                    self._paused_thread_api(int(context_tid), api, [int(context_tid)])
+                return None
+            tid = release_tid
+
         try:
-            if tid == 0:
-                for context in self.contexts:
-                    self._script.post({"type": str(context['tid'])})
-            else:
-                self._script.post({"type": str(tid)})
+            if self.is_thread_paused(tid):
+                return self._paused_thread_api(tid, api, args)
             return self._script.exports.api(tid, api, args)
         except Exception as e:
             self.log(str(e))
             return None
 
+    def dwarf_api_async(self, api, args=None, tid=0, callback=None, timeout=None):
+        """ dwarf_api out of the gui thread
+
+        :param callback: called in the gui thread with the result (None on error)
+        :return: concurrent.futures.Future
+        """
+        return self.submit_async(self.dwarf_api, api, args, tid, callback=callback, timeout=timeout)
+
+    def dwarf_api_batch_async(self, calls, tid=0, callback=None, timeout=None):
+        return self.submit_async(self.dwarf_api_batch, calls, tid, callback=callback, timeout=timeout)
+
+    def submit_async(self, fn, *args, callback=None, timeout=None):
+        """ run any blocking agent interaction (fn(*args)) in the rpc worker
+        """
+        try:
+            future = self._rpc_worker.submit(fn, *args, timeout=timeout)
+        except RpcWorker.QueueFullError as e:
+            self.log(str(e))
+            if callback is not None:
+                callback(None)
+            return None
+        if callback is not None:
+            self._async_callbacks[future.request_id] = callback
+        return future
+
+    def cancel_async(self, future):
+        if future is None:
+            return False
+        self._async_callbacks.pop(future.request_id, None)
+        return self._rpc_worker.cancel(future.request_id)
+
+    def _on_async_done(self, request_id, result, error):
+        callback = self._async_callbacks.pop(request_id, None)
+        if error is not None:
+            self.log(error)
+        if callback is not None:
+            callback(result)
+
+    def context_details(self, tid):
+        """ backtrace and register details of a paused thread (contextDetails in core.js)
+
+        hits carry the register values only. details are fetched once per
+        stop and replace the Context of the thread
+        """
+        key = str(tid)
+        details = self._context_details.get(key)
+        if details is not None or not self.is_thread_paused(tid):
+            return details
+        model = self.contexts.get(key)
+        details = self.dwarf_api('contextDetails', tid, tid=tid)
+        # drop it if the thread moved on meanwhile
+        if details is not None and self.contexts.get(key) is model:
+            self._context_details[key] = details
+            if 'context' in details:
+                self.contexts[key] = Context(details['context'])
+        return details
+
+    def request_context_details(self, tid):
+        """ context_details out of the gui thread, onContextDetails follows
+        """
+        key = str(tid)
+        if key in self._context_details:
+            self._on_context_details(tid, self._context_details[key])
+            return
+        if key in self._context_details_pending or not self.is_thread_paused(tid):
+            return
+        self._context_details_pending.add(key)
+        self.submit_async(self.context_details, tid,
+                          callback=lambda details: self._on_context_details(tid, details))
+
+    def _on_context_details(self, tid, details):
+        self._context_details_pending.discard(str(tid))
+        if details is None:
+            return
+        self.onContextDetails.emit(dict(details, tid=tid))
+
+    def is_thread_paused(self, tid):
+        return str(tid) in self.contexts
+
+    def _paused_thread_api(self, tid, api, args, timeout=None):
+        """ hand an api to a thread sleeping in _loopApi and wait for its api_result
+
+        the request travels with a recv tagged with the tid, the answer is
+        resolved straight in the frida thread (see _on_message)
+        """
+        if timeout is None:
+            timeout = Dwarf.PAUSED_API_TIMEOUT
+
+        waiter = _ApiWaiter()
+        with self._api_waiters_lock:
+            request_id = next(self._api_request_ids)
+            self._api_waiters[request_id] = waiter
+
+        self._script.post({'type': str(tid), 'id': request_id, 'api': api, 'args': args})
+        if not waiter.event.wait(timeout):
+            with self._api_waiters_lock:
+                self._api_waiters.pop(request_id, None)
+            raise Exception('thread %d did not answer %s within %ds' % (tid, api, timeout))
+
+        if api == 'release' or (api == 'apiBatch' and any(call[0] == 'release' for call in args)):
+            # the thread left its loop, don't wait for the release message to stop routing there
+            self.contexts.pop(str(tid), None)
+
+        if waiter.error is not None:
+            raise Exception('%s: %s' % (api, waiter.error))
+        return waiter.result
+
+    def _on_api_result(self, msg):
+        with self._api_waiters_lock:
+            waiter = self._api_waiters.pop(msg.meta['id'], None)
+        if waiter is None:
+            # timed out already
+            return
+        waiter.error = msg.meta.get('error', None)
+        if msg.meta.get('raw', False):
+            waiter.result = msg.raw
+        else:
+            waiter.result = msg.meta.get('result', None)
+        waiter.event.set()
+
+    def dwarf_api_batch(self, calls, tid=0):
+        """ run a list of (api, args) in a single round trip
+
+        :param calls: list of (api, args) - args follow dwarf_api rules
+        :return: list of results, None for the calls which failed
+        """
+        if not calls:
+            return []
+        if self.pid == 0 or self.process is None or self._script is None:
+            return [None] * len(calls)
+        if tid == 0:
+            tid = self.context_tid
+
+        batch = []
+        for call in calls:
+            if isinstance(call, str):
+                api, args = call, None
+            else:
+                api, args = call
+            if args is not None and not isinstance(args, list):
+                args = [args]
+            batch.append([api, args])
+
+        try:
+            if self.is_thread_paused(tid):
+                return self._paused_thread_api(tid, 'apiBatch', batch)
+            return self._script.exports.api_batch(tid, batch)
+        except Exception as e:
+            self.log(str(e))
+            return [None] * len(calls)
+
     def hook_java(self, input_=None, pending_args=None):
         if input_ is None or not isinstance(input_, str):
             accept, input_ = InputDialog.input(
@@ -517,81 +1075,176 @@ class Dwarf(QObject):
         # self._app_window.get_menu().on_native_tracer_change(False)
 
     def read_memory(self, ptr, length):
-        if length > 1024 * 1024:
-            position = 0
-            next_size = 1024 * 1024
-            data = bytearray()
-            while True:
-                try:
-                    data += self.dwarf_api('readBytes', [ptr + position, next_size])
-                except:
-                    return None
-                position += next_size
-                diff = length - position
-                if diff > 1024 * 1024:
-                    next_size = 1024 * 1024
-                elif diff > 0:
-                    next_size = diff
-                else:
-                    break
-            ret = bytes(data)
-            del data
-            return ret
-        else:
-            return self.dwarf_api('readBytes', [ptr, length])
+        return self._page_cache.read(ptr, length)
+
+    def telescope(self, addresses, depth=1):
+        """ classify many addresses in one call
+
+        :return: per address a list of [type, value] following pointers up to depth.
+                 type is 0 string, 1 pointer, 2 value, -1 unreadable
+        """
+        if not addresses:
+            return []
+        result = self.dwarf_api('telescope', [[hex(address) for address in addresses], depth])
+        if not isinstance(result, list) or len(result) != len(addresses):
+            return [[[-1, '']] for _ in addresses]
+        return result
+
+    def read_memory_ex(self, ptr, length, progress=None, cancel=None):
+        """ uncached pipelined read
+
+        :param progress: progress(done_bytes, total_bytes) - called from reader threads
+        :param cancel: threading.Event
+        :return: MemoryReadResult with the data and the unreadable holes
+        """
+        self._memory_reader.page_size = self._page_cache.page_size
+        return self._memory_reader.read(ptr, length, progress=progress, cancel=cancel)
+
+    def _read_memory_remote(self, ptr, length):
+        if length <= MemoryReader.CHUNK_SIZE:
+            return self._read_bytes(ptr, length)
+        result = self.read_memory_ex(ptr, length)
+        if not result.complete:
+            return None
+        return result.data
+
+    def _read_bytes(self, ptr, length):
+        data = self.dwarf_api('readBytes', [ptr, length])
+        if not isinstance(data, (bytes, bytearray)):
+            # the agent answers [] on failures
+            return None
+        return data
+
+    def write_memory(self, ptr, data):
+        self._page_cache.invalidate(ptr, len(data))
+        return self.dwarf_api('writeBytes', [ptr, data])
+
+    @property
+    def page_cache(self):
+        return self._page_cache
+
+    @property
+    def memory_map(self):
+        return self._memory_map
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @property
+    def disasm_cache(self):
+        return self._disasm_cache
 
     def remove_watcher(self, ptr):
         return self.dwarf_api('removeWatcher', ptr)
 
+    @staticmethod
+    def _frida_pattern(pattern):
+        # deadbeef -> de ad be ef
+        pattern = pattern.replace(' ', '')
+        return ' '.join([pattern[i:i + 2] for i in range(0, len(pattern), 2)])
+
     def search(self, start, size, pattern):
         # sanify args
         start = utils.parse_ptr(start)
         size = int(size)
-        # convert to frida accepted pattern
-        pattern = ' '.join([pattern[i:i + 2] for i in range(0, len(pattern), 2)])
-        self.dwarf_api('memoryScan', [start, size, pattern])
+        self.dwarf_api('memoryScan', [start, size, self._frida_pattern(pattern)])
 
     def search_list(self, ranges_list, pattern):
-        pattern = ' '.join([pattern[i:i + 2] for i in range(0, len(pattern), 2)])
-        self.dwarf_api('memoryScanList', [json.dumps(ranges_list), pattern])
+        self.dwarf_api('memoryScanList', [json.dumps(ranges_list), self._frida_pattern(pattern)])
+
+    def scan_memory(self, pattern, ranges=None):
+        """ start an async scan in the agent
+
+        results are streamed through onMemoryScanBatch, followed by
+        onMemoryScanProgress once per range and onMemoryScanComplete
+
+        :param pattern: hex string, ?? for wildcards
+        :param ranges: list of (base, size), None scans every readable range
+        :return: scan id, 0 on failure
+        """
+        scan_id = next(self._scan_ids)
+        if ranges is not None:
+            ranges = [{'base': hex(utils.parse_ptr(base)), 'size': int(size)} for base, size in ranges]
+        if self.dwarf_api('memoryScanStart', [scan_id, ranges, self._frida_pattern(pattern)]) is None:
+            return 0
+        return scan_id
+
+    def scan_memory_multi(self, needles, ranges=None):
+        """ like scan_memory but looking for many needles in a single pass
+
+        :param needles: list of lib.scan_patterns.Needle
+        :return: scan id, 0 on failure
+        """
+        scan_id = next(self._scan_ids)
+        if ranges is not None:
+            ranges = [{'base': hex(utils.parse_ptr(base)), 'size': int(size)} for base, size in ranges]
+        needles = [needle.to_agent() for needle in needles]
+        if self.dwarf_api('memoryScanMultiStart', [scan_id, ranges, needles]) is None:
+            return 0
+        return scan_id
+
+    def cancel_scan(self, scan_id):
+        return self.dwarf_api('memoryScanCancel', scan_id)
 
     # ************************************************************************
     # **************************** Handlers **********************************
     # ************************************************************************
     def _on_message(self, message, data):
-        QApplication.processEvents()
-        if 'payload' not in message:
-            print('payload: ' + str(message))
-            return
-
-        what = message['payload']
-        parts = what.split(':::')
-        if len(parts) < 2:
-            print(what)
+        # frida thread: api results are resolved right here, someone is waiting.
+        # everything else is decoded in the pipeline thread
+        if protocol.peek_type(data) == 'api_result':
+            try:
+                self._on_api_result(protocol.decode(data))
+            except protocol.ProtocolError as e:
+                print('api_result: ' + str(e))
             return
+        self._message_pipeline.enqueue(message, data)
 
-        cmd = parts[0]
-        if cmd == 'backtrace':
-            self.onBackTrace.emit(json.loads(parts[1]))
+    def _on_messages_ready(self):
+        for item in self._message_pipeline.drain():
+            if isinstance(item, protocol.Message):
+                self._dispatch_message(item)
+            else:
+                message = item[0]
+                if 'payload' not in message:
+                    print('payload: ' + str(message))
+                else:
+                    print(message['payload'])
+
+    def _on_back_pressure(self, stats):
+        self.log('message pipeline is falling behind: pending %d (max %d) ready %d (max %d) '
+                 'stalls %d/%d dropped %d avg decode %.1fus' % (
+                     stats['pending'], stats['pending_high_water'], stats['ready'], stats['ready_high_water'],
+                     stats['producer_stalls'], stats['decoder_stalls'], stats['dropped'], stats['avg_decode_us']))
+
+    def _dispatch_message(self, msg):
+        cmd = msg.type
+        meta = msg.meta
+        if cmd == 'api_result':
+            # normally resolved in _on_message, don't leave a waiter hanging if one slips through
+            self._on_api_result(msg)
+        elif cmd == 'backtrace':
+            self.onBackTrace.emit(meta)
         elif cmd == 'emulator':
-            self.onEmulator.emit(parts[1:])
+            self.onEmulator.emit(meta)
         elif cmd == 'enumerate_java_classes_start':
             self.onEnumerateJavaClassesStart.emit()
         elif cmd == 'enumerate_java_classes_match':
-            self.onEnumerateJavaClassesMatch.emit(parts[1])
+            self.onEnumerateJavaClassesMatch.emit(meta)
         elif cmd == 'enumerate_java_classes_complete':
             self.onEnumerateJavaClassesComplete.emit()
         elif cmd == 'enumerate_java_methods_complete':
-            self.onEnumerateJavaMethodsComplete.emit([parts[1], json.loads(parts[2])])
+            self.onEnumerateJavaMethodsComplete.emit([meta['className'], meta['methods']])
         elif cmd == 'ftrace':
             if self.app.get_ftrace_panel() is not None:
-                self.app.get_ftrace_panel().append_data(parts[1])
+                self.app.get_ftrace_panel().append_data(meta)
         elif cmd == 'enable_kernel':
             self._app_window.get_menu().enable_kernel_menu()
         elif cmd == 'hook_java_callback':
             h = Hook(Hook.HOOK_JAVA)
             h.set_ptr(1)
-            h.set_input(parts[1])
+            h.set_input(meta)
             if self.java_pending_args:
                 h.set_condition(self.java_pending_args['condition'])
                 h.set_logic(self.java_pending_args['logic'])
@@ -600,108 +1253,126 @@ class Dwarf(QObject):
             self.onAddJavaHook.emit(h)
         elif cmd == 'hook_native_callback':
             h = Hook(Hook.HOOK_NATIVE)
-            h.set_ptr(int(parts[1], 16))
+            h.set_ptr(int(meta['ptr'], 16))
             h.set_input(self.temporary_input)
-            h.set_bytes(binascii.unhexlify(parts[2]))
+            h.set_bytes(msg.raw)
             self.temporary_input = ''
-            h.set_condition(parts[4])
-            h.set_logic(parts[3])
+            h.set_condition(meta.get('condition', ''))
+            h.set_logic(meta.get('logic', ''))
             self.native_pending_args = None
+            if h.get_ptr() not in self.hooks:
+                bisect.insort(self._native_hook_addresses, h.get_ptr())
             self.hooks[h.get_ptr()] = h
+            self._page_cache.invalidate(h.get_ptr(), len(msg.raw or b''))
             self.onAddNativeHook.emit(h)
         elif cmd == 'hook_onload_callback':
             h = Hook(Hook.HOOK_ONLOAD)
             h.set_ptr(0)
-            h.set_input(parts[1])
-            self.on_loads[parts[1]] = h
+            h.set_input(meta)
+            self.on_loads[meta] = h
             self.onAddOnLoadHook.emit(h)
         elif cmd == 'hook_deleted':
-            if parts[1] == 'java':
-                self.java_hooks.pop(parts[2])
-            elif parts[1] == 'onload':
-                self.on_loads.pop(parts[2])
+            if meta['type'] == 'java':
+                self.java_hooks.pop(meta['key'])
+            elif meta['type'] == 'onload':
+                self.on_loads.pop(meta['key'])
             else:
-                self.hooks.pop(utils.parse_ptr(parts[2]))
-            self.onDeleteHook.emit(parts)
+                hook = self.hooks.pop(utils.parse_ptr(meta['key']))
+                i = bisect.bisect_left(self._native_hook_addresses, hook.get_ptr())
+                if i < len(self._native_hook_addresses) and self._native_hook_addresses[i] == hook.get_ptr():
+                    del self._native_hook_addresses[i]
+                self._page_cache.invalidate(hook.get_ptr(), len(hook.get_bytes() or b''))
+            self.onDeleteHook.emit([cmd, meta['type'], meta['key']])
         elif cmd == 'java_trace':
-            self.onJavaTraceEvent.emit(parts)
+            self.onJavaTraceEvent.emit([cmd, meta['event'], meta['method'], meta['data']])
         elif cmd == 'log':
-            self.log(parts[1])
+            self.log(meta)
         elif cmd == 'onload_callback':
-            self.loading_library = parts[1]
-            str_fmt = ('Hook onload {0} @thread := {1}'.format(parts[1], parts[3]))
+            self.loading_library = meta['module']
+            str_fmt = ('Hook onload {0} @thread := {1}'.format(meta['module'], msg.tid))
             self.log(str_fmt)
-            self.onHitOnLoad.emit([parts[1], parts[2]])
+            self.onHitOnLoad.emit([meta['module'], str(meta['base'])])
         elif cmd == 'release':
-            if parts[1] in self.contexts:
-                del self.contexts[parts[1]]
-            self.onThreadResumed.emit(int(parts[1]))
+            self._page_cache.drop_writable()
+            if str(msg.tid) in self.contexts:
+                del self.contexts[str(msg.tid)]
+            self._context_details.pop(str(msg.tid), None)
+            self.onThreadResumed.emit(msg.tid)
         elif cmd == 'resume':
+            self._page_cache.drop_writable()
             if not self.resumed:
                 self.resume_proc()
         elif cmd == 'release_js':
             # releasing the thread must be done by calling py funct dwarf_api('release')
             # there are cases in which we want to release the thread from a js api so we need to call this
-            self.onRequestJsThreadResume.emit(int(parts[1]))
+            self.onRequestJsThreadResume.emit(msg.tid)
         elif cmd == 'set_context':
-            data = json.loads(parts[1])
-            if 'modules' in data:
-                self.onSetModules.emit(data['modules'])
-            if 'ranges' in data:
-                self.onSetRanges.emit(data['ranges'])
-            if 'backtrace' in data:
-                self.onBackTrace.emit(data['backtrace'])
-
-            self.onApplyContext.emit(data)
+            if msg.model is not None:
+                # the process ran since the last stop
+                self._page_cache.drop_writable()
+                self.contexts[str(meta['tid'])] = msg.model
+                self._context_details.pop(str(meta['tid']), None)
+            if 'modules' in meta:
+                self.onSetModules.emit(meta['modules'])
+            if 'ranges' in meta:
+                self.onSetRanges.emit(meta['ranges'])
+            if 'backtrace' in meta:
+                self.onBackTrace.emit(meta['backtrace'])
+
+            self.onApplyContext.emit(meta)
         elif cmd == 'set_data':
-            if data:
-                self.onSetData.emit(['raw', parts[1], data])
+            if msg.raw is not None:
+                self.onSetData.emit(['raw', meta['key'], msg.raw])
             else:
-                self.onSetData.emit(['plain', parts[1], str(parts[2])])
+                self.onSetData.emit(['plain', meta['key'], meta['data']])
         elif cmd == 'tracer':
-            self.onTraceData.emit(parts[1])
+            self.onTraceData.emit(meta)
         elif cmd == 'unhandled_exception':
             # todo
             pass
         elif cmd == 'update_modules':
-            modules = json.loads(parts[2])
             # todo update onloads bases
-            self.onSetModules.emit(modules)
+            self.onSetModules.emit(meta)
         elif cmd == 'update_ranges':
-            self.onSetRanges.emit(json.loads(parts[2]))
+            self.onSetRanges.emit(meta)
+        elif cmd == 'ranges_delta':
+            self._memory_map.apply_delta(meta['added'], meta['removed'])
+            self._page_cache.set_ranges(self._memory_map.ranges)
+            self.onRangesDelta.emit(meta['added'], meta['removed'])
         elif cmd == 'watcher':
-            exception = json.loads(parts[1])
-            self.log('watcher hit op %s address %s @thread := %s' %
-                     (exception['memory']['operation'], exception['memory']['address'], parts[2]))
+            self._page_cache.invalidate(utils.parse_ptr(meta['memory']['address']), self.pointer_size or 8)
+            self.log('watcher hit op %s address %s @thread := %d' %
+                     (meta['memory']['operation'], meta['memory']['address'], msg.tid))
         elif cmd == 'watcher_added':
-            self._watchers.append(utils.parse_ptr(parts[1]))
-            self.onWatcherAdded.emit(parts[1], int(parts[2]))
+            self._watchers.append(utils.parse_ptr(meta['ptr']))
+            self.onWatcherAdded.emit(meta['ptr'], int(meta['flags']))
         elif cmd == 'watcher_removed':
-            self._watchers.remove(utils.parse_ptr(parts[1]))
-            self.onWatcherRemoved.emit(parts[1])
+            self._watchers.remove(utils.parse_ptr(meta))
+            self.onWatcherRemoved.emit(meta)
         elif cmd == 'memoryscan_result':
-            if parts[1] == '':
-                self.onMemoryScanResult.emit([])
-            else:
-                self.onMemoryScanResult.emit(json.loads(parts[1]))
+            self.onMemoryScanResult.emit(meta or [])
+        elif cmd == 'memoryscan_batch':
+            addresses, needles = msg.model or ([], [])
+            self.onMemoryScanBatch.emit(meta['id'], meta['range'], addresses, needles)
+        elif cmd == 'memoryscan_progress':
+            self.onMemoryScanProgress.emit(meta)
+        elif cmd == 'memoryscan_complete':
+            self.onMemoryScanComplete.emit(meta)
         else:
-            print('unknown message: ' + what)
+            print('unknown message: ' + str(msg))
 
     def _on_apply_context(self, context_data):
         if 'context' in context_data:
-            context = Context(context_data['context'])
-            self.contexts[str(context_data['tid'])] = context
+            if str(context_data['tid']) not in self.contexts:
+                self.contexts[str(context_data['tid'])] = Context(context_data['context'])
 
+            name = context_data['ptr']
             sym = ''
-            if 'pc' in context_data['context']:
-                name = context_data['ptr']
-                if 'symbol' in context_data['context']['pc'] and \
-                        context_data['context']['pc']['symbol']['name'] is not None:
-                    sym = context_data['context']['pc']['symbol']['moduleName']
-                    sym += ' - '
-                    sym += context_data['context']['pc']['symbol']['name']
-            else:
-                name = context_data['ptr']
+            if not context_data['is_java']:
+                # whatever is known locally, the hit carries no symbol
+                symbol = self._symbols.lookup(name, fetch=False)
+                if symbol is not None:
+                    sym = symbol['moduleName'] + ' - ' + symbol['name']
 
             self._app_window.threads.add_context(context_data, library_onload=self.loading_library)
             if self.loading_library is None and context_data['reason'] == 0:
@@ -712,6 +1383,8 @@ class Dwarf(QObject):
             self._arch = context_data['arch']
             self._platform = context_data['platform']
             self._pointer_size = context_data['pointerSize']
+            if 'pageSize' in context_data:
+                self._page_cache.page_size = context_data['pageSize']
             self.java_available = context_data['java']
             str_fmt = ('injected into := {0:d}'.format(self.pid))
             self.log(str_fmt)
@@ -723,7 +1396,21 @@ class Dwarf(QObject):
             self._loading_library = None
 
     def _on_destroyed(self):
+        self._page_cache.clear()
+        self._symbols.clear()
+        self._context_details.clear()
+        self._context_details_pending.clear()
+        self._rpc_worker.cancel_all()
+        if self._process_dumper is not None:
+            self._process_dumper.cancel()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.cancel()
+        if self._pointer_scan is not None:
+            self._pointer_scan.cancel()
+        self._async_callbacks.clear()
         self._reinitialize()
+        # after _reinitialize, requests still coming fail on the missing script
+        self.stop_workers()
         str_fmt = ('Detached from {0:d}. Script destroyed.'.format(self.pid))
         print(str_fmt)
         self.log(str_fmt)
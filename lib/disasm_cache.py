@@ -0,0 +1,111 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from capstone import Cs
+
+
+class DisasmCache(object):
+    """ decoded and resolved listings, lru evicted
+
+        a listing is keyed by (start address, arch, mode, hash of the code
+        bytes, decode options), so changed bytes never hit a stale entry.
+        entries overlapping patched, hooked or written memory are dropped
+        as well (page cache listener). capstone handles are pooled per arch
+        and mode: a handle isn't thread safe, so it's taken with capstone()
+        and given back with release() once the listing is decoded
+    """
+
+    MAX_ENTRIES = 64
+    # idle capstone handles kept per (arch, mode)
+    MAX_IDLE_HANDLES = 4
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (start, end, instructions)
+        self._entries = OrderedDict()
+        # (arch, mode) -> idle Cs
+        self._handles = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def capstone(self, arch, mode):
+        """ a Cs only the caller uses until it's given back with release()
+        """
+        with self._lock:
+            idle = self._handles.get((arch, mode))
+            if idle:
+                return idle.pop()
+        # CsError goes to the caller
+        md = Cs(arch, mode)
+        md.detail = True
+        return md
+
+    def release(self, md):
+        with self._lock:
+            idle = self._handles.setdefault((md.arch, md.mode), [])
+            if len(idle) < self.MAX_IDLE_HANDLES:
+                idle.append(md)
+
+    @staticmethod
+    def key(address, arch, mode, code, *options):
+        return (address, arch, mode, hashlib.blake2b(code, digest_size=16).digest()) + options
+
+    def get(self, key):
+        """ cached list of Instruction or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[2])
+
+    def put(self, key, instructions):
+        if not instructions:
+            return
+        start = instructions[0].address
+        end = instructions[-1].address + len(instructions[-1].bytes)
+        with self._lock:
+            self._entries[key] = (start, end, list(instructions))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ptr, length):
+        """ page cache listener, (0, 0) drops everything
+        """
+        with self._lock:
+            if ptr == 0 and length == 0:
+                self._entries.clear()
+                return
+            end = ptr + max(length, 1)
+            for key in [key for key, entry in self._entries.items() if entry[0] < end and ptr < entry[1]]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,115 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from capstone import CsError, CS_GRP_RET
+
+from lib.instruction import Instruction
+from lib.range import Range
+
+
+class DisassembleThread(QThread):
+    """ decodes a range off the gui thread
+
+        instructions are resolved (symbols, strings) and pushed a chunk at a
+        time. the first chunk is small so the view fills right away
+    """
+
+    FIRST_CHUNK = 32
+    CHUNK = 128
+
+    # job id, list of Instruction
+    onChunk = pyqtSignal(int, object, name='onChunk')
+    onFinished = pyqtSignal(int, name='onFinished')
+    onError = pyqtSignal(int, str, name='onError')
+
+    def __init__(self, dwarf, job, dwarf_range, arch, mode, num_instructions=256, stop_on_ret=True, parent=None):
+        super().__init__(parent=parent)
+        self._dwarf = dwarf
+        self.job = job
+        self._range = dwarf_range
+        self._arch = arch
+        self._mode = mode
+        self._num_instructions = num_instructions
+        self._stop_on_ret = stop_on_ret
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _flush(self, chunk):
+        # symbols and strings for the whole chunk in one round trip
+        Instruction.resolve_batch(self._dwarf, chunk)
+        if not self._cancel.is_set():
+            self.onChunk.emit(self.job, chunk)
+
+    def run(self):
+        cache = self._dwarf.disasm_cache
+        # only the bytes the listing can cover, a lazy range stays lazy
+        code = self._range.read(self._range.start_offset,
+                                (self._num_instructions + 1) * Range.MAX_INSTRUCTION_SIZE)
+        key = cache.key(self._range.start_address, self._arch, self._mode, code,
+                        self._num_instructions, self._stop_on_ret)
+        instructions = cache.get(key)
+        if instructions is not None:
+            self.onChunk.emit(self.job, instructions)
+            self.onFinished.emit(self.job)
+            return
+
+        try:
+            capstone = cache.capstone(self._arch, self._mode)
+        except CsError:
+            self.onError.emit(self.job, 'failed to initialize capstone with %d, %d' % (self._arch, self._mode))
+            return
+
+        try:
+            instructions = self._decode(capstone, code)
+        finally:
+            cache.release(capstone)
+        if instructions is not None:
+            cache.put(key, instructions)
+            self.onFinished.emit(self.job)
+
+    def _decode(self, capstone, code):
+        """ decoded instructions, flushed in chunks on the way, None when cancelled
+        """
+        instructions = []
+        chunk = []
+        chunk_size = DisassembleThread.FIRST_CHUNK
+        for cap_inst in capstone.disasm(code, self._range.start_address):
+            if self._cancel.is_set():
+                return None
+            if len(instructions) + len(chunk) > self._num_instructions:
+                break
+
+            chunk.append(Instruction(self._dwarf, cap_inst, resolve=False))
+
+            if self._stop_on_ret and cap_inst.group(CS_GRP_RET):
+                break
+            if len(chunk) >= chunk_size:
+                self._flush(chunk)
+                instructions.extend(chunk)
+                chunk = []
+                chunk_size = DisassembleThread.CHUNK
+
+        if chunk and not self._cancel.is_set():
+            self._flush(chunk)
+            instructions.extend(chunk)
+        if self._cancel.is_set():
+            return None
+        return instructions
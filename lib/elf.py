@@ -119,10 +119,12 @@ class ELF:
     def __init__(self, data):
         self.bits = 32 if data[4] == 1 else 64
 
+        self.e_type = int.from_bytes(data[0x10:0x12], 'little')
+        self.e_entry = int.from_bytes(data[0x18:int(0x18+self.bits/8)], 'little')
         _b = 0x1c if self.bits == 32 else 0x20
         self.e_phoff = int.from_bytes(data[_b:int(_b+self.bits/8)], 'little')
         _b = 0x20 if self.bits == 32 else 0x28
-        self.e_shoff = int.from_bytes(data[_b:int(_b+_b/8)], 'little')
+        self.e_shoff = int.from_bytes(data[_b:int(_b+self.bits/8)], 'little')
 
         _b = 0x2a if self.bits == 32 else 0x36
         self.e_phentsize = int.from_bytes(data[_b:_b+2], 'little')
@@ -139,12 +141,76 @@ class ELF:
         for i in range(self.e_phnum):
             self.program_headers.append(ProgramHeader(
                 self.bits, elf[i * self.e_phentsize:i * self.e_phentsize + self.e_phentsize]))
-        elf = elf[self.e_shoff:]
+        elf = data[self.e_shoff:]
         self.section_headers = []
         for i in range(self.e_shnum):
             self.section_headers.append(SectionHeader(
                 self.bits, elf[i * self.e_shentsize:i * self.e_shentsize + self.e_shentsize]))
 
+    def load_bias(self):
+        """ lowest PT_LOAD vaddr, what the module base maps to
+        """
+        loads = [header.p_vaddr for header in self.program_headers if header.type == 'PT_LOAD']
+        if not loads:
+            return 0
+        return min(loads) & ~0xfff
+
+    def dynamic(self, image):
+        """ {d_tag: [d_val, ...]} of PT_DYNAMIC
+
+            image is the module as mapped in memory, offsets are vaddr - load bias
+        """
+        entries = {}
+        bias = self.load_bias()
+        len_ = int(self.bits / 8)
+        for header in self.program_headers:
+            if header.type != 'PT_DYNAMIC':
+                continue
+            start = header.p_vaddr - bias
+            table = image[start:start + header.p_memsz]
+            for i in range(0, len(table) - 2 * len_ + 1, 2 * len_):
+                d_tag = int.from_bytes(table[i:i + len_], 'little')
+                if d_tag == 0:
+                    # DT_NULL
+                    break
+                entries.setdefault(d_tag, []).append(int.from_bytes(table[i + len_:i + 2 * len_], 'little'))
+        return entries
+
+    def symbols(self, data):
+        """ [(vaddr, name)] of the defined functions and objects in .symtab and .dynsym
+
+            data must be the whole file, section headers aren't mapped in memory
+        """
+        symbols = []
+        for header in self.section_headers:
+            if header.sh_type not in ('SHT_SYMTAB', 'SHT_DYNSYM'):
+                continue
+            if header.sh_link >= len(self.section_headers):
+                continue
+            strtab = self.section_headers[header.sh_link]
+            strings = data[strtab.sh_offset:strtab.sh_offset + strtab.sh_size]
+            entry_size = header.sh_entsize or (16 if self.bits == 32 else 24)
+            table = data[header.sh_offset:header.sh_offset + header.sh_size]
+            for i in range(0, len(table) - entry_size + 1, entry_size):
+                entry = table[i:i + entry_size]
+                st_name = int.from_bytes(entry[0:4], 'little')
+                if self.bits == 32:
+                    st_value = int.from_bytes(entry[4:8], 'little')
+                    st_info = entry[12]
+                    st_shndx = int.from_bytes(entry[14:16], 'little')
+                else:
+                    st_info = entry[4]
+                    st_shndx = int.from_bytes(entry[6:8], 'little')
+                    st_value = int.from_bytes(entry[8:16], 'little')
+                # STT_OBJECT, STT_FUNC
+                if st_value == 0 or st_shndx == 0 or (st_info & 0xf) not in (1, 2):
+                    continue
+                end = strings.find(b'\x00', st_name)
+                name = strings[st_name:end if end >= 0 else len(strings)].decode('utf-8', 'replace')
+                if name:
+                    symbols.append((st_value, name))
+        return symbols
+
     @staticmethod
     def build(data):
         if ELF.is_valid_elf(data):
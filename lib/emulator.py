@@ -307,7 +307,7 @@ class Emulator(QThread):
             return 301
 
         try:
-            self.uc.mem_write(range_.base, range_.data)
+            self.uc.mem_write(range_.base, bytes(range_.data))
         except Exception as e:
             self.dwarf.log(e)
             return 302
@@ -336,6 +336,8 @@ class Emulator(QThread):
         self.context = None
 
         if str(tid) in self.dwarf.contexts:
+            # thumb mode of pc comes with the details
+            self.dwarf.context_details(tid)
             self.context = self.dwarf.contexts[str(tid)]
 
         if self.context is None:
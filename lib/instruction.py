@@ -21,7 +21,7 @@ from capstone.x86_const import *
 
 
 class Instruction(object):
-    def __init__(self, dwarf, instruction):
+    def __init__(self, dwarf, instruction, resolve=True):
         self.id = instruction.id
         self.address = instruction.address
 
@@ -50,21 +50,35 @@ class Instruction(object):
                     #    self.is_jump = True
                     self.jump_address = op.value.imm
 
-        # resolve jump symbol
         self.symbol_name = None
         self.symbol_module = None
-        if self.jump_address != 0:
-            sym = dwarf.dwarf_api('getSymbolByAddress', self.jump_address)
-            if sym is not None:
-                self.symbol_name = sym['name']
-                self.symbol_module = '-'
-                if 'moduleName' in sym:
-                    self.symbol_module = sym['moduleName']
-
         self.string = None
-        if len(instruction.operands) > 0:
-            for op in instruction.operands:
-                if op.type == CS_OP_IMM:
-                    self.string = dwarf.dwarf_api('readString', op.value.imm)
-                    # if len([x for x in self.string if not x.isprintable()]) > 0:
-                    #self.string = None
+
+        if resolve:
+            Instruction.resolve_batch(dwarf, [self])
+
+    def _apply_resolved(self, sym, string):
+        if sym is not None:
+            self.symbol_name = sym['name']
+            self.symbol_module = '-'
+            if 'moduleName' in sym:
+                self.symbol_module = sym['moduleName']
+        self.string = string
+        # if len([x for x in self.string if not x.isprintable()]) > 0:
+        #self.string = None
+
+    @staticmethod
+    def resolve_batch(dwarf, instructions):
+        """ resolve jump symbols locally and strings of many instructions in one telescope call
+        """
+        # the last imm operand is both the jump target and the string candidate
+        pending = [instruction for instruction in instructions if instruction.jump_address != 0]
+        if not pending:
+            return
+
+        chains = dwarf.telescope([instruction.jump_address for instruction in pending])
+        for instruction, chain in zip(pending, chains):
+            string = None
+            if chain and chain[0][0] == 0:
+                string = chain[0][1]
+            instruction._apply_resolved(dwarf.symbols.lookup(instruction.jump_address), string)
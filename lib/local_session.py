@@ -125,11 +125,11 @@ class LocalSession(Session):
         if not self.dwarf.resumed:
             self.dwarf.dwarf_api('resume')
 
+        self.dwarf.dwarf_api('release', tid)
+
         if tid == 0:
             self.dwarf.contexts.clear()
 
-        self.dwarf.dwarf_api('release', tid)
-
     def _on_proc_restart(self):
         self.dwarf.dwarf_api('restart')
         self._on_proc_resume()
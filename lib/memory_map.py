@@ -0,0 +1,99 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import threading
+
+
+class MemoryMap(object):
+    """ local copy of the target memory map
+
+        ranges are agent dicts ({'base': '0x...', 'size', 'protection', 'file'})
+        kept sorted by base next to a list of the int bases, so address
+        lookups are a bisect instead of a getRange round trip. the map is
+        filled from the full ranges list and then patched with the deltas
+        the agent sends when the map changes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bases = []
+        self._ranges = []
+
+    def __len__(self):
+        return len(self._ranges)
+
+    @property
+    def ranges(self):
+        with self._lock:
+            return list(self._ranges)
+
+    def set_ranges(self, ranges):
+        entries = sorted(((int(_range['base'], 16), _range) for _range in ranges), key=lambda entry: entry[0])
+        with self._lock:
+            self._bases = [entry[0] for entry in entries]
+            self._ranges = [entry[1] for entry in entries]
+
+    def apply_delta(self, added, removed):
+        """ removed holds the bases of ranges gone or changed, added the new
+            or changed ranges
+        """
+        with self._lock:
+            for base in removed:
+                self._remove(int(base, 16) if isinstance(base, str) else base)
+            for _range in added:
+                self._insert(_range)
+
+    def add(self, _range):
+        """ add or replace a single range, i.e. a getRange answer
+        """
+        with self._lock:
+            self._insert(_range)
+
+    def _remove(self, base):
+        i = bisect.bisect_left(self._bases, base)
+        if i < len(self._bases) and self._bases[i] == base:
+            del self._bases[i]
+            del self._ranges[i]
+
+    def _insert(self, _range):
+        base = int(_range['base'], 16)
+        end = base + _range['size']
+        # drop whatever the new range covers
+        first = bisect.bisect_left(self._bases, base)
+        if first > 0 and self._bases[first - 1] + self._ranges[first - 1]['size'] > base:
+            first -= 1
+        last = bisect.bisect_left(self._bases, end)
+        del self._bases[first:last]
+        del self._ranges[first:last]
+        self._bases.insert(first, base)
+        self._ranges.insert(first, _range)
+
+    def find(self, address):
+        """ range holding address or None
+        """
+        with self._lock:
+            i = bisect.bisect_right(self._bases, address) - 1
+            if i >= 0 and address < self._bases[i] + self._ranges[i]['size']:
+                return self._ranges[i]
+        return None
+
+    def is_valid_pointer(self, address):
+        return address > 0 and self.find(address) is not None
+
+    def is_readable(self, address):
+        _range = self.find(address)
+        return _range is not None and 'r' in _range['protection']
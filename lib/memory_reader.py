@@ -0,0 +1,141 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class MemoryReadResult(object):
+    def __init__(self, ptr, data):
+        self.ptr = ptr
+        # bytearray, unreadable holes are left zeroed
+        self.data = data
+        # sorted list of [address, size] which couldn't be read
+        self.holes = []
+        self.cancelled = False
+
+    @property
+    def complete(self):
+        return not self.holes and not self.cancelled
+
+    def add_hole(self, address, size):
+        if self.holes and self.holes[-1][0] + self.holes[-1][1] == address:
+            self.holes[-1][1] += size
+        else:
+            self.holes.append([address, size])
+
+
+class MemoryReader(object):
+    """ large target reads
+
+        the destination buffer is allocated once and filled through a
+        memoryview while several chunk requests are in flight. a failed chunk
+        is retried page by page so a single bad page costs a hole instead of
+        the whole read
+
+        reader(ptr, length) -> bytes like or None
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    MAX_IN_FLIGHT = 4
+
+    def __init__(self, reader, page_size=0x1000, chunk_size=CHUNK_SIZE, max_in_flight=MAX_IN_FLIGHT):
+        self._reader = reader
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight
+
+    def _read_chunk(self, view, ptr, offset, size):
+        """ returns a list of holes found in [ptr + offset, ptr + offset + size)
+        """
+        data = self._reader(ptr + offset, size)
+        if data is not None and len(data) == size:
+            view[offset:offset + size] = data
+            return []
+
+        holes = []
+        address = ptr + offset
+        end = address + size
+        while address < end:
+            page_end = min(address - (address % self.page_size) + self.page_size, end)
+            length = page_end - address
+            data = self._reader(address, length)
+            if data is not None and len(data) == length:
+                view[address - ptr:address - ptr + length] = data
+            else:
+                holes.append((address, length))
+            address = page_end
+        return holes
+
+    def read(self, ptr, length, progress=None, cancel=None):
+        """
+        :param progress: progress(done_bytes, total_bytes), called from the reading threads
+        :param cancel: threading.Event, stops issuing new chunks once set
+        :return: MemoryReadResult
+        """
+        data = bytearray(length)
+        view = memoryview(data)
+        result = MemoryReadResult(ptr, data)
+        if cancel is None:
+            cancel = threading.Event()
+
+        chunks = [(offset, min(self.chunk_size, length - offset))
+                  for offset in range(0, length, self.chunk_size)]
+        holes = []
+        done = 0
+
+        if len(chunks) <= 1:
+            for offset, size in chunks:
+                holes.extend(self._read_chunk(view, ptr, offset, size))
+                done += size
+                if progress is not None:
+                    progress(done, length)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+                pending = {}
+                next_chunk = 0
+                while next_chunk < len(chunks) or pending:
+                    while next_chunk < len(chunks) and len(pending) < self.max_in_flight \
+                            and not cancel.is_set():
+                        offset, size = chunks[next_chunk]
+                        future = executor.submit(self._read_chunk, view, ptr, offset, size)
+                        pending[future] = (offset, size)
+                        next_chunk += 1
+                    if not pending:
+                        # cancelled before anything was issued
+                        result.cancelled = next_chunk < len(chunks)
+                        break
+
+                    finished, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        offset, size = pending.pop(future)
+                        try:
+                            holes.extend(future.result())
+                        except Exception:  # pylint: disable=broad-except
+                            # treat the whole chunk as unreadable
+                            holes.append((ptr + offset, size))
+                        done += size
+                        if progress is not None:
+                            progress(done, length)
+
+                    if cancel.is_set() and next_chunk < len(chunks):
+                        result.cancelled = True
+                        next_chunk = len(chunks)
+
+        view.release()
+        for address, size in sorted(holes):
+            result.add_hole(address, size)
+        return result
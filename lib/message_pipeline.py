@@ -0,0 +1,255 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import queue
+import struct
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from lib import protocol
+from lib.context import Context
+
+
+class MessagePipeline(QThread):
+    """ frida thread -> decoder thread -> gui thread
+
+        the frida thread only enqueues raw frames. the decoder parses them
+        into ready model objects (Context, module/range lists, coalesced
+        tracer batches) and parks them in a bounded ready queue. the gui
+        drains that queue in slices when onMessagesReady fires.
+
+        the frida thread never blocks here: api results are resolved before
+        reaching the pipeline (see Dwarf._on_message) and a thread waiting
+        for one may be the gui itself. once max_pending frames are waiting,
+        frames of DROPPABLE types are dropped, everything else is still
+        queued, and back pressure is reported. the ready queue is bounded,
+        a slow gui stalls the decoder only. drops and stalls are counted in
+        stats()
+    """
+
+    onMessagesReady = pyqtSignal(name='onMessagesReady')
+    onBackPressure = pyqtSignal(dict, name='onBackPressure')
+
+    # frame types lost without harm when the decoder falls behind
+    DROPPABLE = ('tracer', 'ftrace', 'java_trace', 'memoryscan_progress')
+    # max tracer events merged in a single batch
+    MAX_TRACE_BATCH = 4096
+    # seconds between two back pressure notifications
+    BACK_PRESSURE_INTERVAL = 1.0
+
+    def __init__(self, parent=None, max_pending=1024, max_ready=1024):
+        super().__init__(parent=parent)
+        # unbounded, max_pending is where droppable frames start being dropped
+        self._pending = queue.Queue()
+        self._max_pending = max_pending
+        self._ready = queue.Queue(maxsize=max_ready)
+        self._running = True
+        self._notified = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._last_back_pressure = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                'received': 0,
+                'decoded': 0,
+                'delivered': 0,
+                'errors': 0,
+                'pending_high_water': 0,
+                'ready_high_water': 0,
+                'producer_stalls': 0,
+                'dropped': 0,
+                'decoder_stalls': 0,
+                'coalesced_traces': 0,
+                'decode_time': 0.0
+            }
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._pending.qsize()
+        stats['ready'] = self._ready.qsize()
+        if stats['decoded'] > 0:
+            stats['avg_decode_us'] = stats['decode_time'] / stats['decoded'] * 1e6
+        else:
+            stats['avg_decode_us'] = 0.0
+        return stats
+
+    def _bump(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _high_water(self, key, value):
+        with self._stats_lock:
+            if value > self._stats[key]:
+                self._stats[key] = value
+
+    def enqueue(self, message, data):
+        """ called from the frida thread
+        """
+        self._bump('received')
+        if self._pending.qsize() >= self._max_pending:
+            self._bump('producer_stalls')
+            self._notify_back_pressure()
+            if protocol.peek_type(data) in MessagePipeline.DROPPABLE:
+                self._bump('dropped')
+                return
+        self._pending.put_nowait((message, data))
+        self._high_water('pending_high_water', self._pending.qsize())
+
+        if not self.isRunning():
+            self._running = True
+            self.start()
+
+    def drain(self, max_items=256):
+        """ called from the gui thread. returns up to max_items decoded entries,
+            the entries are either protocol.Message or (message, None) for
+            non dwarf payloads
+        """
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self._ready.get_nowait())
+            except queue.Empty:
+                break
+        self._bump('delivered', len(items))
+        if self._ready.empty():
+            self._notified.clear()
+        # re-check after clearing, the decoder may have published meanwhile
+        if not self._ready.empty():
+            self._notified.set()
+            self.onMessagesReady.emit()
+        return items
+
+    def stop(self):
+        """ stop the decoder and wait for it, undelivered messages are dropped.
+            the next enqueue starts it again
+        """
+        self._running = False
+        self._pending.put_nowait(None)
+        self.wait()
+        for pending in (self._pending, self._ready):
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+        self._notified.clear()
+
+    def run(self):
+        carry = None
+        while self._running:
+            if carry is not None:
+                item, carry = carry, None
+            else:
+                item = self._pending.get()
+            if item is None:
+                continue
+
+            started = time.perf_counter()
+            if isinstance(item, protocol.Message):
+                msg = item
+            else:
+                message, data = item
+                if not protocol.is_frame(message, data):
+                    self._publish((message, None))
+                    continue
+                try:
+                    msg = protocol.decode(data)
+                except protocol.ProtocolError as e:
+                    self._bump('errors')
+                    print('message pipeline: ' + str(e))
+                    continue
+
+            try:
+                self._build_model(msg)
+            except Exception as e:  # pylint: disable=broad-except
+                self._bump('errors')
+                print('message pipeline: ' + str(e))
+                continue
+
+            if msg.type == 'tracer':
+                carry = self._coalesce_trace(msg)
+
+            self._bump('decoded')
+            self._bump('decode_time', time.perf_counter() - started)
+            self._publish(msg)
+
+    def _build_model(self, msg):
+        if msg.type == 'set_context' and 'context' in msg.meta:
+            msg.model = Context(msg.meta['context'])
+        elif msg.type == 'memoryscan_batch':
+            raw = msg.raw or b''
+            if msg.meta.get('needles', False):
+                # raw u64 address, u32 needle index
+                hits = list(struct.iter_unpack('<QI', raw))
+                msg.model = ([hit[0] for hit in hits], [hit[1] for hit in hits])
+            else:
+                # raw u64 addresses
+                msg.model = (list(struct.unpack('<%dQ' % (len(raw) // 8), raw)), [])
+
+    def _coalesce_trace(self, msg):
+        # merge tracer frames waiting right behind this one. whatever else is
+        # found is handed back to run() as carry
+        while len(msg.meta) < MessagePipeline.MAX_TRACE_BATCH:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                return None
+            if item is None:
+                return None
+            message, data = item
+            if not protocol.is_frame(message, data):
+                return item
+            try:
+                following = protocol.decode(data)
+            except protocol.ProtocolError:
+                self._bump('errors')
+                continue
+            if following.type != 'tracer' or following.tid != msg.tid:
+                return following
+            msg.meta.extend(following.meta)
+            self._bump('coalesced_traces')
+        return None
+
+    def _publish(self, item):
+        try:
+            self._ready.put_nowait(item)
+        except queue.Full:
+            self._bump('decoder_stalls')
+            self._notify_back_pressure()
+            while True:
+                try:
+                    self._ready.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    if not self._running:
+                        # stopping, the gui may be waiting for us instead of draining
+                        return
+        self._high_water('ready_high_water', self._ready.qsize())
+        if not self._notified.is_set():
+            self._notified.set()
+            self.onMessagesReady.emit()
+
+    def _notify_back_pressure(self):
+        now = time.monotonic()
+        if now - self._last_back_pressure >= MessagePipeline.BACK_PRESSURE_INTERVAL:
+            self._last_back_pressure = now
+            self.onBackPressure.emit(self.stats())
@@ -0,0 +1,188 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+
+class PageCache(object):
+    """ process wide cache of target memory pages
+
+        pages are keyed by their aligned address and evicted lru once the
+        byte budget is exceeded. missing pages are fetched in contiguous runs
+        through the reader callback: reader(ptr, length) -> bytes or None
+
+        the cache can't see the target writing its own memory, so the owner
+        drops writable pages whenever threads run again (drop_writable)
+        and invalidates explicitly on patches, hooks and watcher hits
+    """
+
+    DEFAULT_PAGE_SIZE = 0x1000
+    DEFAULT_BUDGET = 64 * 1024 * 1024
+
+    def __init__(self, reader, page_size=DEFAULT_PAGE_SIZE, budget=DEFAULT_BUDGET):
+        self._reader = reader
+        self._page_size = page_size
+        self._budget = budget
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+        # sorted [start, end) spans of writable ranges
+        self._writable_starts = []
+        self._writable_ends = []
+
+        self._listeners = []
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def page_size(self):
+        return self._page_size
+
+    @page_size.setter
+    def page_size(self, value):
+        if value and value != self._page_size:
+            self.clear()
+            self._page_size = value
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, value):
+        self._budget = value
+        with self._lock:
+            self._evict()
+
+    def size(self):
+        return len(self._pages) * self._page_size
+
+    def add_listener(self, listener):
+        """ listener(ptr, length) is called on every invalidation,
+            (0, 0) means everything
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, ptr, length):
+        for listener in self._listeners:
+            listener(ptr, length)
+
+    def set_ranges(self, ranges):
+        """ remember which spans are writable, from the agent ranges list
+        """
+        spans = []
+        for _range in ranges:
+            if 'w' in _range['protection']:
+                base = int(_range['base'], 16)
+                spans.append((base, base + _range['size']))
+        spans.sort()
+        with self._lock:
+            self._writable_starts = [span[0] for span in spans]
+            self._writable_ends = [span[1] for span in spans]
+
+    def _is_writable(self, page):
+        i = bisect.bisect_right(self._writable_starts, page) - 1
+        return i >= 0 and page < self._writable_ends[i]
+
+    def read(self, ptr, length):
+        if length <= 0:
+            return bytes()
+
+        # huge reads would just flush the cache
+        if length > self._budget // 4:
+            return self._reader(ptr, length)
+
+        page_size = self._page_size
+        first = ptr - (ptr % page_size)
+        last = (ptr + length - 1) - ((ptr + length - 1) % page_size)
+
+        pages = {}
+        missing = []
+        with self._lock:
+            for page in range(first, last + page_size, page_size):
+                data = self._pages.get(page, None)
+                if data is None:
+                    missing.append(page)
+                else:
+                    self._pages.move_to_end(page)
+                    pages[page] = data
+        self.hits += len(pages)
+        self.misses += len(missing)
+
+        if missing:
+            fetched = self._fetch(missing)
+            if fetched is None:
+                return None
+            pages.update(fetched)
+
+        data = b''.join(pages[page] for page in range(first, last + page_size, page_size))
+        offset = ptr - first
+        return data[offset:offset + length]
+
+    def _fetch(self, missing):
+        page_size = self._page_size
+        fetched = {}
+
+        # group into contiguous runs
+        runs = []
+        for page in missing:
+            if runs and runs[-1][1] == page:
+                runs[-1][1] = page + page_size
+            else:
+                runs.append([page, page + page_size])
+
+        for start, end in runs:
+            data = self._reader(start, end - start)
+            if data is None or len(data) != end - start:
+                # a page in the run is unreadable
+                return None
+            for page in range(start, end, page_size):
+                fetched[page] = bytes(data[page - start:page - start + page_size])
+
+        with self._lock:
+            for page, data in fetched.items():
+                self._pages[page] = data
+            self._evict()
+        return fetched
+
+    def _evict(self):
+        max_pages = max(1, self._budget // self._page_size)
+        while len(self._pages) > max_pages:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, ptr, length=1):
+        page_size = self._page_size
+        first = ptr - (ptr % page_size)
+        with self._lock:
+            for page in range(first, ptr + max(length, 1), page_size):
+                self._pages.pop(page, None)
+        self._notify(ptr, length)
+
+    def drop_writable(self):
+        with self._lock:
+            dropped = [page for page in self._pages if self._is_writable(page)]
+            for page in dropped:
+                del self._pages[page]
+        for page in dropped:
+            self._notify(page, self._page_size)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+        self._notify(0, 0)
@@ -0,0 +1,392 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from lib import utils
+from lib.process_dump import ProcessDump, ProcessDumpWriter, dump_ranges
+
+# next to the dump (see lib/process_dump.py) of the readable ranges:
+#
+#   pointers.bin   - every pointer sized value pointing into a dumped range,
+#                    sorted ('Q' or 'I' depending on the pointer size)
+#   locations.bin  - address holding each of those values ('Q')
+POINTERS_FILE = 'pointers.bin'
+LOCATIONS_FILE = 'locations.bin'
+
+# targets handed to a worker at once
+FRONTIER_CHUNK = 4096
+
+# the index loaded in each worker process
+_index = {}
+
+
+def _typecode(pointer_size):
+    return 'Q' if pointer_size == 8 else 'I'
+
+
+def _collect_pointers(path, entries, starts, ends, pointer_size):
+    """ worker: (values, locations) of the valid pointers held in entries
+    """
+    typecode = _typecode(pointer_size)
+    values = array(typecode)
+    locations = array('Q')
+    low, high = starts[0], ends[-1]
+    with ProcessDump(path) as dump:
+        for entry in entries:
+            base = int(entry['base'], 16)
+            skip = (-base) % pointer_size
+            usable = (entry['size'] - skip) // pointer_size * pointer_size
+            if usable <= 0:
+                continue
+            view = dump.view(entry)
+            words = view[skip:skip + usable]
+            data = array(typecode)
+            data.frombytes(words)
+            words.release()
+            view.release()
+            if sys.byteorder != 'little':
+                data.byteswap()
+
+            start = base + skip
+            for i, value in enumerate(data):
+                if low <= value < high:
+                    j = bisect.bisect_right(starts, value) - 1
+                    if j >= 0 and value < ends[j]:
+                        values.append(value)
+                        locations.append(start + i * pointer_size)
+    return values.tobytes(), locations.tobytes()
+
+
+def _load_index(path, pointer_size):
+    """ worker initializer
+    """
+    values = array(_typecode(pointer_size))
+    locations = array('Q')
+    with open(os.path.join(path, POINTERS_FILE), 'rb') as f:
+        values.frombytes(f.read())
+    with open(os.path.join(path, LOCATIONS_FILE), 'rb') as f:
+        locations.frombytes(f.read())
+    _index['values'] = values
+    _index['locations'] = locations
+
+
+def _find_referrers(targets, max_offset):
+    """ worker: [(target index, location, offset)] of the pointers to
+        [target - max_offset, target]
+    """
+    values = _index['values']
+    locations = _index['locations']
+    found = []
+    for i, target in enumerate(targets):
+        first = bisect.bisect_left(values, max(target - max_offset, 0))
+        last = bisect.bisect_right(values, target)
+        for j in range(first, last):
+            found.append((i, locations[j], target - values[j]))
+    return found
+
+
+class PointerPath(object):
+    """ module+offset -> +offset -> ... -> target
+
+        read a pointer at module base + offset, add the first offset,
+        read a pointer there, add the next offset and so on
+    """
+
+    def __init__(self, module, offset, offsets):
+        self.module = module
+        self.offset = offset
+        self.offsets = list(offsets)
+
+    def __str__(self):
+        return ' -> '.join(['%s+0x%x' % (self.module, self.offset)] + ['+0x%x' % off for off in self.offsets])
+
+    def to_json(self):
+        return {'module': self.module, 'offset': self.offset, 'offsets': self.offsets}
+
+    @staticmethod
+    def from_json(data):
+        return PointerPath(data['module'], data['offset'], data['offsets'])
+
+    def resolve(self, read_pointer, module_base):
+        """ address the path leads to, None if a link can't be read
+        """
+        address = module_base + self.offset
+        for offset in self.offsets:
+            address = read_pointer(address)
+            if address is None:
+                return None
+            address += offset
+        return address
+
+
+class PointerScanner(object):
+    """ multi level pointer paths from module bases to a target address
+
+        the readable ranges are dumped once, then every aligned pointer sized
+        value pointing into a dumped range goes in an index sorted by value.
+        a breadth first search walks back from the target: the referrers of
+        t are the binary searched values in [t - max_offset, t]. locations
+        inside a module end a path, the others make the next level.
+        building the index and every search level run in a process pool
+    """
+
+    class PointerScanError(Exception):
+        """ Raised when the scan can't run or a path file can't be read
+        """
+
+    def __init__(self, dwarf, path, max_depth=5, max_offset=0x1000, max_results=1000,
+                 max_frontier=1000000, workers=None):
+        self._dwarf = dwarf
+        self.path = path
+        self.max_depth = max_depth
+        self.max_offset = max_offset
+        self.max_results = max_results
+        self.max_frontier = max_frontier
+        self.workers = workers or max(os.cpu_count() or 1, 1)
+        self.pointer_size = dwarf.pointer_size
+        self.modules = []
+        self._module_bases = []
+
+    def _executor(self, **kwargs):
+        # spawn: we are a thread of a qt process
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context('spawn'), **kwargs)
+
+    def _set_modules(self, modules):
+        self.modules = sorted(({'name': module['name'], 'base': utils.parse_ptr(module['base']),
+                                'size': module['size']} for module in modules),
+                              key=lambda module: module['base'])
+        self._module_bases = [module['base'] for module in self.modules]
+
+    def module_at(self, address):
+        i = bisect.bisect_right(self._module_bases, address) - 1
+        if i >= 0 and address < self._module_bases[i] + self.modules[i]['size']:
+            return self.modules[i]
+        return None
+
+    def build_index(self, cancel=None, progress=None):
+        """ dump the readable ranges and index the pointers they hold
+
+        :param progress: progress(done, total)
+        :return: number of pointers
+        """
+        ranges = self._dwarf.dwarf_api('getRanges')
+        modules = self._dwarf.dwarf_api('getModules')
+        if not ranges or not modules:
+            raise PointerScanner.PointerScanError('unable to retrieve ranges and modules')
+        self._set_modules(modules)
+        ranges = [_range for _range in ranges if 'r' in _range['protection']]
+
+        try:
+            writer = ProcessDumpWriter(self.path, pid=self._dwarf.pid,
+                                       page_size=self._dwarf.page_cache.page_size)
+        except OSError as e:
+            raise PointerScanner.PointerScanError(str(e))
+        try:
+            dump_ranges(self._dwarf, ranges, writer, cancel=cancel, progress=progress)
+        except OSError as e:
+            raise PointerScanner.PointerScanError(str(e))
+        finally:
+            writer.close()
+        if cancel is not None and cancel.is_set():
+            raise PointerScanner.PointerScanError('cancelled')
+
+        with ProcessDump(self.path) as dump:
+            entries = dump.ranges
+        if not entries:
+            raise PointerScanner.PointerScanError('nothing was dumped')
+        starts = [int(entry['base'], 16) for entry in entries]
+        ends = [start + entry['size'] for start, entry in zip(starts, entries)]
+
+        # about the same amount of bytes per worker
+        total = sum(entry['size'] for entry in entries)
+        share = total // self.workers + 1
+        jobs = [[]]
+        size = 0
+        for entry in entries:
+            if size >= share:
+                jobs.append([])
+                size = 0
+            jobs[-1].append(entry)
+            size += entry['size']
+
+        typecode = _typecode(self.pointer_size)
+        values = array(typecode)
+        locations = array('Q')
+        with self._executor() as executor:
+            futures = [executor.submit(_collect_pointers, self.path, job, starts, ends, self.pointer_size)
+                       for job in jobs]
+            for future in futures:
+                job_values, job_locations = future.result()
+                values.frombytes(job_values)
+                locations.frombytes(job_locations)
+
+        order = sorted(range(len(values)), key=values.__getitem__)
+        values = array(typecode, (values[i] for i in order))
+        locations = array('Q', (locations[i] for i in order))
+        with open(os.path.join(self.path, POINTERS_FILE), 'wb') as f:
+            values.tofile(f)
+        with open(os.path.join(self.path, LOCATIONS_FILE), 'wb') as f:
+            locations.tofile(f)
+        return len(values)
+
+    def scan(self, target, cancel=None, progress=None):
+        """ pointer paths leading to target, build_index first
+
+        :param progress: progress(depth, max_depth)
+        :return: list of PointerPath
+        """
+        target = utils.parse_ptr(target)
+        # search tree: node 0 is the target, the others are locations pointing
+        # near their parent, offset is what's added to the read pointer
+        parents = array('q', [-1])
+        offsets = array('Q', [0])
+        addresses = array('Q', [target])
+        visited = {target}
+        results = []
+
+        frontier = [0]
+        with self._executor(initializer=_load_index, initargs=(self.path, self.pointer_size)) as executor:
+            for depth in range(self.max_depth):
+                if not frontier or (cancel is not None and cancel.is_set()):
+                    break
+                chunks = [frontier[i:i + FRONTIER_CHUNK] for i in range(0, len(frontier), FRONTIER_CHUNK)]
+                futures = [executor.submit(_find_referrers, [addresses[node] for node in chunk], self.max_offset)
+                           for chunk in chunks]
+
+                next_frontier = []
+                for chunk, future in zip(chunks, futures):
+                    for i, location, offset in future.result():
+                        node = chunk[i]
+                        module = self.module_at(location)
+                        if module is not None:
+                            path = [offset]
+                            while node > 0:
+                                path.append(offsets[node])
+                                node = parents[node]
+                            results.append(PointerPath(module['name'], location - module['base'], path))
+                            if len(results) >= self.max_results:
+                                return results
+                            continue
+                        if location in visited:
+                            continue
+                        visited.add(location)
+                        parents.append(node)
+                        offsets.append(offset)
+                        addresses.append(location)
+                        next_frontier.append(len(addresses) - 1)
+
+                frontier = next_frontier[:self.max_frontier]
+                if progress is not None:
+                    progress(depth + 1, self.max_depth)
+        return results
+
+    def save(self, file_path, target, paths):
+        with open(file_path, 'w') as f:
+            json.dump({
+                'pointer_size': self.pointer_size,
+                'target': hex(utils.parse_ptr(target)),
+                'paths': [path.to_json() for path in paths]
+            }, f, indent=2)
+
+    @staticmethod
+    def load(file_path):
+        """ (target, paths) saved by save
+        """
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            return int(data['target'], 16), [PointerPath.from_json(path) for path in data['paths']]
+        except (OSError, ValueError, KeyError) as e:
+            raise PointerScanner.PointerScanError(str(e))
+
+    @staticmethod
+    def recheck(dwarf, paths, target=None):
+        """ resolve paths against the running target, a later run of the
+            process usually. paths of missing modules resolve to None
+
+        :return: [(path, address)], only the paths leading to target if given
+        """
+        modules = dwarf.dwarf_api('getModules') or []
+        bases = {module['name']: utils.parse_ptr(module['base']) for module in modules}
+        pointer_size = dwarf.pointer_size
+
+        def read_pointer(address):
+            data = dwarf.read_memory(address, pointer_size)
+            if data is None or len(data) != pointer_size:
+                return None
+            return int.from_bytes(data, 'little')
+
+        checked = []
+        for path in paths:
+            address = None
+            if path.module in bases:
+                address = path.resolve(read_pointer, bases[path.module])
+            if target is None or address == target:
+                checked.append((path, address))
+        return checked
+
+
+class PointerScanThread(QThread):
+    """ builds the pointer index and scans for a target off the gui thread
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    onStatus = pyqtSignal(str, name='onStatus')
+    # list of PointerPath
+    onFinished = pyqtSignal(object, name='onFinished')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, scanner, target, parent=None):
+        super().__init__(parent=parent)
+        self.scanner = scanner
+        self.target = target
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, done, total):
+        self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+    def run(self):
+        try:
+            self.onStatus.emit('dumping ranges')
+            pointers = self.scanner.build_index(cancel=self._cancel, progress=self._on_progress)
+            self.onStatus.emit('scanning %d pointers' % pointers)
+            self.onFinished.emit(self.scanner.scan(self.target, cancel=self._cancel, progress=self._on_progress))
+        except PointerScanner.PointerScanError as e:
+            self.onError.emit(str(e))
+        except BrokenProcessPool:
+            # a worker died (oom killer most likely)
+            self.onError.emit('a scan worker died unexpectedly')
+        except OSError as e:
+            self.onError.emit(str(e))
+        except Exception as e:  # pylint: disable=broad-except
+            # dwarf waits on a signal to allow another scan
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
@@ -27,6 +27,8 @@ VIEW_WATCHERS = 'view_watchers'
 EMULATOR_CALLBACKS_PATH = 'emulator_callbacks_path'
 EMULATOR_INSTRUCTIONS_DELAY = 'emulator_instructions_delay'
 
+MEMORY_CACHE_SIZE = 'memory_cache_size'
+
 
 class Prefs(QObject):
     """ Preferences
@@ -0,0 +1,366 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import json
+import mmap
+import os
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# a dump is a directory holding:
+#
+#   memory.bin  - readable bytes of every range, back to back
+#   index.json  - {'version', 'pid', 'page_size', 'ranges': [entry, ...]}
+#
+# where entry is {'base': '0x...', 'size', 'protection', 'file', 'offset'}.
+# unreadable pages are left out, so a range may be split in several entries
+DUMP_VERSION = 1
+DUMP_INDEX = 'index.json'
+DUMP_DATA = 'memory.bin'
+
+# bytes requested to the reader per step, only one window is held in memory
+STREAM_WINDOW = 4 * 1024 * 1024
+
+
+def stream_memory(dwarf, ptr, length, on_data, cancel=None, progress=None, window=STREAM_WINDOW):
+    """ read [ptr, ptr + length) a window at a time
+
+    :param on_data: on_data(address, memoryview) for every readable run
+    :param progress: progress(done_bytes)
+    :return: number of unreadable bytes
+    """
+    unreadable = 0
+    offset = 0
+    while offset < length:
+        if cancel is not None and cancel.is_set():
+            break
+        size = min(window, length - offset)
+        result = dwarf.read_memory_ex(ptr + offset, size, cancel=cancel)
+        if result.cancelled:
+            break
+        view = memoryview(result.data)
+
+        # hand over everything between the holes
+        cursor = ptr + offset
+        for hole_address, hole_size in result.holes + [[ptr + offset + size, 0]]:
+            if hole_address > cursor:
+                on_data(cursor, view[cursor - ptr - offset:hole_address - ptr - offset])
+            cursor = hole_address + hole_size
+            unreadable += hole_size
+
+        view.release()
+        offset += size
+        if progress is not None:
+            progress(offset)
+    return unreadable
+
+
+def dump_ranges(dwarf, ranges, writer, cancel=None, progress=None):
+    """ stream the readable bytes of agent ranges into a ProcessDumpWriter
+
+    :param ranges: getRanges entries
+    :param progress: progress(done_bytes, total_bytes)
+    :return: number of unreadable bytes
+    """
+    total = sum(_range['size'] for _range in ranges)
+    done = 0
+    unreadable = 0
+    for _range in ranges:
+        if cancel is not None and cancel.is_set():
+            break
+        file_path = None
+        if 'file' in _range:
+            file_path = _range['file']['path']
+
+        def on_data(address, data, protection=_range['protection'], file_path=file_path):
+            writer.add(address, data, protection, file_path)
+
+        def on_progress(range_done, base_done=done):
+            if progress is not None:
+                progress(base_done + range_done, total)
+
+        unreadable += stream_memory(dwarf, int(_range['base'], 16), _range['size'],
+                                    on_data, cancel=cancel, progress=on_progress)
+        done += _range['size']
+    return unreadable
+
+
+class ProcessDumpWriter(object):
+    def __init__(self, path, pid=0, page_size=0x1000):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.pid = pid
+        self.page_size = page_size
+        self.entries = []
+        self._data = open(os.path.join(path, DUMP_DATA), 'wb')
+        self._offset = 0
+
+    def add(self, address, data, protection, file_path=None):
+        last = self.entries[-1] if self.entries else None
+        if last is not None and int(last['base'], 16) + last['size'] == address \
+                and last['protection'] == protection and last['file'] == file_path \
+                and last['offset'] + last['size'] == self._offset:
+            last['size'] += len(data)
+        else:
+            self.entries.append({
+                'base': hex(address),
+                'size': len(data),
+                'protection': protection,
+                'file': file_path,
+                'offset': self._offset
+            })
+        self._data.write(data)
+        self._offset += len(data)
+
+    def close(self):
+        self._data.close()
+        with open(os.path.join(self.path, DUMP_INDEX), 'w') as f:
+            json.dump({
+                'version': DUMP_VERSION,
+                'pid': self.pid,
+                'page_size': self.page_size,
+                'ranges': self.entries
+            }, f, indent=2)
+
+
+class ProcessDump(object):
+    """ read only, memory mapped view of a dump written by ProcessDumper
+
+        dump = ProcessDump('/path/to/dump')
+        data = dump.read(0x7f001000, 0x100)
+    """
+
+    class InvalidDumpError(Exception):
+        """ Raised when the directory doesn't hold a dump we can read
+        """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, DUMP_INDEX), 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ProcessDump.InvalidDumpError(str(e))
+        if index.get('version', 0) != DUMP_VERSION:
+            raise ProcessDump.InvalidDumpError('unsupported dump version')
+
+        self.pid = index.get('pid', 0)
+        self.page_size = index.get('page_size', 0x1000)
+        self.ranges = sorted(index['ranges'], key=lambda entry: int(entry['base'], 16))
+        self._bases = [int(entry['base'], 16) for entry in self.ranges]
+
+        self._file = open(os.path.join(path, DUMP_DATA), 'rb')
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def find(self, ptr):
+        """ index entry holding ptr or None
+        """
+        i = bisect.bisect_right(self._bases, ptr) - 1
+        if i >= 0 and ptr < self._bases[i] + self.ranges[i]['size']:
+            return self.ranges[i]
+        return None
+
+    def view(self, entry):
+        """ memoryview over the bytes of an index entry, no copy
+        """
+        return memoryview(self._map)[entry['offset']:entry['offset'] + entry['size']]
+
+    def read(self, ptr, length):
+        """ bytes at [ptr, ptr + length) or None if any of them wasn't dumped
+        """
+        chunks = []
+        end = ptr + length
+        while ptr < end:
+            entry = self.find(ptr)
+            if entry is None:
+                return None
+            base = int(entry['base'], 16)
+            size = min(base + entry['size'], end) - ptr
+            start = entry['offset'] + ptr - base
+            chunks.append(self._map[start:start + size])
+            ptr += size
+        return b''.join(chunks)
+
+    def search(self, entry, needles, cancel=None):
+        """ (address, needle index) of every hit in an index entry, by address
+
+            each needle is anchored on its longest fully known run of bytes,
+            found with mmap.find and checked against the whole masked needle.
+            a hit crossing into the next entry isn't found, entries are split
+            where pages couldn't be read
+        """
+        hits = []
+        if self._map is None:
+            return hits
+        base = int(entry['base'], 16)
+        start = entry['offset']
+        end = start + entry['size']
+        for index, needle in enumerate(needles):
+            at, atom = _atom(needle)
+            length = len(needle)
+            pos = self._map.find(atom, start + at, end)
+            while pos >= 0:
+                if cancel is not None and cancel.is_set():
+                    return hits
+                first = pos - at
+                if first + length <= end and needle.matches(self._map[first:first + length]):
+                    hits.append((base + first - start, index))
+                pos = self._map.find(atom, pos + 1, end)
+        hits.sort()
+        return hits
+
+
+def _atom(needle):
+    """ (offset, bytes) of the longest fully known run of a needle
+    """
+    best = (0, 0)
+    run = 0
+    for i, mask in enumerate(needle.mask):
+        run = run + 1 if mask == 0xff else 0
+        if run > best[1]:
+            best = (i + 1 - run, run)
+    return best[0], bytes(needle.data[best[0]:best[0] + best[1]])
+
+
+class DumpSearchThread(QThread):
+    """ searches the ranges of a ProcessDump off the gui thread
+
+        the signals carry what the agent memory scans send, so the search
+        panel handles both the same way
+    """
+
+    # scan id, range index, addresses, needle indexes
+    onMemoryScanBatch = pyqtSignal(int, int, list, list, name='onMemoryScanBatch')
+    # {'id', 'range', 'scanned', 'total'}
+    onMemoryScanProgress = pyqtSignal(dict, name='onMemoryScanProgress')
+    # {'id', 'cancelled', 'counts'} and 'error' when it failed
+    onMemoryScanComplete = pyqtSignal(dict, name='onMemoryScanComplete')
+
+    def __init__(self, dump, scan_id, needles, ranges, parent=None):
+        super().__init__(parent=parent)
+        self.dump = dump
+        self.scan_id = scan_id
+        self.needles = needles
+        # list of (base, size)
+        self.ranges = ranges
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        counts = [0] * len(self.needles)
+        result = {'id': self.scan_id, 'cancelled': False, 'counts': counts}
+        try:
+            total = sum(size for _, size in self.ranges)
+            scanned = 0
+            for range_index, (base, size) in enumerate(self.ranges):
+                if self._cancel.is_set():
+                    break
+                entry = self.dump.find(base)
+                if entry is not None:
+                    hits = self.dump.search(entry, self.needles, cancel=self._cancel)
+                    if hits:
+                        for _, needle in hits:
+                            counts[needle] += 1
+                        self.onMemoryScanBatch.emit(self.scan_id, range_index,
+                                                    [hit[0] for hit in hits], [hit[1] for hit in hits])
+                scanned += size
+                self.onMemoryScanProgress.emit({'id': self.scan_id, 'range': range_index,
+                                                'scanned': scanned, 'total': total})
+        except Exception as e:  # pylint: disable=broad-except
+            # the panel waits for the complete signal to allow another search
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+        result['cancelled'] = self._cancel.is_set()
+        self.onMemoryScanComplete.emit(result)
+
+
+class ProcessDumper(QThread):
+    """ walks every readable range of the target and streams it to a dump
+        directory, see ProcessDump to read it back
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    # path, unreadable bytes
+    onFinished = pyqtSignal(str, object, name='onFinished')
+    # path, what was written before the cancel is left there
+    onCancelled = pyqtSignal(str, name='onCancelled')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, dwarf, path, parent=None):
+        super().__init__(parent=parent)
+        self._dwarf = dwarf
+        self.path = path
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        # one of the signals is always emitted, dwarf waits on it to allow another dump
+        try:
+            self._dump()
+        except Exception as e:  # pylint: disable=broad-except
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
+
+    def _dump(self):
+        ranges = self._dwarf.dwarf_api('getRanges')
+        if not ranges:
+            self.onError.emit('unable to retrieve ranges')
+            return
+        ranges = [_range for _range in ranges if 'r' in _range['protection']]
+
+        try:
+            writer = ProcessDumpWriter(self.path, pid=self._dwarf.pid,
+                                       page_size=self._dwarf.page_cache.page_size)
+        except OSError as e:
+            self.onError.emit(str(e))
+            return
+
+        def on_progress(done, total):
+            self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+        try:
+            unreadable = dump_ranges(self._dwarf, ranges, writer, cancel=self._cancel, progress=on_progress)
+        except OSError as e:
+            self.onError.emit(str(e))
+            return
+        finally:
+            writer.close()
+
+        if self._cancel.is_set():
+            self.onCancelled.emit(self.path)
+        else:
+            self.onFinished.emit(self.path, unreadable)
@@ -0,0 +1,159 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import struct
+
+# agent -> host frames travel in the frida data channel. the message payload
+# is always FRAME_MARKER and the data holds:
+#
+#   'DW' | version u8 | flags u8 | type u16 | reserved u16 | tid u32 | seq u32 | meta_len u32
+#   meta (utf-8 json, meta_len bytes)
+#   raw (everything left)
+#
+# keep this in sync with DwarfProtocol in core.js
+FRAME_MARKER = 'dwarf'
+FRAME_MAGIC = b'DW'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBBHHIII')
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+
+FLAG_META = 1
+FLAG_RAW = 2
+
+MESSAGE_TYPES = {
+    1: 'backtrace',
+    2: 'emulator',
+    3: 'enable_kernel',
+    4: 'enumerate_java_classes_start',
+    5: 'enumerate_java_classes_match',
+    6: 'enumerate_java_classes_complete',
+    7: 'enumerate_java_methods_complete',
+    8: 'ftrace',
+    9: 'hook_deleted',
+    10: 'hook_java_callback',
+    11: 'hook_native_callback',
+    12: 'hook_onload_callback',
+    13: 'java_trace',
+    14: 'log',
+    15: 'memoryscan_result',
+    16: 'onload_callback',
+    17: 'release',
+    18: 'release_js',
+    19: 'resume',
+    20: 'set_context',
+    21: 'set_data',
+    22: 'tracer',
+    23: 'update_modules',
+    24: 'update_ranges',
+    25: 'watcher',
+    26: 'watcher_added',
+    27: 'watcher_removed',
+    28: 'api_result',
+    29: 'memoryscan_batch',
+    30: 'memoryscan_progress',
+    31: 'memoryscan_complete',
+    32: 'ranges_delta',
+}
+MESSAGE_IDS = {name: type_id for type_id, name in MESSAGE_TYPES.items()}
+
+
+class ProtocolError(Exception):
+    """ raised on frames we can't decode
+    """
+
+
+class Message(object):
+    __slots__ = ('type', 'tid', 'seq', 'meta', 'raw', 'model')
+
+    def __init__(self, type_, tid=0, seq=0, meta=None, raw=None):
+        self.type = type_
+        self.tid = tid
+        self.seq = seq
+        self.meta = meta
+        self.raw = raw
+        # ready made objects built off the gui thread (see MessagePipeline)
+        self.model = None
+
+    def __repr__(self):
+        return 'Message(%s, tid=%d, seq=%d)' % (self.type, self.tid, self.seq)
+
+
+def is_frame(message, data):
+    """ tell whether a frida message carries a dwarf frame
+    """
+    return data is not None and message.get('payload', None) == FRAME_MARKER
+
+
+def peek_type(data):
+    """ message type of a frame without decoding it, None if it isn't one
+    """
+    if data is None or len(data) < FRAME_HEADER_SIZE or data[:2] != FRAME_MAGIC:
+        return None
+    # magic, version, flags, type
+    return MESSAGE_TYPES.get(FRAME_HEADER.unpack_from(data)[3], None)
+
+
+def decode(data):
+    """ decode a frame received in the frida data channel
+
+    :param data: bytes like
+    :return: Message
+    """
+    if data is None or len(data) < FRAME_HEADER_SIZE:
+        raise ProtocolError('short frame')
+
+    magic, version, flags, type_id, _, tid, seq, meta_len = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ProtocolError('bad magic')
+    if version != FRAME_VERSION:
+        raise ProtocolError('unsupported protocol version %d' % version)
+
+    try:
+        type_ = MESSAGE_TYPES[type_id]
+    except KeyError:
+        raise ProtocolError('unknown message type %d' % type_id)
+
+    meta = None
+    raw = None
+    offset = FRAME_HEADER_SIZE
+    if flags & FLAG_META:
+        end = offset + meta_len
+        if end > len(data):
+            raise ProtocolError('truncated meta')
+        meta = json.loads(bytes(data[offset:end]).decode('utf8'))
+        offset = end
+    if flags & FLAG_RAW:
+        raw = bytes(data[offset:])
+    return Message(type_, tid, seq, meta, raw)
+
+
+def encode(type_, tid=0, seq=0, meta=None, raw=None):
+    """ build a frame. the agent is the only producer at runtime, this is
+    used by tools and benchmarks to craft traffic
+    """
+    flags = 0
+    meta_bytes = b''
+    if meta is not None:
+        flags |= FLAG_META
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf8')
+    if raw is not None:
+        flags |= FLAG_RAW
+    else:
+        raw = b''
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, MESSAGE_IDS[type_], 0,
+                               tid, seq, len(meta_bytes))
+    return header + meta_bytes + bytes(raw)
@@ -14,8 +14,235 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
+import bisect
+from collections import OrderedDict
+
 from lib import utils
-from lib.hook import Hook
+
+
+class RangeBuffer(object):
+    """ lazy bytes like view of a target range
+
+        only base and size are known upfront. data is fetched through
+        reader(ptr, length) in page aligned windows when indexed or sliced,
+        and a few more windows are read in the same request in the direction
+        the view is moving. unreadable windows read as zeros.
+
+        writes are kept in a patch overlay and survive window eviction. the
+        overlay holds disjoint spans sorted by offset, a newer patch trims
+        whatever it covers, so applying it to a window only walks the spans
+        actually inside that window
+    """
+
+    WINDOW_SIZE = 0x10000
+    READ_AHEAD = 2
+    MAX_WINDOWS = 32
+
+    def __init__(self, reader, base, size, window_size=WINDOW_SIZE):
+        self._reader = reader
+        self.base = base
+        self.size = size
+        self._window_size = window_size
+        self._windows = OrderedDict()
+        # overlay, parallel lists sorted by offset
+        self._patch_offsets = []
+        self._patch_data = []
+        self._last_window = -1
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __bytes__(self):
+        # whole range in a single request, skipping the windows
+        data = self._reader(self.base, self.size)
+        if data is None or len(data) != self.size:
+            return self[0:self.size]
+        data = bytearray(data)
+        for offset, patch in zip(self._patch_offsets, self._patch_data):
+            data[offset:offset + len(patch)] = patch
+        return bytes(data)
+
+    def __iter__(self):
+        for offset in range(0, self.size, self._window_size):
+            yield from self[offset:offset + self._window_size]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                return bytes(self[start:stop])[::step]
+            if start >= stop:
+                return bytes()
+            return self._read(start, stop - start)
+
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError('range index out of range')
+        window = self._window(key // self._window_size)
+        return window[key % self._window_size]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(self.size)
+            value = bytes(value)
+            if len(value) != stop - start:
+                raise ValueError('range buffer can\'t be resized')
+        else:
+            if key < 0:
+                key += self.size
+            if not 0 <= key < self.size:
+                raise IndexError('range index out of range')
+            start = key
+            value = bytes([value])
+        self.patch(start, value)
+
+    def patch(self, offset, data):
+        """ overlay data at offset, without touching the target
+        """
+        data = bytes(data)
+        end = offset + len(data)
+        if not data:
+            return
+
+        # trim the spans we overlap, keeping what sticks out on both sides
+        i = bisect.bisect_right(self._patch_offsets, offset) - 1
+        if i < 0 or self._patch_offsets[i] + len(self._patch_data[i]) <= offset:
+            i += 1
+        j = i
+        while j < len(self._patch_offsets) and self._patch_offsets[j] < end:
+            j += 1
+        replacement_offsets = [offset]
+        replacement_data = [data]
+        if j > i:
+            if self._patch_offsets[i] < offset:
+                replacement_offsets.insert(0, self._patch_offsets[i])
+                replacement_data.insert(0, self._patch_data[i][:offset - self._patch_offsets[i]])
+            last_end = self._patch_offsets[j - 1] + len(self._patch_data[j - 1])
+            if last_end > end:
+                replacement_offsets.append(end)
+                replacement_data.append(self._patch_data[j - 1][end - self._patch_offsets[j - 1]:])
+        self._patch_offsets[i:j] = replacement_offsets
+        self._patch_data[i:j] = replacement_data
+
+        first = offset // self._window_size
+        last = (end - 1) // self._window_size
+        for index in range(first, last + 1):
+            window = self._windows.get(index, None)
+            if window is not None:
+                self._apply_span(index, window, offset, data)
+
+    def patches(self, offset=0, length=None):
+        """ (offset, bytes) overlay spans intersecting [offset, offset + length)
+        """
+        if length is None:
+            length = self.size - offset
+        end = offset + length
+        i = max(bisect.bisect_right(self._patch_offsets, offset) - 1, 0)
+        spans = []
+        while i < len(self._patch_offsets) and self._patch_offsets[i] < end:
+            if self._patch_offsets[i] + len(self._patch_data[i]) > offset:
+                spans.append((self._patch_offsets[i], self._patch_data[i]))
+            i += 1
+        return spans
+
+    def _apply_overlay(self, index, window):
+        window_start = index * self._window_size
+        for offset, data in self.patches(window_start, len(window)):
+            self._apply_span(index, window, offset, data)
+
+    def _apply_span(self, index, window, offset, data):
+        window_start = index * self._window_size
+        start = max(offset, window_start)
+        end = min(offset + len(data), window_start + len(window))
+        if start < end:
+            window[start - window_start:end - window_start] = data[start - offset:end - offset]
+
+    def _read(self, offset, length):
+        first = offset // self._window_size
+        last = (offset + length - 1) // self._window_size
+        if first == last:
+            start = offset - first * self._window_size
+            return bytes(self._window(first)[start:start + length])
+
+        data = bytearray()
+        for index in range(first, last + 1):
+            data += self._window(index)
+        start = offset - first * self._window_size
+        return bytes(data[start:start + length])
+
+    def is_loaded(self, offset):
+        return offset // self._window_size in self._windows
+
+    def _window(self, index):
+        window = self._windows.get(index, None)
+        if window is not None:
+            self._windows.move_to_end(index)
+            self._last_window = index
+            return window
+
+        # read ahead in the direction we are moving
+        count = self._window_count()
+        first = index
+        last = index
+        if self._last_window >= 0:
+            if index > self._last_window:
+                last = min(index + RangeBuffer.READ_AHEAD, count - 1)
+            elif index < self._last_window:
+                first = max(index - RangeBuffer.READ_AHEAD, 0)
+        while first < index and first in self._windows:
+            first += 1
+        while last > index and last in self._windows:
+            last -= 1
+        self._last_window = index
+
+        self._fetch(first, last)
+        return self._windows[index]
+
+    def _window_count(self):
+        return (self.size + self._window_size - 1) // self._window_size
+
+    def _fetch(self, first, last):
+        start = first * self._window_size
+        end = min((last + 1) * self._window_size, self.size)
+        data = self._reader(self.base + start, end - start)
+        if (data is None or len(data) != end - start) and first != last:
+            # something is unreadable, fall back to single windows
+            for index in range(first, last + 1):
+                self._fetch(index, index)
+            return
+
+        for index in range(first, last + 1):
+            window_start = index * self._window_size - start
+            window_length = min(self._window_size, end - start - window_start)
+            if data is None or len(data) != end - start:
+                window = bytearray(window_length)
+            else:
+                window = bytearray(data[window_start:window_start + window_length])
+            self._apply_overlay(index, window)
+            self._windows[index] = window
+
+        while len(self._windows) > RangeBuffer.MAX_WINDOWS:
+            self._windows.popitem(last=False)
+
+    def prefetch(self, offset):
+        """ load the window holding offset, False if it's unreadable
+        """
+        index = offset // self._window_size
+        if index not in self._windows:
+            start = index * self._window_size
+            length = min(self._window_size, self.size - start)
+            data = self._reader(self.base + start, length)
+            if data is None or len(data) != length:
+                return False
+            window = bytearray(data)
+            self._apply_overlay(index, window)
+            self._windows[index] = window
+            self._last_window = index
+        return True
 
 
 class Range(object):
@@ -24,6 +251,9 @@ class Range(object):
     # dump memory from emulator proc
     SOURCE_EMULATOR = 1
 
+    # upper bound used to size disassembly windows
+    MAX_INSTRUCTION_SIZE = 16
+
     def __init__(self, source, dwarf):
         super().__init__()
 
@@ -38,6 +268,9 @@ class Range(object):
         self.start_address = 0
         self.start_offset = 0
 
+        # in flight init_with_address_async
+        self._pending = None
+
     def invalidate(self):
         self.base = 0
         self.size = 0
@@ -50,41 +283,11 @@ class Range(object):
     def init_with_address(self, address, length=0, base=0):
         self.start_address = utils.parse_ptr(address)
 
-        if self.base > 0:
-            if self.base < self.start_address < self.tail:
-                self.start_offset = self.start_address - self.base
-                return -1
+        if self._contains_start():
+            return -1
 
         if self.source == Range.SOURCE_TARGET:
-            try:
-                _range = self.dwarf.dwarf_api('getRange', self.start_address)
-            except Exception as e:
-                return 1
-            if _range is None or len(_range) == 0:
-                return 1
-
-            # setup range fields
-            self.base = int(_range['base'], 16)
-            if base > 0:
-                self.base = base
-            self.size = _range['size']
-            if 0 < length < self.size:
-                self.size = length
-            self.tail = self.base + self.size
-            self.start_offset = self.start_address - self.base
-
-            # read data
-            self.data = self.dwarf.read_memory(self.base, self.size)
-
-            # check if we have hooks in range and patch data
-            for key in self.dwarf.hooks.keys():
-                hook = self.dwarf.hooks[key]
-                if hook.hook_type == Hook.HOOK_NATIVE:
-                    hook_address = hook.get_ptr()
-                    if self.base < hook_address < self.tail:
-                        offset = hook_address - self.base
-                        # patch bytes
-                        self.patch_bytes(hook.get_bytes(), offset)
+            return self._apply_target(self._fetch_target(self.start_address, length, base))
         elif self.source == Range.SOURCE_EMULATOR:
             uc = self.dwarf.get_emulator().uc
             if uc is not None:
@@ -105,11 +308,103 @@ class Range(object):
             return 1
         return 0
 
+    def init_with_address_async(self, address, length=0, base=0, callback=None):
+        """ same as init_with_address but the target is read from the rpc worker
+
+        callback receives the init_with_address return value in the gui thread.
+        a new request cancels the one still in flight
+        :return: the future or None when completed synchronously
+        """
+        if callback is None:
+            callback = lambda ret: None
+
+        if self._pending is not None:
+            self.dwarf.cancel_async(self._pending)
+            self._pending = None
+
+        self.start_address = utils.parse_ptr(address)
+        if self._contains_start():
+            callback(-1)
+            return None
+
+        if self.source != Range.SOURCE_TARGET:
+            callback(self.init_with_address(address, length, base))
+            return None
+
+        def _on_fetched(fetched):
+            self._pending = None
+            callback(self._apply_target(fetched))
+
+        self._pending = self.dwarf.submit_async(self._fetch_target, self.start_address, length, base,
+                                                callback=_on_fetched)
+        return self._pending
+
+    def _contains_start(self):
+        if self.base > 0:
+            if self.base < self.start_address < self.tail:
+                self.start_offset = self.start_address - self.base
+                return True
+        return False
+
+    def _fetch_target(self, address, length, base):
+        # no state is touched here, this runs in the rpc worker too
+        _range = self.dwarf.memory_map.find(address)
+        if _range is None:
+            # not mapped when we got the map, ask the agent
+            try:
+                _range = self.dwarf.dwarf_api('getRange', address)
+            except Exception as e:
+                return None
+            if _range is None or len(_range) == 0:
+                return None
+            self.dwarf.memory_map.add(_range)
+
+        range_base = int(_range['base'], 16)
+        if base > 0:
+            range_base = base
+        size = _range['size']
+        if 0 < length < size:
+            size = length
+
+        # only the window we are going to show is read now
+        data = RangeBuffer(self.dwarf.read_memory, range_base, size)
+        if not data.prefetch(min(max(address - range_base, 0), size - 1)):
+            data = None
+        return range_base, size, data
+
+    def _apply_target(self, fetched):
+        if fetched is None:
+            return 1
+
+        # setup range fields
+        self.base, self.size, self.data = fetched
+        self.tail = self.base + self.size
+        self.start_offset = self.start_address - self.base
+
+        if self.data is None:
+            self.data = bytes()
+            return 1
+        if len(self.data) == 0:
+            return 1
+
+        # show the original bytes under the hooks trampolines
+        for hook in self.dwarf.native_hooks_in(self.base, self.tail):
+            self.patch_bytes(hook.get_bytes(), hook.get_ptr() - self.base)
+        return 0
+
     def patch_bytes(self, _bytes, offset):
+        if isinstance(self.data, RangeBuffer):
+            self.data.patch(offset, _bytes)
+            return
         data_bt = bytearray(self.data)
         data_bt[offset:offset+len(_bytes)] = bytearray(_bytes)
         self.data = bytes(data_bt)
 
+    def read(self, offset, length):
+        """ bytes at offset without materializing the whole range
+        """
+        return bytes(self.data[offset:offset + length])
+
     def set_start_offset(self, offset):
         self.start_offset = offset
         self.start_address = self.base + offset
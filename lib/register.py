@@ -18,6 +18,9 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
 
 class Register(object):
     def __init__(self, register):
+        if isinstance(register, str):
+            # hit message value, the rest comes with the context details
+            register = {'value': register, 'isValidPointer': False}
         self.value = int(register['value'], 16)
         self.is_pointer = register['isValidPointer']
 
@@ -38,8 +41,8 @@ class Register(object):
                 self.telescope_value = int(self.telescope_value, 16)
 
         if 'symbol' in register:
-            self.symbol_name = register['symbol']['name']
-            self.symbol_module_name = register['symbol']['moduleName']
+            self.symbol_name = register['symbol'].get('name')
+            self.symbol_module_name = register['symbol'].get('moduleName')
 
         if 'instruction' in register:
             self.instruction_size = register['instruction']['size']
@@ -0,0 +1,170 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, CancelledError
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class RpcRequest(object):
+    def __init__(self, request_id, fn, args, timeout):
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.timeout = timeout
+        self.queued_at = time.monotonic()
+        self.future = Future()
+        self.future.request_id = request_id
+
+
+class RpcWorker(QThread):
+    """ runs blocking agent calls out of the gui thread
+
+        requests are executed one at a time in submit order (frida rpc
+        calls on a paused thread are serialized by the agent anyway).
+        every request gets an id and a future. completion is also emitted
+        through onRequestDone so gui code can be notified in its own thread
+    """
+
+    class QueueFullError(Exception):
+        """ Raised when too many requests are pending
+        """
+
+    class RpcTimeoutError(Exception):
+        """ Raised (in the future) when a request took too long
+        """
+
+    # request id, result, error string or None
+    onRequestDone = pyqtSignal(int, object, object, name='onRequestDone')
+
+    DEFAULT_TIMEOUT = 30.0
+    MAX_PENDING = 64
+
+    def __init__(self, parent=None, max_pending=MAX_PENDING, timeout=DEFAULT_TIMEOUT):
+        super().__init__(parent=parent)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._ids = itertools.count(1)
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._running = True
+        self.timeout = timeout
+
+    def submit(self, fn, *args, timeout=None):
+        """ queue fn(*args)
+
+        :return: concurrent.futures.Future with a request_id attribute
+        """
+        if timeout is None:
+            timeout = self.timeout
+        request = RpcRequest(next(self._ids), fn, args, timeout)
+        with self._lock:
+            self._requests[request.request_id] = request
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._requests.pop(request.request_id, None)
+            raise RpcWorker.QueueFullError('%d requests pending' % self._queue.maxsize)
+
+        if not self.isRunning():
+            self._running = True
+            self.start()
+        return request.future
+
+    def cancel(self, request_id):
+        """ cancel a pending request. a request already running on the agent
+            can't be interrupted, its result is dropped instead
+        """
+        with self._lock:
+            request = self._requests.pop(request_id, None)
+        if request is None:
+            return False
+        if not request.future.cancel():
+            # running - mark it so the result is ignored
+            request.future.set_exception(CancelledError())
+        return True
+
+    def cancel_all(self):
+        with self._lock:
+            request_ids = list(self._requests.keys())
+        for request_id in request_ids:
+            self.cancel(request_id)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._running = False
+        self.cancel_all()
+        # unblock the queue
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.wait()
+
+    def run(self):
+        while self._running:
+            request = self._queue.get()
+            if request is None:
+                continue
+
+            with self._lock:
+                if request.request_id not in self._requests:
+                    # cancelled while queued
+                    continue
+
+            if time.monotonic() - request.queued_at > request.timeout:
+                self._finish(request, None, RpcWorker.RpcTimeoutError('expired in queue'))
+                continue
+
+            if not request.future.set_running_or_notify_cancel():
+                continue
+
+            # we can't interrupt frida, so a watchdog fails the future on time
+            # and whatever comes back later is dropped
+            watchdog = threading.Timer(
+                request.timeout, self._finish,
+                args=(request, None, RpcWorker.RpcTimeoutError('timed out after %.1fs' % request.timeout)))
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                result = request.fn(*request.args)
+                error = None
+            except Exception as e:  # pylint: disable=broad-except
+                result = None
+                error = e
+            watchdog.cancel()
+            self._finish(request, result, error)
+
+    def _finish(self, request, result, error):
+        with self._lock:
+            if self._requests.pop(request.request_id, None) is None:
+                # cancelled or timed out already
+                return
+        try:
+            if error is None:
+                request.future.set_result(result)
+            else:
+                request.future.set_exception(error)
+        except Exception:  # pylint: disable=broad-except
+            # future already resolved (cancelled)
+            return
+        self.onRequestDone.emit(request.request_id, result, None if error is None else str(error))
@@ -0,0 +1,126 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+HEX_CHARS = '0123456789abcdefABCDEF'
+
+
+class PatternError(Exception):
+    """ Raised when a needle can't be parsed
+    """
+
+
+class Needle(object):
+    """ bytes to look for, each with a mask of the bits that must match
+    """
+
+    def __init__(self, name, data, mask=None):
+        self.name = name
+        self.data = list(data)
+        if mask is None:
+            mask = [0xff] * len(self.data)
+        self.mask = list(mask)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def is_exact(self):
+        return all(m == 0xff for m in self.mask)
+
+    @property
+    def has_nibble_mask(self):
+        return any(m not in (0x00, 0xff) for m in self.mask)
+
+    def matches(self, data):
+        if len(data) < len(self.data):
+            return False
+        return all((b & m) == v for b, v, m in zip(data, self.data, self.mask))
+
+    def to_frida_pattern(self):
+        """ frida scan syntax, only for needles without nibble masks
+        """
+        return ' '.join('??' if m == 0 else '%02x' % v for v, m in zip(self.data, self.mask))
+
+    def to_agent(self):
+        return {'bytes': self.data, 'mask': self.mask}
+
+
+def parse_hex(text, name=None):
+    """ 'de ad ?? e?' or 'dead??e?', a ? is a wildcard nibble
+    """
+    digits = text.replace(' ', '')
+    if len(digits) == 0 or len(digits) % 2 != 0:
+        raise PatternError('odd number of hex digits: %s' % text)
+
+    data = []
+    mask = []
+    for i in range(0, len(digits), 2):
+        value = 0
+        bits = 0
+        for shift, digit in ((4, digits[i]), (0, digits[i + 1])):
+            if digit == '?':
+                continue
+            if digit not in HEX_CHARS:
+                raise PatternError('bad hex digit %s in %s' % (digit, text))
+            value |= int(digit, 16) << shift
+            bits |= 0xf << shift
+        data.append(value)
+        mask.append(bits)
+
+    if not any(m == 0xff for m in mask):
+        # the scanner anchors on fully known bytes
+        raise PatternError('pattern needs at least one fully known byte: %s' % text)
+    return Needle(name or text, data, mask)
+
+
+def parse_string(text, encoding='ascii', name=None):
+    if encoding in ('utf-16', 'utf16'):
+        encoding = 'utf-16-le'
+    try:
+        data = text.encode(encoding)
+    except (UnicodeEncodeError, LookupError) as e:
+        raise PatternError(str(e))
+    if len(data) == 0:
+        raise PatternError('empty string')
+    return Needle(name or text, data)
+
+
+def parse_needle(line):
+    """ one needle per line:
+
+        dead??ef        hex, ? wildcards a nibble
+        "text"          ascii
+        u"text"         utf-16le
+    """
+    line = line.strip()
+    if line.startswith('u"') and line.endswith('"') and len(line) > 2:
+        return parse_string(line[2:-1], 'utf-16', name=line)
+    if line.startswith('"') and line.endswith('"') and len(line) > 1:
+        return parse_string(line[1:-1], 'ascii', name=line)
+    return parse_hex(line)
+
+
+def parse_needles(text):
+    """ needles out of a multi line text, empty lines and # comments are skipped
+    """
+    needles = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        needles.append(parse_needle(line))
+    return needles
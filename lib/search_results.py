@@ -0,0 +1,102 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+from array import array
+from itertools import compress
+
+COLUMN_ADDRESS = 0
+COLUMN_PATTERN = 1
+COLUMN_RANGE = 2
+
+
+class SearchResults(object):
+    """ search hits as integer columns
+
+        a hit costs 8 (address) + 4 (range) + 4 (pattern) bytes. views over
+        the hits are arrays of row ids, filtering and sorting never touch
+        anything but arrays
+    """
+
+    def __init__(self):
+        self.addresses = array('Q')
+        self.ranges = array('I')
+        self.patterns = array('I')
+        # row ids sorted by address, built on demand
+        self._by_address = None
+        self._sorted_addresses = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def clear(self):
+        self.addresses = array('Q')
+        self.ranges = array('I')
+        self.patterns = array('I')
+        self._by_address = None
+        self._sorted_addresses = None
+
+    def add(self, range_index, addresses, patterns=None):
+        """ append hits of a range
+
+        :return: row id of the first added hit
+        """
+        first = len(self.addresses)
+        self.addresses.extend(addresses)
+        self.ranges.extend([range_index] * len(addresses))
+        if patterns:
+            self.patterns.extend(patterns)
+        else:
+            self.patterns.extend([0] * len(addresses))
+        self._by_address = None
+        self._sorted_addresses = None
+        return first
+
+    def column(self, column):
+        if column == COLUMN_ADDRESS:
+            return self.addresses
+        if column == COLUMN_PATTERN:
+            return self.patterns
+        return self.ranges
+
+    def select(self, range_index=None, pattern=None, start=0):
+        """ row ids from start on, matching the filters
+        """
+        rows = array('L', range(start, len(self.addresses)))
+        if range_index is not None:
+            rows = array('L', compress(rows, [r == range_index for r in self.ranges[start:]]))
+        if pattern is not None:
+            patterns = self.patterns
+            rows = array('L', (row for row in rows if patterns[row] == pattern))
+        return rows
+
+    def sort(self, rows, column, reverse=False):
+        """ rows ordered by a column
+        """
+        return array('L', sorted(rows, key=self.column(column).__getitem__, reverse=reverse))
+
+    def count(self, column, value):
+        return self.column(column).count(value)
+
+    def in_range(self, start, end):
+        """ row ids of the hits in [start, end)
+        """
+        if self._by_address is None:
+            self._by_address = self.sort(range(len(self.addresses)), COLUMN_ADDRESS)
+            self._sorted_addresses = array('Q', (self.addresses[row] for row in self._by_address))
+        first = bisect.bisect_left(self._sorted_addresses, start)
+        last = bisect.bisect_left(self._sorted_addresses, end)
+        return self._by_address[first:last]
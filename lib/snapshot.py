@@ -0,0 +1,310 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import mmap
+import os
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from lib import utils
+from lib.process_dump import ProcessDump, ProcessDumpWriter, stream_memory
+
+# a snapshot is a process dump directory (see lib/process_dump.py) plus:
+#
+#   pages.bin      - agent page hashes of every range, pages * 8 bytes then
+#                    one readable flag per page (the pageHashes api output)
+#   snapshot.json  - {'page_size', 'ranges': [{'base', 'size', 'pages'}]}
+#                    where pages is the offset of the range hashes in pages.bin
+SNAPSHOT_INDEX = 'snapshot.json'
+SNAPSHOT_PAGES = 'pages.bin'
+
+# pages hashed per pageHashes request
+HASH_BATCH_PAGES = 4096
+# bytes compared at once before looking for the single changed bytes
+COMPARE_BLOCK = 64
+
+
+def page_hashes(dwarf, base, size, page_size):
+    """ agent page hashes of [base, base + size), pages * 8 bytes + pages flags
+    """
+    pages = (size + page_size - 1) // page_size
+    hashes = bytearray()
+    flags = bytearray()
+    for start in range(0, pages, HASH_BATCH_PAGES):
+        count = min(HASH_BATCH_PAGES, pages - start)
+        data = dwarf.dwarf_api('pageHashes', [hex(base + start * page_size), count * page_size])
+        if not isinstance(data, (bytes, bytearray)) or len(data) != count * 9:
+            # treat as unreadable
+            hashes += bytes(count * 8)
+            flags += bytes(count)
+        else:
+            hashes += data[:count * 8]
+            flags += data[count * 8:]
+    return bytes(hashes + flags)
+
+
+def changed_runs(address, old, new):
+    """ [address, length] runs of the bytes differing between old and new
+    """
+    runs = []
+    length = min(len(old), len(new))
+    for block in range(0, length, COMPARE_BLOCK):
+        end = min(block + COMPARE_BLOCK, length)
+        if old[block:end] == new[block:end]:
+            continue
+        for i in range(block, end):
+            if old[i] != new[i]:
+                if runs and runs[-1][0] + runs[-1][1] == address + i:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([address + i, 1])
+    return runs
+
+
+class SnapshotDiff(object):
+    def __init__(self):
+        # [address, length] of changed bytes
+        self.runs = []
+        # addresses of pages whose hash changed
+        self.pages = []
+        # pages readable in only one of the two states
+        self.unreadable = []
+
+    @property
+    def changed_bytes(self):
+        return sum(run[1] for run in self.runs)
+
+
+class Snapshot(object):
+    """ pages of a set of ranges saved to disk, later diffed against the
+        live target. only pages whose agent hash changed are read back
+    """
+
+    class SnapshotError(Exception):
+        """ Raised when a snapshot can't be written or read
+        """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, SNAPSHOT_INDEX), 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            raise Snapshot.SnapshotError(str(e))
+        self.page_size = index['page_size']
+        self.ranges = index['ranges']
+
+        try:
+            self.dump = ProcessDump(path)
+        except ProcessDump.InvalidDumpError as e:
+            raise Snapshot.SnapshotError(str(e))
+
+        self._pages_file = open(os.path.join(path, SNAPSHOT_PAGES), 'rb')
+        if os.fstat(self._pages_file.fileno()).st_size > 0:
+            self._pages = mmap.mmap(self._pages_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._pages = None
+
+    def close(self):
+        if self._pages is not None:
+            self._pages.close()
+            self._pages = None
+        self._pages_file.close()
+        self.dump.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def take(dwarf, ranges, path, cancel=None, progress=None):
+        """ snapshot ranges to path
+
+        :param ranges: list of (base, size)
+        :param progress: progress(done_bytes, total_bytes)
+        :return: Snapshot
+        :raises SnapshotError: when cancelled, the index isn't written and path won't load
+        """
+        page_size = dwarf.page_cache.page_size
+        ranges = sorted((utils.parse_ptr(base), int(size)) for base, size in ranges)
+        total = sum(_range[1] for _range in ranges)
+
+        try:
+            writer = ProcessDumpWriter(path, pid=dwarf.pid, page_size=page_size)
+            pages_file = open(os.path.join(path, SNAPSHOT_PAGES), 'wb')
+        except OSError as e:
+            raise Snapshot.SnapshotError(str(e))
+
+        entries = []
+        done = 0
+        pages_offset = 0
+        try:
+            for base, size in ranges:
+                if cancel is not None and cancel.is_set():
+                    break
+                # hashes first: a page changing while we copy it shows up in the next diff
+                hashes = page_hashes(dwarf, base, size, page_size)
+                pages_file.write(hashes)
+                entries.append({'base': hex(base), 'size': size, 'pages': pages_offset})
+                pages_offset += len(hashes)
+
+                def on_data(address, data):
+                    writer.add(address, data, 'snapshot')
+
+                def on_progress(range_done, base_done=done):
+                    if progress is not None:
+                        progress(base_done + range_done, total)
+
+                stream_memory(dwarf, base, size, on_data, cancel=cancel, progress=on_progress)
+                done += size
+        except OSError as e:
+            raise Snapshot.SnapshotError(str(e))
+        finally:
+            pages_file.close()
+            writer.close()
+
+        if cancel is not None and cancel.is_set():
+            raise Snapshot.SnapshotError('cancelled')
+        with open(os.path.join(path, SNAPSHOT_INDEX), 'w') as f:
+            json.dump({'page_size': page_size, 'ranges': entries}, f, indent=2)
+        return Snapshot(path)
+
+    def _range_pages(self, entry):
+        pages = (entry['size'] + self.page_size - 1) // self.page_size
+        data = self._pages[entry['pages']:entry['pages'] + pages * 9]
+        return data[:pages * 8], data[pages * 8:]
+
+    def diff(self, dwarf, cancel=None, progress=None):
+        """ compare the snapshot with the live target
+
+        :return: SnapshotDiff
+        """
+        result = SnapshotDiff()
+        page_size = self.page_size
+        total = sum(entry['size'] for entry in self.ranges)
+        done = 0
+
+        for entry in self.ranges:
+            if cancel is not None and cancel.is_set():
+                break
+            base = int(entry['base'], 16)
+            old_hashes, old_flags = self._range_pages(entry)
+            current = page_hashes(dwarf, base, entry['size'], page_size)
+            pages = len(old_flags)
+            new_hashes, new_flags = current[:pages * 8], current[pages * 8:]
+
+            # runs of changed pages, both readable
+            runs = []
+            for page in range(pages):
+                address = base + page * page_size
+                if old_flags[page] != new_flags[page]:
+                    result.unreadable.append(address)
+                    continue
+                if not new_flags[page] or old_hashes[page * 8:page * 8 + 8] == new_hashes[page * 8:page * 8 + 8]:
+                    continue
+                result.pages.append(address)
+                if runs and runs[-1][1] == page:
+                    runs[-1][1] = page + 1
+                else:
+                    runs.append([page, page + 1])
+
+            for first, last in runs:
+                address = base + first * page_size
+                length = min((last - first) * page_size, entry['size'] - first * page_size)
+                fresh = dwarf.read_memory_ex(address, length, cancel=cancel)
+                for offset in range(0, length, page_size):
+                    page_address = address + offset
+                    page_length = min(page_size, length - offset)
+                    if any(hole[0] < page_address + page_length and page_address < hole[0] + hole[1]
+                           for hole in fresh.holes):
+                        # went away after hashing
+                        result.unreadable.append(page_address)
+                        continue
+                    old = self.dump.read(page_address, page_length)
+                    if old is None:
+                        # wasn't readable while taking the snapshot
+                        result.runs.append([page_address, page_length])
+                        continue
+                    result.runs.extend(changed_runs(page_address, old,
+                                                    fresh.data[offset:offset + page_length]))
+
+            done += entry['size']
+            if progress is not None:
+                progress(done, total)
+
+        # merge runs across page boundaries
+        merged = []
+        for run in result.runs:
+            if merged and merged[-1][0] + merged[-1][1] == run[0]:
+                merged[-1][1] += run[1]
+            else:
+                merged.append(list(run))
+        result.runs = merged
+        return result
+
+
+class SnapshotThread(QThread):
+    """ takes or diffs a snapshot off the gui thread
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    onSnapshotTaken = pyqtSignal(object, name='onSnapshotTaken')
+    onSnapshotDiff = pyqtSignal(object, name='onSnapshotDiff')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, dwarf, parent=None):
+        super().__init__(parent=parent)
+        self._dwarf = dwarf
+        self._cancel = threading.Event()
+        self._job = None
+
+    def take(self, ranges, path):
+        self._job = ('take', ranges, path)
+        self._cancel.clear()
+        self.start()
+
+    def diff(self, snapshot):
+        self._job = ('diff', snapshot)
+        self._cancel.clear()
+        self.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, done, total):
+        self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+    def run(self):
+        if self._job is None:
+            return
+        try:
+            if self._job[0] == 'take':
+                snapshot = Snapshot.take(self._dwarf, self._job[1], self._job[2],
+                                         cancel=self._cancel, progress=self._on_progress)
+                self.onSnapshotTaken.emit(snapshot)
+            else:
+                self.onSnapshotDiff.emit(self._job[1].diff(self._dwarf, cancel=self._cancel,
+                                                           progress=self._on_progress))
+        except Snapshot.SnapshotError as e:
+            self.onError.emit(str(e))
+        except Exception as e:  # pylint: disable=broad-except
+            # whoever started us waits for a signal, never die silently
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
@@ -0,0 +1,168 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import json
+import os
+import threading
+from array import array
+
+from lib import utils
+from lib.elf import ELF
+
+
+class ModuleSymbols(object):
+    """ symbols of a module, addresses sorted in an array next to the names
+    """
+
+    def __init__(self, name, base, size, symbols):
+        self.name = name
+        self.base = base
+        self.size = size
+        symbols = sorted(set(symbols))
+        self.addresses = array('Q', (symbol[0] for symbol in symbols))
+        self.names = [symbol[1] for symbol in symbols]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def nearest(self, address):
+        """ (symbol address, name) of the closest symbol at or before address
+        """
+        i = bisect.bisect_right(self.addresses, address) - 1
+        if i < 0:
+            return None
+        return self.addresses[i], self.names[i]
+
+
+class SymbolIndex(object):
+    """ address -> nearest symbol + offset without asking the agent
+
+        modules come from onSetModules. the symbol table of a module is
+        built the first time an address inside it is looked up, from the
+        agent exports and symbols in one round trip, or from the module
+        file when the agent has none and the file is on this machine.
+        tables of modules which are gone or moved are dropped
+    """
+
+    def __init__(self, dwarf):
+        self._dwarf = dwarf
+        self._lock = threading.Lock()
+        self._bases = []
+        self._modules = []
+        # (name, base) -> ModuleSymbols
+        self._tables = {}
+
+    def set_modules(self, modules):
+        entries = sorted(((utils.parse_ptr(module['base']), module) for module in modules),
+                         key=lambda entry: entry[0])
+        with self._lock:
+            self._bases = [entry[0] for entry in entries]
+            self._modules = [entry[1] for entry in entries]
+            alive = set((module['name'], base) for base, module in entries)
+            for key in list(self._tables.keys()):
+                if key not in alive:
+                    del self._tables[key]
+
+    def clear(self):
+        with self._lock:
+            self._bases = []
+            self._modules = []
+            self._tables = {}
+
+    def module_at(self, address):
+        with self._lock:
+            i = bisect.bisect_right(self._bases, address) - 1
+            if i >= 0 and address < self._bases[i] + self._modules[i]['size']:
+                return self._bases[i], self._modules[i]
+        return None
+
+    def module_by_name(self, name):
+        """ (base, module) of the first module called name or None
+        """
+        with self._lock:
+            for base, module in zip(self._bases, self._modules):
+                if module['name'] == name:
+                    return base, module
+        return None
+
+    def table(self, base, module, fetch=True):
+        key = (module['name'], base)
+        with self._lock:
+            table = self._tables.get(key)
+        if table is None and fetch:
+            table = ModuleSymbols(module['name'], base, module['size'], self._fetch(base, module))
+            with self._lock:
+                self._tables[key] = table
+        return table
+
+    def _fetch(self, base, module):
+        symbols = []
+        results = self._dwarf.dwarf_api_batch([
+            ('enumerateExports', module['name']),
+            ('enumerateSymbols', module['name'])
+        ]) or []
+        for result in results:
+            try:
+                entries = json.loads(result) if isinstance(result, str) else []
+            except ValueError:
+                continue
+            for entry in entries:
+                if entry.get('name') and entry.get('address'):
+                    address = utils.parse_ptr(entry['address'])
+                    if base <= address < base + module['size']:
+                        symbols.append((address, entry['name']))
+
+        path = module.get('path')
+        if not symbols and path and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = b''
+            elf = ELF.build(data)
+            if elf is not None:
+                bias = elf.load_bias()
+                symbols = [(base + value - bias, name) for value, name in elf.symbols(data)]
+        return symbols
+
+    def lookup(self, address, fetch=True):
+        """ getSymbolByAddress alike dict or None
+
+            name is symbol+0xoffset when address isn't the symbol start.
+            with fetch False, modules without a table yet give None instead
+            of a round trip
+        """
+        address = utils.parse_ptr(address)
+        found = self.module_at(address)
+        if found is None:
+            return None
+        base, module = found
+        table = self.table(base, module, fetch=fetch)
+        if table is None:
+            return None
+        nearest = table.nearest(address)
+        if nearest is None:
+            return None
+        symbol_address, name = nearest
+        if address != symbol_address:
+            name = '%s+0x%x' % (name, address - symbol_address)
+        return {
+            'address': hex(address),
+            'name': name,
+            'moduleName': module['name'],
+            'symbolAddress': hex(symbol_address)
+        }
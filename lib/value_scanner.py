@@ -0,0 +1,309 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import operator
+import struct
+import sys
+import threading
+from array import array
+from itertools import compress, repeat
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from lib import utils
+from lib.process_dump import stream_memory
+
+# name -> struct / array typecode
+VALUE_TYPES = {
+    'int8': 'b',
+    'uint8': 'B',
+    'int16': 'h',
+    'uint16': 'H',
+    'int32': 'i',
+    'uint32': 'I',
+    'int64': 'q',
+    'uint64': 'Q',
+    'float': 'f',
+    'double': 'd'
+}
+
+# conditions taking a value
+VALUE_CONDITIONS = ('equal', 'not_equal', 'greater', 'less', 'increased_by', 'decreased_by')
+# conditions comparing against the previous scan
+STATE_CONDITIONS = ('changed', 'unchanged', 'increased', 'decreased')
+
+
+class ValueScanner(object):
+    """ find addresses holding a typed value and narrow them down scan after scan
+
+        candidates live in two arrays: addresses ('Q') and the value read at
+        the last scan (typecode of the value type), so tens of millions of
+        hits cost 8 + sizeof(value) bytes each
+
+        the first scan streams the ranges through read_memory_ex and looks
+        for the packed value. next scans re-read the candidates with the
+        agent readValues api, many addresses per request
+    """
+
+    # addresses per readValues request
+    READ_BATCH = 65536
+
+    class ValueScanError(Exception):
+        """ Raised on bad types, values or conditions
+        """
+
+    def __init__(self, dwarf, value_type='int32', endianness='little', aligned=True):
+        if value_type not in VALUE_TYPES:
+            raise ValueScanner.ValueScanError('unknown value type %s' % value_type)
+        if endianness not in ('little', 'big'):
+            raise ValueScanner.ValueScanError('unknown endianness %s' % endianness)
+
+        self._dwarf = dwarf
+        self.value_type = value_type
+        self.endianness = endianness
+        self.aligned = aligned
+
+        self._typecode = VALUE_TYPES[value_type]
+        self._struct = struct.Struct(('<' if endianness == 'little' else '>') + self._typecode)
+        self.value_size = self._struct.size
+
+        self.addresses = array('Q')
+        self.values = array(self._typecode)
+        self.scans = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def reset(self):
+        with self._lock:
+            self.addresses = array('Q')
+            self.values = array(self._typecode)
+            self.scans = 0
+
+    def results(self, start=0, count=100):
+        """ [(address, value)] of a slice of the candidates
+        """
+        with self._lock:
+            return list(zip(self.addresses[start:start + count], self.values[start:start + count]))
+
+    def _pack(self, value):
+        try:
+            if self._typecode in 'fd':
+                value = float(value)
+            else:
+                if isinstance(value, str):
+                    # parse_ptr would turn garbage into 0
+                    value = value.strip()
+                    value = int(value, 16) if value.lower().lstrip('-').startswith('0x') else int(value)
+                else:
+                    value = int(value)
+            return self._struct.pack(value)
+        except (struct.error, ValueError, TypeError) as e:
+            raise ValueScanner.ValueScanError('bad %s value: %s' % (self.value_type, e))
+
+    def _normalize(self, value):
+        # same precision as the values we read back
+        return self._struct.unpack(self._pack(value))[0]
+
+    def _to_values(self, data):
+        values = array(self._typecode)
+        values.frombytes(data)
+        if self.value_size > 1 and self.endianness != sys.byteorder:
+            values.byteswap()
+        return values
+
+    def first_scan(self, ranges, value, progress=None, cancel=None):
+        """ look for value in ranges
+
+        :param ranges: list of (base, size)
+        :param progress: progress(done_bytes, total_bytes)
+        :param cancel: threading.Event
+        :return: number of candidates
+        """
+        needle = self._pack(value)
+        size = self.value_size
+        align = size if self.aligned else 1
+        ranges = sorted((utils.parse_ptr(base), int(length)) for base, length in ranges)
+        total = sum(_range[1] for _range in ranges)
+
+        addresses = array('Q')
+        done = 0
+        for base, length in ranges:
+            if cancel is not None and cancel.is_set():
+                break
+            # bytes of the previous run, values crossing two windows
+            carry = [0, b'']
+
+            def on_data(address, data):
+                if carry[1] and carry[0] + len(carry[1]) == address:
+                    start = carry[0]
+                    data = carry[1] + bytes(data)
+                else:
+                    start = address
+                    data = bytes(data)
+                i = data.find(needle)
+                while i >= 0:
+                    if (start + i) % align == 0:
+                        addresses.append(start + i)
+                    i = data.find(needle, i + 1)
+                # too short to hold a whole value, a match starting here ends in the next run
+                keep = min(size - 1, len(data))
+                carry[0] = start + len(data) - keep
+                carry[1] = data[len(data) - keep:] if keep > 0 else b''
+
+            def on_progress(range_done, base_done=done):
+                if progress is not None:
+                    progress(base_done + range_done, total)
+
+            stream_memory(self._dwarf, base, length, on_data, cancel=cancel, progress=on_progress)
+            done += length
+
+        if cancel is not None and cancel.is_set():
+            raise ValueScanner.ValueScanError('cancelled')
+
+        values = self._to_values(needle * len(addresses))
+        with self._lock:
+            self.addresses = addresses
+            self.values = values
+            self.scans = 1
+        return len(addresses)
+
+    def read_values(self, addresses, progress=None, cancel=None):
+        """ current values at addresses
+
+        :return: (values, readable) where readable is a bytearray of 0 / 1 flags
+        """
+        values = array(self._typecode)
+        readable = bytearray()
+        size = self.value_size
+        for start in range(0, len(addresses), ValueScanner.READ_BATCH):
+            if cancel is not None and cancel.is_set():
+                raise ValueScanner.ValueScanError('cancelled')
+            batch = addresses[start:start + ValueScanner.READ_BATCH]
+            base = batch[0]
+            data = self._dwarf.dwarf_api('readValues', [hex(base), [address - base for address in batch], size])
+            if not isinstance(data, (bytes, bytearray)) or len(data) != len(batch) * (size + 1):
+                # the whole batch is gone
+                values.extend(self._to_values(bytes(len(batch) * size)))
+                readable.extend(bytes(len(batch)))
+            else:
+                values.extend(self._to_values(data[:len(batch) * size]))
+                # the agent flags are 0 / 1 already
+                readable.extend(data[len(batch) * size:])
+            if progress is not None:
+                progress(min(start + ValueScanner.READ_BATCH, len(addresses)), len(addresses))
+        return values, readable
+
+    def next_scan(self, condition, value=None, progress=None, cancel=None):
+        """ narrow the candidates
+
+        :param condition: one of VALUE_CONDITIONS or STATE_CONDITIONS
+        :param value: required by VALUE_CONDITIONS
+        :return: number of candidates left
+        """
+        if self.scans == 0:
+            raise ValueScanner.ValueScanError('no first scan')
+        if condition in VALUE_CONDITIONS:
+            if value is None:
+                raise ValueScanner.ValueScanError('%s needs a value' % condition)
+            value = self._normalize(value)
+        elif condition not in STATE_CONDITIONS:
+            raise ValueScanner.ValueScanError('unknown condition %s' % condition)
+
+        with self._lock:
+            addresses = self.addresses
+            old = self.values
+
+        new, readable = self.read_values(addresses, progress=progress, cancel=cancel)
+
+        # one flag byte per candidate, the readable mask is and-ed in as a big int
+        if condition in ('equal', 'not_equal', 'greater', 'less'):
+            op = {'equal': operator.eq, 'not_equal': operator.ne,
+                  'greater': operator.gt, 'less': operator.lt}[condition]
+            keep = bytearray(map(op, new, repeat(value)))
+        elif condition == 'increased_by':
+            keep = bytearray(self._normalize_delta(n - o) == value for n, o in zip(new, old))
+        elif condition == 'decreased_by':
+            keep = bytearray(self._normalize_delta(o - n) == value for n, o in zip(new, old))
+        else:
+            op = {'changed': operator.ne, 'unchanged': operator.eq,
+                  'increased': operator.gt, 'decreased': operator.lt}[condition]
+            keep = bytearray(map(op, new, old))
+        keep = (int.from_bytes(keep, 'little') & int.from_bytes(readable, 'little')).to_bytes(len(keep), 'little')
+
+        addresses = array('Q', compress(addresses, keep))
+        values = array(self._typecode, compress(new, keep))
+        with self._lock:
+            self.addresses = addresses
+            self.values = values
+            self.scans += 1
+        return len(addresses)
+
+    def _normalize_delta(self, delta):
+        """ delta as the value type holds it, integers wrap around at the type width
+        """
+        if self._typecode in 'fd':
+            return self._struct.unpack(self._struct.pack(delta))[0]
+        bits = self.value_size * 8
+        delta &= (1 << bits) - 1
+        if self._typecode.islower() and delta >= 1 << (bits - 1):
+            delta -= 1 << bits
+        return delta
+
+
+class ValueScanThread(QThread):
+    """ runs a first or next scan of a ValueScanner off the gui thread
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    # candidates left
+    onFinished = pyqtSignal(object, name='onFinished')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, scanner, parent=None):
+        super().__init__(parent=parent)
+        self.scanner = scanner
+        self._cancel = threading.Event()
+        self._job = None
+
+    def first_scan(self, ranges, value):
+        self._job = (self.scanner.first_scan, (ranges, value))
+        self._cancel.clear()
+        self.start()
+
+    def next_scan(self, condition, value=None):
+        self._job = (self.scanner.next_scan, (condition, value))
+        self._cancel.clear()
+        self.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, done, total):
+        self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+    def run(self):
+        if self._job is None:
+            return
+        fn, args = self._job
+        try:
+            self.onFinished.emit(fn(*args, progress=self._on_progress, cancel=self._cancel))
+        except ValueScanner.ValueScanError as e:
+            self.onError.emit(str(e))
+        except Exception as e:  # pylint: disable=broad-except
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
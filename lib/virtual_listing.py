@@ -0,0 +1,258 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+
+from capstone import CsError
+
+from lib.instruction import Instruction
+from lib.range import Range
+
+
+class DataLine(object):
+    """ listing line for bytes capstone can't decode or memory we can't read
+    """
+
+    def __init__(self, address, data, text=None):
+        self.id = 0
+        self.address = address
+        self.bytes = data
+        self.mnemonic = '.byte' if text is None else '??'
+        self.op_str = text if text is not None else ', '.join('0x%02x' % b for b in data)
+        self.operands = []
+        self.groups = []
+        self.thumb = False
+        self.is_jump = False
+        self.jump_address = 0
+        self.symbol_name = None
+        self.symbol_module = None
+        self.string = None
+
+
+class VirtualListing(object):
+    """ listing of a whole module or range, decoded a window at a time
+
+        the range is split in fixed size windows. only the windows around
+        the scroll position are decoded, the last MAX_WINDOWS are kept.
+        every window remembers its line count (estimated until decoded) and
+        the skew of its first instruction, carried over from the previous
+        window so variable length code stays in sync. line <-> address goes
+        through the prefix sums of the counts, a bisect either way
+
+        behaves like a read only list of lines for DisassemblyView, None
+        standing for lines of windows not decoded yet
+    """
+
+    WINDOW_SIZE = 0x1000
+    MAX_WINDOWS = 64
+
+    def __init__(self, dwarf, base, size, arch, mode, instruction_size=4,
+                 window_size=WINDOW_SIZE, max_windows=MAX_WINDOWS):
+        self._dwarf = dwarf
+        self.base = base
+        self.size = size
+        self.arch = arch
+        self.mode = mode
+        # guessed instruction size for the estimates, also the step over undecodable bytes
+        self.instruction_size = instruction_size
+        self._window_size = window_size
+        self._max_windows = max_windows
+
+        windows = max(1, (size + window_size - 1) // window_size)
+        self._counts = array('I', [self._estimate(window) for window in range(windows)])
+        self._skews = bytearray(windows)
+        self._prefix = None
+
+        # window -> (line addresses, lines)
+        self._windows = OrderedDict()
+        self._pending = set()
+
+        self.longest_bytes = 0
+        self.longest_mnemonic = 0
+
+    def __len__(self):
+        return self._prefix_sums()[-1]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.line(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('listing line out of range')
+        return self.line(key)
+
+    def __iter__(self):
+        # only what is decoded, walking the whole range would decode all of it
+        for window in sorted(self._windows):
+            yield from self._windows[window][1]
+
+    def __contains__(self, address):
+        return self.base <= address < self.base + self.size
+
+    @property
+    def windows(self):
+        return len(self._counts)
+
+    def _bounds(self, window):
+        start = self.base + window * self._window_size
+        return start, min(start + self._window_size, self.base + self.size)
+
+    def _estimate(self, window):
+        start, end = self._bounds(window)
+        return max(1, (end - start) // self.instruction_size)
+
+    def _prefix_sums(self):
+        if self._prefix is None:
+            self._prefix = array('Q', [0])
+            self._prefix.extend(accumulate(self._counts))
+        return self._prefix
+
+    def window_of_line(self, line):
+        prefix = self._prefix_sums()
+        return min(max(bisect.bisect_right(prefix, line) - 1, 0), len(self._counts) - 1)
+
+    def window_of_address(self, address):
+        return min(max((address - self.base) // self._window_size, 0), len(self._counts) - 1)
+
+    def line(self, line):
+        window = self.window_of_line(line)
+        entry = self._windows.get(window)
+        if entry is None:
+            return None
+        self._windows.move_to_end(window)
+        index = line - self._prefix_sums()[window]
+        if index >= len(entry[1]):
+            return None
+        return entry[1][index]
+
+    def line_of_address(self, address):
+        """ (line, exact). lines in windows not decoded yet are estimated
+        """
+        window = self.window_of_address(address)
+        first = self._prefix_sums()[window]
+        entry = self._windows.get(window)
+        if entry is None:
+            start = self._bounds(window)[0]
+            return first + min((address - start) // self.instruction_size, self._counts[window] - 1), False
+        index = max(bisect.bisect_right(entry[0], address) - 1, 0)
+        return first + index, True
+
+    def address_of_line(self, line):
+        """ address of a line, estimated in windows not decoded yet
+        """
+        window = self.window_of_line(line)
+        entry = self._windows.get(window)
+        index = line - self._prefix_sums()[window]
+        if entry is not None and index < len(entry[0]):
+            return entry[0][index]
+        start = self._bounds(window)[0] + self._skews[window]
+        return start + index * self.instruction_size
+
+    def missing(self, first_line, last_line, ahead=1):
+        """ windows covering [first_line, last_line] plus ahead windows around,
+            not decoded nor being decoded
+        """
+        first = max(self.window_of_line(first_line) - ahead, 0)
+        last = min(self.window_of_line(last_line) + ahead, len(self._counts) - 1)
+        missing = []
+        for window in range(first, last + 1):
+            if window in self._windows:
+                # still wanted, keep it away from eviction
+                self._windows.move_to_end(window)
+            elif window not in self._pending:
+                missing.append(window)
+        return missing
+
+    def fetch(self, first_line, last_line, callback=None):
+        """ decode the missing windows around the lines in the rpc worker
+
+        :param callback: callback(listing) in the gui thread after each window
+        """
+        for window in self.missing(first_line, last_line):
+            self._pending.add(window)
+
+            def on_decoded(result, window=window):
+                self._pending.discard(window)
+                if result is not None:
+                    self.store(window, *result)
+                    if callback is not None:
+                        callback(self)
+
+            self._dwarf.submit_async(self.decode, window, callback=on_decoded)
+
+    def decode(self, window):
+        """ (lines, address after the last line) of a window, any thread
+        """
+        start, end = self._bounds(window)
+        start += self._skews[window]
+        length = min(end + Range.MAX_INSTRUCTION_SIZE, self.base + self.size) - start
+        code = self._dwarf.read_memory(start, length) if length > 0 else b''
+        if code is None:
+            return [DataLine(start, b'', text='unreadable 0x%x bytes' % (end - start))], end
+
+        try:
+            capstone = self._dwarf.disasm_cache.capstone(self.arch, self.mode)
+        except CsError:
+            return None
+
+        lines = []
+        address = start
+        try:
+            while address < end:
+                offset = address - start
+                for cap_inst in capstone.disasm(code[offset:], address):
+                    lines.append(Instruction(self._dwarf, cap_inst, resolve=False))
+                    address = cap_inst.address + cap_inst.size
+                    if address >= end:
+                        break
+                if address < end:
+                    # capstone stopped on bytes it can't decode
+                    step = min(self.instruction_size, end - address)
+                    lines.append(DataLine(address, bytes(code[address - start:address - start + step])))
+                    address += step
+        finally:
+            self._dwarf.disasm_cache.release(capstone)
+
+        Instruction.resolve_batch(self._dwarf, [line for line in lines if isinstance(line, Instruction)])
+        return lines, address
+
+    def store(self, window, lines, next_address):
+        """ keep a decoded window, gui thread
+        """
+        self._windows[window] = (array('Q', (line.address for line in lines)), lines)
+        self._windows.move_to_end(window)
+        while len(self._windows) > self._max_windows:
+            self._windows.popitem(last=False)
+
+        if self._counts[window] != len(lines):
+            self._counts[window] = len(lines)
+            self._prefix = None
+
+        for line in lines:
+            self.longest_bytes = max(self.longest_bytes, len(line.bytes))
+            self.longest_mnemonic = max(self.longest_mnemonic, len(line.mnemonic))
+
+        following = window + 1
+        if following < len(self._counts):
+            skew = next_address - self._bounds(following)[0]
+            if 0 <= skew < 256 and skew != self._skews[following]:
+                # decoded out of sync, redo it on the next fetch
+                self._skews[following] = skew
+                self._windows.pop(following, None)
@@ -0,0 +1,319 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import bisect
+import threading
+from array import array
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from capstone import CsError, CS_MODE_ARM, CS_MODE_THUMB
+
+from lib.analysis import (ModuleAnalyzer, immediate_target, FLOW_CALL, FLOW_CALL_SWITCH,
+                          FLOW_JUMP, FLOW_BRANCH)
+
+# reference kinds
+XREF_CALL = 0
+XREF_JUMP = 1
+# pc relative, adrp + add/ldr or absolute memory operand
+XREF_DATA = 2
+# pointer sized value in a data range
+XREF_POINTER = 3
+
+XREF_KINDS = ('call', 'jump', 'data', 'pointer')
+
+
+class XrefIndex(object):
+    """ references found in a module, sorted by target
+
+        targets, sources and kinds are parallel arrays, the references to
+        an address are the run of equal targets found with two bisects
+    """
+
+    def __init__(self, name, base, size):
+        self.name = name
+        self.base = base
+        self.size = size
+        self.targets = array('Q')
+        self.sources = array('Q')
+        self.kinds = array('B')
+
+    def __len__(self):
+        return len(self.targets)
+
+    @staticmethod
+    def build(name, base, size, sources, targets, kinds):
+        """ XrefIndex of unsorted parallel arrays
+        """
+        index = XrefIndex(name, base, size)
+        order = sorted(range(len(targets)), key=targets.__getitem__)
+        index.targets = array('Q', (targets[i] for i in order))
+        index.sources = array('Q', (sources[i] for i in order))
+        index.kinds = array('B', (kinds[i] for i in order))
+        return index
+
+    def references(self, address):
+        """ [(source, kind)] referencing address
+        """
+        first = bisect.bisect_left(self.targets, address)
+        last = bisect.bisect_right(self.targets, address, first)
+        return [(self.sources[i], self.kinds[i]) for i in range(first, last)]
+
+    def references_in(self, start, end):
+        """ [(source, target, kind)] referencing [start, end)
+        """
+        first = bisect.bisect_left(self.targets, start)
+        last = bisect.bisect_left(self.targets, end, first)
+        return [(self.sources[i], self.targets[i], self.kinds[i]) for i in range(first, last)]
+
+
+class XrefIndexer(object):
+    """ code and data references of a module
+
+        code is walked block by block out of the module analysis (see
+        lib/analysis.py), so arm and thumb are decoded in the right mode.
+        branch and call targets come from the immediate operands, data
+        references from pc relative operands, adrp pages followed by an
+        add or a load, and absolute memory operands. the readable, not
+        executable ranges of the module are swept for pointer sized values
+        landing in a mapping. data targets outside the memory map are
+        dropped
+    """
+
+    def __init__(self, dwarf, module, analyzer=None):
+        self._dwarf = dwarf
+        self._analyzer = analyzer or ModuleAnalyzer(dwarf, module)
+        self.name = self._analyzer.name
+        self.base = self._analyzer.base
+        self.size = self._analyzer.size
+        self.arch = self._analyzer.arch
+        self.pointer_size = dwarf.pointer_size
+        self.analysis = None
+
+        self._sources = array('Q')
+        self._targets = array('Q')
+        self._kinds = array('B')
+        # sorted (start, end, executable) of the memory map
+        self._ranges = []
+        self._range_starts = []
+
+    def _snapshot_ranges(self):
+        ranges = []
+        for _range in self._dwarf.memory_map.ranges:
+            start = int(_range['base'], 16)
+            ranges.append((start, start + _range['size'], 'x' in _range['protection']))
+        ranges.sort()
+        self._ranges = ranges
+        self._range_starts = [start for start, _, _ in ranges]
+
+    def _mapping(self, address):
+        i = bisect.bisect_right(self._range_starts, address) - 1
+        if i >= 0 and address < self._ranges[i][1]:
+            return self._ranges[i]
+        return None
+
+    def _add(self, source, target, kind):
+        self._sources.append(source)
+        self._targets.append(target)
+        self._kinds.append(kind)
+
+    def run(self, cancel=None, progress=None, status=None):
+        """ XrefIndex of the module, None when cancelled
+
+        :param progress: progress(done, total)
+        :param status: status(str)
+        """
+        self.analysis = self._analyzer.run(cancel=cancel, progress=progress, status=status)
+        if self.analysis is None:
+            return None
+        image = self._analyzer.image
+        if image is None:
+            # analysis from the cache, the bytes are still needed
+            image = self._analyzer.read_image(cancel=cancel, progress=progress)
+            if image is None:
+                return None
+
+        if status is not None:
+            status('indexing %s' % self.name)
+        self._snapshot_ranges()
+        if self._code(image, cancel=cancel, progress=progress) is None:
+            return None
+        if self._pointers(image, cancel=cancel) is None:
+            return None
+        return XrefIndex.build(self.name, self.base, self.size, self._sources, self._targets, self._kinds)
+
+    def _code(self, image, cancel=None, progress=None):
+        cs, flow = self._analyzer.capstone()
+        if self.arch == 'arm64':
+            data_ref = self._data_arm64
+        elif self.arch == 'arm':
+            data_ref = self._data_arm
+        else:
+            data_ref = self._data_x86
+
+        analysis = self.analysis
+        blocks = len(analysis.block_starts)
+        for i in range(blocks):
+            if cancel is not None and cancel.is_set():
+                return None
+            start = analysis.block_starts[i]
+            end = analysis.block_ends[i]
+            thumb = analysis.block_modes[i] == 1
+            if self.arch == 'arm':
+                mode = CS_MODE_THUMB if thumb else CS_MODE_ARM
+                if cs.mode != mode:
+                    cs.mode = mode
+
+            # adrp pages by register, within the block
+            pages = {}
+            for address, size, mnemonic, op_str in cs.disasm_lite(bytes(image[start:end]), self.base + start):
+                kind = flow(mnemonic, op_str)
+                if kind in (FLOW_CALL, FLOW_CALL_SWITCH, FLOW_JUMP, FLOW_BRANCH):
+                    target = immediate_target(op_str)
+                    if target is not None:
+                        self._add(address, target, XREF_CALL if kind in (FLOW_CALL, FLOW_CALL_SWITCH) else XREF_JUMP)
+                        continue
+                # indirect flow through memory, call [rip + x] or ldrne pc, [pc, #x], references its slot
+                target = data_ref(address, size, mnemonic, op_str, thumb, pages)
+                if target is not None and self._mapping(target) is not None:
+                    self._add(address, target, XREF_DATA)
+
+            if progress is not None and i % 4096 == 0:
+                progress(i, blocks)
+        return True
+
+    @staticmethod
+    def _data_x86(address, size, mnemonic, op_str, thumb, pages):
+        i = op_str.find('[rip')
+        if i >= 0:
+            # [rip + 0x10] is relative to the next instruction
+            try:
+                return address + size + int(op_str[i + 4:op_str.index(']', i)].replace(' ', ''), 0)
+            except ValueError:
+                return None
+        i = op_str.find('[0x')
+        if i >= 0:
+            try:
+                return int(op_str[i + 1:op_str.index(']', i)], 0)
+            except ValueError:
+                return None
+        return None
+
+    @staticmethod
+    def _data_arm64(address, size, mnemonic, op_str, thumb, pages):
+        operands = [operand.strip() for operand in op_str.split(',')]
+        if mnemonic == 'adrp':
+            pages[operands[0]] = immediate_target(op_str)
+            return None
+        target = None
+        if mnemonic == 'adr':
+            target = immediate_target(op_str)
+        elif mnemonic == 'add' and len(operands) == 3 and pages.get(operands[1]) is not None:
+            offset = immediate_target(operands[2])
+            if offset is not None:
+                target = pages[operands[1]] + offset
+        elif mnemonic.startswith('ldr') or mnemonic.startswith('str'):
+            if '[' not in op_str:
+                # literal load
+                target = immediate_target(op_str)
+            else:
+                memory = op_str[op_str.index('[') + 1:op_str.index(']')].split(',')
+                register = memory[0].strip()
+                if pages.get(register) is not None:
+                    offset = immediate_target(memory[1]) if len(memory) > 1 else 0
+                    target = pages[register] + (offset or 0)
+        if not mnemonic.startswith('st'):
+            # the page register is overwritten
+            pages.pop(operands[0], None)
+        return target
+
+    @staticmethod
+    def _data_arm(address, size, mnemonic, op_str, thumb, pages):
+        mnemonic = mnemonic.split('.', 1)[0]
+        # pc reads as the instruction + 8, + 4 word aligned in thumb
+        pc = (address + 4) & ~3 if thumb else address + 8
+        if mnemonic.startswith('adr'):
+            offset = immediate_target(op_str)
+            return pc + offset if offset is not None else None
+        if mnemonic.startswith('ldr') and '[pc' in op_str:
+            memory = op_str[op_str.index('[pc') + 1:op_str.index(']')].split(',')
+            offset = immediate_target(memory[1]) if len(memory) > 1 else 0
+            return pc + offset if offset is not None else None
+        return None
+
+    def _pointers(self, image, cancel=None):
+        typecode = 'Q' if self.pointer_size == 8 else 'I'
+        thumb_bit = self.arch == 'arm'
+        low = self._range_starts[0] if self._ranges else 0
+        high = self._ranges[-1][1] if self._ranges else 0
+        for start, end, protection in self._analyzer.module_ranges():
+            if 'r' not in protection or 'x' in protection:
+                continue
+            if cancel is not None and cancel.is_set():
+                return None
+            start += -start % self.pointer_size
+            end -= (end - start) % self.pointer_size
+            values = array(typecode)
+            values.frombytes(bytes(image[start:end]))
+            source = self.base + start
+            for value in values:
+                if low <= value < high:
+                    mapping = self._mapping(value)
+                    if mapping is not None:
+                        if thumb_bit and mapping[2]:
+                            # thumb function pointers
+                            value &= ~1
+                        self._add(source, value, XREF_POINTER)
+                source += self.pointer_size
+        return True
+
+
+class XrefThread(QThread):
+    """ runs an XrefIndexer off the gui thread
+    """
+
+    # percentage
+    onProgress = pyqtSignal(int, name='onProgress')
+    onStatus = pyqtSignal(str, name='onStatus')
+    # XrefIndex
+    onFinished = pyqtSignal(object, name='onFinished')
+    onError = pyqtSignal(str, name='onError')
+
+    def __init__(self, indexer, parent=None):
+        super().__init__(parent=parent)
+        self.indexer = indexer
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, done, total):
+        self.onProgress.emit(int(done * 100 / max(total, 1)))
+
+    def run(self):
+        try:
+            index = self.indexer.run(cancel=self._cancel, progress=self._on_progress,
+                                     status=self.onStatus.emit)
+        except (ModuleAnalyzer.AnalysisError, CsError) as e:
+            self.onError.emit(str(e))
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            # dwarf waits on a signal to allow another run on the module
+            self.onError.emit('%s: %s' % (type(e).__name__, e))
+            return
+        if index is None:
+            self.onError.emit('cancelled')
+        else:
+            self.onFinished.emit(index)
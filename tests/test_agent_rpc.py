@@ -0,0 +1,99 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+from lib import protocol
+
+try:
+    import frida
+except ImportError:
+    frida = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# time.sleep doesn't go through usleep, call it directly
+TARGET = 'import ctypes\nlibc = ctypes.CDLL(None)\nwhile True:\n    libc.usleep(1000)\n'
+
+
+@unittest.skipIf(frida is None, 'frida is not installed')
+class AgentRpcTest(unittest.TestCase):
+    """ lib/core.js loaded in a python child, api functions called the way the host does """
+
+    def setUp(self):
+        self.child = subprocess.Popen([sys.executable, '-c', TARGET])
+        # give the child time to load libc
+        time.sleep(0.5)
+        try:
+            self.session = frida.attach(self.child.pid)
+        except frida.PermissionDeniedError:
+            self.child.kill()
+            self.skipTest('can not attach to the child')
+        with open(os.path.join(ROOT, 'lib', 'core.js'), 'r') as f:
+            self.script = self.session.create_script(f.read(), runtime='v8')
+        self.frames = []
+        self.errors = []
+        self.script.on('message', self._on_message)
+        self.script.load()
+
+    def tearDown(self):
+        try:
+            self.session.detach()
+        finally:
+            self.child.kill()
+            self.child.wait()
+
+    def _on_message(self, message, data):
+        if protocol.is_frame(message, data):
+            self.frames.append(protocol.decode(data))
+        elif message['type'] == 'error':
+            self.errors.append(message)
+
+    def api(self, name, *args):
+        return self.script.exports_sync.api(0, name, list(args))
+
+    def test_telescope(self):
+        usleep = self.api('evaluateFunction', "return Module.findExportByName(null, 'usleep').toString()")
+        result = self.api('telescope', ['0x0', usleep])
+        # unmapped, then the code of usleep: a value, not an error entry
+        self.assertEqual(result[0], [[-1, '']])
+        self.assertEqual(result[1][0][0], 2)
+        self.assertEqual(self.errors, [])
+
+    def test_update_ranges(self):
+        self.api('updateRanges')
+        ranges = [frame.meta for frame in self.frames if frame.type == 'update_ranges']
+        self.assertEqual(len(ranges), 1)
+        self.assertTrue(any('x' in r['protection'] for r in ranges[0]))
+        self.assertEqual(self.errors, [])
+
+    def test_context_details(self):
+        tid = self.api('evaluateFunction', 'var t = Process.enumerateThreads()[0]; '
+                                           'getDwarf().hook_contexts[t.id] = {context: t.context}; '
+                                           'return t.id')
+        details = self.api('contextDetails', tid)
+        self.assertIn('context', details)
+        self.assertEqual(details['backtrace']['type'], 'native')
+        self.assertTrue(len(details['backtrace']['bt']) > 0)
+        self.assertEqual(self.errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lib.analysis import EDGE_CALL, EDGE_FALL, EDGE_JUMP, AnalysisThread, ModuleAnalyzer
+from lib.memory_reader import MemoryReadResult
+
+BASE = 0x10000
+
+
+def _rel(target, address, length):
+    return (target - (address + length)).to_bytes(4, 'little', signed=True)
+
+
+def _image():
+    """ x64 code page and a data page
+
+        0x00  call 0x10
+        0x05  ret
+        0x10  test eax, eax
+        0x12  je 0x15
+        0x14  nop
+        0x15  lea rax, [rip + 0x108 - 0x1c]
+        0x1c  ret
+        0x100 pointer to 0x10
+    """
+    code = bytearray(b'\xcc' * 0x100)
+    code[0x00:0x05] = b'\xe8' + _rel(0x10, 0x00, 5)
+    code[0x05] = 0xc3
+    code[0x10:0x12] = b'\x85\xc0'
+    code[0x12:0x14] = b'\x74\x01'
+    code[0x14] = 0x90
+    code[0x15:0x1c] = b'\x48\x8d\x05' + _rel(0x108, 0x15, 7)
+    code[0x1c] = 0xc3
+    data = bytearray(0x100)
+    data[0:8] = (BASE + 0x10).to_bytes(8, 'little')
+    return code + data
+
+
+class _Table(object):
+    addresses = [BASE]
+
+
+class _Symbols(object):
+    def __init__(self, size):
+        self.size = size
+
+    def module_at(self, address):
+        return BASE, {'name': 'test', 'size': self.size}
+
+    def table(self, base, module, fetch=True):
+        return _Table()
+
+
+class _MemoryMap(object):
+    ranges = [{'base': hex(BASE), 'size': 0x100, 'protection': 'r-x'},
+              {'base': hex(BASE + 0x100), 'size': 0x100, 'protection': 'rw-'}]
+
+
+class FakeDwarf(object):
+    arch = 'x64'
+    pointer_size = 8
+    memory_map = _MemoryMap()
+
+    def __init__(self, image):
+        self.image = image
+        self.symbols = _Symbols(len(image))
+
+    def read_memory(self, ptr, length):
+        return bytes(self.image[ptr - BASE:ptr - BASE + length])
+
+    def read_memory_ex(self, ptr, length, progress=None, cancel=None):
+        result = MemoryReadResult(ptr, bytearray(self.image[ptr - BASE:ptr - BASE + length]))
+        result.cancelled = cancel is not None and cancel.is_set()
+        return result
+
+
+class AnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.dwarf = FakeDwarf(_image())
+        self.module = {'name': 'test', 'base': BASE, 'size': len(self.dwarf.image)}
+
+    def analyzer(self):
+        return ModuleAnalyzer(self.dwarf, self.module, path=self.path)
+
+    def test_functions_and_blocks(self):
+        analysis = self.analyzer().run()
+        self.assertEqual(list(analysis.functions), [0x00, 0x10])
+        self.assertTrue(analysis.is_function(BASE + 0x10))
+        self.assertEqual(analysis.function_start(BASE + 0x16), BASE + 0x10)
+        self.assertEqual(analysis.block_at(BASE + 0x12), (BASE + 0x10, BASE + 0x14, False))
+        self.assertIsNone(analysis.block_at(BASE + 0x08))
+
+    def test_edges(self):
+        analysis = self.analyzer().run()
+        self.assertEqual(analysis.successors(BASE), [(BASE + 0x10, EDGE_CALL)])
+        self.assertEqual(analysis.successors(BASE + 0x10), [(BASE + 0x14, EDGE_FALL), (BASE + 0x15, EDGE_JUMP)])
+        # calls aren't followed
+        self.assertEqual(analysis.function_blocks(BASE + 0x10),
+                         [(BASE + 0x10, BASE + 0x14), (BASE + 0x14, BASE + 0x15), (BASE + 0x15, BASE + 0x1d)])
+
+    def test_cached_analysis(self):
+        first = self.analyzer().run()
+        analyzer = self.analyzer()
+        # same code, the second analysis is loaded from the cache
+        analyzer._analyze = None
+        cached = analyzer.run()
+        self.assertEqual(list(cached.block_starts), list(first.block_starts))
+        self.assertEqual(list(cached.edge_targets), list(first.edge_targets))
+        self.assertEqual(cached.base, BASE)
+
+    def test_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(self.analyzer().run(cancel=cancel))
+
+
+def run_thread(thread):
+    """ signals of a thread run in place, it always ends with onFinished or onError
+    """
+    results = []
+    thread.onFinished.connect(lambda result: results.append(('finished', result)))
+    thread.onError.connect(lambda error: results.append(('error', error)))
+    thread.run()
+    return results
+
+
+class AnalysisThreadTest(unittest.TestCase):
+
+    def test_cancelled_run(self):
+        analyzer = ModuleAnalyzer(FakeDwarf(_image()), {'name': 'test', 'base': BASE, 'size': 0x200})
+        analyzer.run = lambda cancel=None, progress=None, status=None: None
+        self.assertEqual(run_thread(AnalysisThread(analyzer)), [('error', 'cancelled')])
+
+    def test_unexpected_error(self):
+        analyzer = ModuleAnalyzer(FakeDwarf(_image()), {'name': 'test', 'base': BASE, 'size': 0x200})
+
+        def fail(cancel=None, progress=None, status=None):
+            raise KeyError('base')
+
+        analyzer.run = fail
+        self.assertEqual(run_thread(AnalysisThread(analyzer)), [('error', "KeyError: 'base'")])
+
+
+if __name__ == '__main__':
+    unittest.main()
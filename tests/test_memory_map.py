@@ -0,0 +1,64 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib.memory_map import MemoryMap
+
+
+def _range(base, size, protection='rw-'):
+    return {'base': hex(base), 'size': size, 'protection': protection}
+
+
+class MemoryMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map = MemoryMap()
+        # set out of order, kept sorted by base
+        self.map.set_ranges([_range(0x3000, 0x1000, 'r-x'), _range(0x1000, 0x1000), _range(0x5000, 0x2000, '---')])
+
+    def bases(self):
+        return [int(r['base'], 16) for r in self.map.ranges]
+
+    def test_find(self):
+        self.assertEqual(self.bases(), [0x1000, 0x3000, 0x5000])
+        self.assertEqual(self.map.find(0x3fff)['base'], '0x3000')
+        self.assertIsNone(self.map.find(0x2000))
+        self.assertIsNone(self.map.find(0x7000))
+        self.assertIsNone(self.map.find(0xfff))
+
+    def test_pointer_checks(self):
+        self.assertTrue(self.map.is_valid_pointer(0x5000))
+        self.assertFalse(self.map.is_readable(0x5000))
+        self.assertTrue(self.map.is_readable(0x1010))
+        self.assertFalse(self.map.is_valid_pointer(0))
+
+    def test_apply_delta(self):
+        # 0x3000 changed protection, 0x5000 is gone, 0x9000 is new
+        self.map.apply_delta([_range(0x3000, 0x1000, 'rwx'), _range(0x9000, 0x1000)], ['0x3000', '0x5000'])
+        self.assertEqual(self.bases(), [0x1000, 0x3000, 0x9000])
+        self.assertEqual(self.map.find(0x3000)['protection'], 'rwx')
+        self.assertIsNone(self.map.find(0x5000))
+
+    def test_add_replaces_what_it_covers(self):
+        self.map.add(_range(0x1800, 0x2000))
+        # 0x1000 overlapped the start, 0x3000 the end
+        self.assertEqual(self.bases(), [0x1800, 0x5000])
+        self.assertEqual(len(self.map), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
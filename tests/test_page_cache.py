@@ -0,0 +1,98 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib.page_cache import PageCache
+
+PAGE = 0x100
+BASE = 0x10000
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = bytearray(i & 0xff for i in range(PAGE * 32))
+        self.reads = []
+        self.cache = PageCache(self.reader, page_size=PAGE, budget=PAGE * 16)
+        self.invalidated = []
+        self.cache.add_listener(lambda ptr, length: self.invalidated.append((ptr, length)))
+
+    def reader(self, ptr, length):
+        self.reads.append((ptr, length))
+        offset = ptr - BASE
+        if offset < 0 or offset + length > len(self.memory):
+            return None
+        return bytes(self.memory[offset:offset + length])
+
+    def test_read_across_pages_then_hit(self):
+        self.assertEqual(self.cache.read(BASE + PAGE - 2, 4), bytes(self.memory[PAGE - 2:PAGE + 2]))
+        # both pages in one run
+        self.assertEqual(self.reads, [(BASE, PAGE * 2)])
+        self.assertEqual(self.cache.read(BASE + 1, 2), bytes(self.memory[1:3]))
+        self.assertEqual(len(self.reads), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_missing_pages_fetched_in_runs(self):
+        self.cache.read(BASE + PAGE, 1)
+        self.reads = []
+        self.cache.read(BASE, PAGE * 4)
+        self.assertEqual(self.reads, [(BASE, PAGE), (BASE + PAGE * 2, PAGE * 2)])
+
+    def test_unreadable_is_none(self):
+        self.assertIsNone(self.cache.read(BASE + len(self.memory) - 1, 2))
+        self.assertEqual(self.cache.read(BASE, 0), b'')
+
+    def test_lru_eviction(self):
+        for page in range(20):
+            self.cache.read(BASE + page * PAGE, 1)
+        self.assertEqual(self.cache.size(), PAGE * 16)
+        self.reads = []
+        self.cache.read(BASE, 1)
+        self.assertEqual(self.reads, [(BASE, PAGE)])
+
+    def test_huge_reads_skip_the_cache(self):
+        # over a quarter of the budget
+        self.cache.read(BASE, PAGE * 5)
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_invalidate(self):
+        self.cache.read(BASE, PAGE * 2)
+        self.memory[PAGE + 1] = 0xaa
+        self.cache.invalidate(BASE + PAGE + 1, 1)
+        self.assertEqual(self.invalidated, [(BASE + PAGE + 1, 1)])
+        self.assertEqual(self.cache.read(BASE + PAGE + 1, 1), b'\xaa')
+        self.assertEqual(self.cache.size(), PAGE * 2)
+
+    def test_drop_writable(self):
+        self.cache.set_ranges([{'base': hex(BASE), 'size': PAGE, 'protection': 'rw-'},
+                               {'base': hex(BASE + PAGE), 'size': PAGE, 'protection': 'r-x'}])
+        self.cache.read(BASE, PAGE * 2)
+        self.cache.drop_writable()
+        self.assertEqual(self.invalidated, [(BASE, PAGE)])
+        self.reads = []
+        self.cache.read(BASE, PAGE * 2)
+        self.assertEqual(self.reads, [(BASE, PAGE)])
+
+    def test_page_size_change_clears(self):
+        self.cache.read(BASE, 1)
+        self.cache.page_size = PAGE * 2
+        self.assertEqual(self.cache.size(), 0)
+        self.assertEqual(self.invalidated, [(0, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib import protocol
+
+
+class ProtocolTest(unittest.TestCase):
+
+    def test_peek_type_round_trip(self):
+        for type_ in protocol.MESSAGE_TYPES.values():
+            frame = protocol.encode(type_, tid=1234, seq=7, meta={'id': 1}, raw=b'\x00\x01')
+            self.assertEqual(protocol.peek_type(frame), type_)
+            self.assertEqual(protocol.decode(frame).type, type_)
+
+    def test_peek_type_not_a_frame(self):
+        self.assertIsNone(protocol.peek_type(None))
+        self.assertIsNone(protocol.peek_type(b'DW'))
+        self.assertIsNone(protocol.peek_type(b'XX' + bytes(protocol.FRAME_HEADER_SIZE)))
+
+    def test_decode_round_trip(self):
+        frame = protocol.encode('api_result', tid=42, seq=3, meta={'id': 9, 'result': [1, 2]}, raw=b'abc')
+        msg = protocol.decode(frame)
+        self.assertEqual((msg.tid, msg.seq, msg.meta, msg.raw), (42, 3, {'id': 9, 'result': [1, 2]}, b'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib.range import RangeBuffer
+
+BASE = 0x10000
+WINDOW = 0x100
+
+
+class RangeBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = bytes(i & 0xff for i in range(WINDOW * 8))
+        self.reads = []
+
+    def reader(self, ptr, length):
+        self.reads.append((ptr, length))
+        offset = ptr - BASE
+        return self.memory[offset:offset + length]
+
+    def buffer(self):
+        return RangeBuffer(self.reader, BASE, len(self.memory), window_size=WINDOW)
+
+    def test_reads_windows_lazily(self):
+        buf = self.buffer()
+        self.assertEqual(self.reads, [])
+        self.assertEqual(buf[WINDOW + 5], self.memory[WINDOW + 5])
+        self.assertEqual(self.reads, [(BASE + WINDOW, WINDOW)])
+        self.assertEqual(buf[WINDOW - 4:WINDOW + 4], self.memory[WINDOW - 4:WINDOW + 4])
+
+    def test_unreadable_window_reads_as_zeros(self):
+        buf = RangeBuffer(lambda ptr, length: None, BASE, WINDOW * 2, window_size=WINDOW)
+        self.assertEqual(buf[0:WINDOW * 2], bytes(WINDOW * 2))
+
+    def test_patch_applies_to_loaded_and_later_windows(self):
+        buf = self.buffer()
+        buf[0:4]
+        buf.patch(WINDOW - 2, b'\xaa' * 4)
+        self.assertEqual(buf[WINDOW - 3:WINDOW + 3], self.memory[WINDOW - 3:WINDOW - 2] + b'\xaa' * 4 +
+                         self.memory[WINDOW + 2:WINDOW + 3])
+
+    def test_newer_patch_trims_older_spans(self):
+        buf = self.buffer()
+        buf.patch(10, b'\x01' * 10)
+        buf.patch(30, b'\x02' * 10)
+        buf.patch(15, b'\x03' * 20)
+        self.assertEqual(buf.patches(), [(10, b'\x01' * 5), (15, b'\x03' * 20), (35, b'\x02' * 5)])
+        self.assertEqual(buf[10:40], b'\x01' * 5 + b'\x03' * 20 + b'\x02' * 5)
+
+    def test_patch_inside_a_span_splits_it(self):
+        buf = self.buffer()
+        buf.patch(10, b'\x01' * 10)
+        buf.patch(12, b'\x02\x02')
+        self.assertEqual(buf.patches(), [(10, b'\x01' * 2), (12, b'\x02' * 2), (14, b'\x01' * 6)])
+        self.assertEqual(buf.patches(13, 1), [(12, b'\x02' * 2)])
+
+    def test_patches_survive_eviction(self):
+        max_windows = RangeBuffer.MAX_WINDOWS
+        # the window read and its read ahead, nothing more
+        RangeBuffer.MAX_WINDOWS = RangeBuffer.READ_AHEAD + 1
+        self.addCleanup(setattr, RangeBuffer, 'MAX_WINDOWS', max_windows)
+
+        buf = self.buffer()
+        buf[3] = 0xff
+        for offset in range(0, len(self.memory), WINDOW):
+            buf[offset]
+        self.assertFalse(buf.is_loaded(0))
+        self.assertEqual(buf[3], 0xff)
+        self.assertEqual(bytes(buf)[3], 0xff)
+        self.assertEqual(bytes(buf)[4], self.memory[4])
+
+    def test_setitem_can_not_resize(self):
+        buf = self.buffer()
+        with self.assertRaises(ValueError):
+            buf[0:4] = b'\x00'
+        with self.assertRaises(IndexError):
+            buf[len(self.memory)] = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
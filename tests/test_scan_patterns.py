@@ -0,0 +1,56 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib.scan_patterns import PatternError, parse_hex, parse_needles
+
+
+class ScanPatternsTest(unittest.TestCase):
+
+    def test_parse_hex_nibble_wildcards(self):
+        needle = parse_hex('de ad ?? e?')
+        self.assertEqual(needle.data, [0xde, 0xad, 0x00, 0xe0])
+        self.assertEqual(needle.mask, [0xff, 0xff, 0x00, 0xf0])
+        self.assertTrue(needle.has_nibble_mask)
+        self.assertTrue(needle.matches(b'\xde\xad\x12\xe7'))
+        self.assertFalse(needle.matches(b'\xde\xad\x12\xf7'))
+        self.assertFalse(needle.matches(b'\xde\xad'))
+
+    def test_parse_hex_frida_pattern(self):
+        needle = parse_hex('dead??ef')
+        self.assertFalse(needle.has_nibble_mask)
+        self.assertEqual(needle.to_frida_pattern(), 'de ad ?? ef')
+
+    def test_parse_hex_errors(self):
+        for text in ('', 'dea', 'zz', '????'):
+            with self.assertRaises(PatternError):
+                parse_hex(text)
+
+    def test_parse_needles(self):
+        needles = parse_needles('# header\n\ndeadbeef\n"abc"\n  u"ab"  \n')
+        self.assertEqual([needle.name for needle in needles], ['deadbeef', '"abc"', 'u"ab"'])
+        self.assertEqual(needles[1].data, list(b'abc'))
+        self.assertEqual(needles[2].data, list(b'a\x00b\x00'))
+        self.assertTrue(all(needle.is_exact for needle in needles))
+
+    def test_parse_needles_bad_line(self):
+        with self.assertRaises(PatternError):
+            parse_needles('deadbeef\nnot hex')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import unittest
+
+from lib.search_results import COLUMN_ADDRESS, COLUMN_PATTERN, COLUMN_RANGE, SearchResults
+
+
+class SearchResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = SearchResults()
+        self.assertEqual(self.results.add(0, [0x3000, 0x1000], [1, 0]), 0)
+        self.assertEqual(self.results.add(1, [0x2000, 0x5000]), 2)
+
+    def test_columns(self):
+        self.assertEqual(len(self.results), 4)
+        self.assertEqual(list(self.results.column(COLUMN_ADDRESS)), [0x3000, 0x1000, 0x2000, 0x5000])
+        self.assertEqual(list(self.results.column(COLUMN_PATTERN)), [1, 0, 0, 0])
+        self.assertEqual(list(self.results.column(COLUMN_RANGE)), [0, 0, 1, 1])
+        self.assertEqual(self.results.count(COLUMN_RANGE, 1), 2)
+
+    def test_select(self):
+        self.assertEqual(list(self.results.select()), [0, 1, 2, 3])
+        self.assertEqual(list(self.results.select(range_index=1)), [2, 3])
+        self.assertEqual(list(self.results.select(range_index=0, pattern=1)), [0])
+        self.assertEqual(list(self.results.select(pattern=0, start=2)), [2, 3])
+
+    def test_sort(self):
+        rows = self.results.select()
+        self.assertEqual(list(self.results.sort(rows, COLUMN_ADDRESS)), [1, 2, 0, 3])
+        self.assertEqual(list(self.results.sort(rows, COLUMN_ADDRESS, reverse=True)), [3, 0, 2, 1])
+
+    def test_in_range(self):
+        self.assertEqual(list(self.results.in_range(0x1000, 0x3000)), [1, 2])
+        # the address index is rebuilt after an add
+        self.results.add(2, [0x2800])
+        self.assertEqual(list(self.results.in_range(0x1000, 0x3000)), [1, 2, 4])
+        self.assertEqual(list(self.results.in_range(0x6000, 0x7000)), [])
+
+    def test_clear(self):
+        self.results.clear()
+        self.assertEqual(len(self.results), 0)
+        self.assertEqual(list(self.results.in_range(0, 0x10000)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lib.memory_reader import MemoryReadResult
+from lib.snapshot import SNAPSHOT_INDEX, Snapshot, changed_runs
+
+PAGE = 0x100
+BASE = 0x10000
+
+
+class _PageCache(object):
+    page_size = PAGE
+
+
+class FakeDwarf(object):
+    """ a readable block at BASE, pageHashes and read_memory_ex answered from it
+    """
+
+    pid = 1
+    page_cache = _PageCache()
+
+    def __init__(self, size):
+        self.memory = bytearray(size)
+
+    def read_memory_ex(self, ptr, length, progress=None, cancel=None):
+        offset = ptr - BASE
+        return MemoryReadResult(ptr, bytearray(self.memory[offset:offset + length]))
+
+    def dwarf_api(self, api, args):
+        assert api == 'pageHashes'
+        start = int(args[0], 16) - BASE
+        hashes = b''.join(hashlib.blake2b(self.memory[offset:offset + PAGE], digest_size=8).digest()
+                          for offset in range(start, start + args[1], PAGE))
+        return hashes + b'\x01' * (args[1] // PAGE)
+
+
+class ChangedRunsTest(unittest.TestCase):
+
+    def test_no_change(self):
+        data = bytes(range(200))
+        self.assertEqual(changed_runs(0x1000, data, data), [])
+
+    def test_runs(self):
+        old = bytearray(200)
+        new = bytearray(200)
+        new[3:6] = b'\x01\x01\x01'
+        new[63:66] = b'\x02\x02\x02'
+        new[199] = 0xff
+        # a run crossing a compare block stays one run
+        self.assertEqual(changed_runs(0x1000, bytes(old), bytes(new)),
+                         [[0x1003, 3], [0x103f, 3], [0x10c7, 1]])
+
+    def test_shorter_side_bounds_the_compare(self):
+        self.assertEqual(changed_runs(0, b'\x00\x01', b'\x00\x02\x03'), [[1, 1]])
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.dwarf = FakeDwarf(PAGE * 4)
+
+    def test_take_and_diff(self):
+        snapshot = Snapshot.take(self.dwarf, [(hex(BASE), PAGE * 4)], self.path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(snapshot.diff(self.dwarf).runs, [])
+
+        self.dwarf.memory[PAGE - 1:PAGE + 1] = b'\xaa\xaa'
+        self.dwarf.memory[PAGE * 3 + 8] = 0x01
+        diff = snapshot.diff(self.dwarf)
+        # merged across the page boundary
+        self.assertEqual(diff.runs, [[BASE + PAGE - 1, 2], [BASE + PAGE * 3 + 8, 1]])
+        self.assertEqual(diff.pages, [BASE, BASE + PAGE, BASE + PAGE * 3])
+        self.assertEqual(diff.changed_bytes, 3)
+
+    def test_cancelled_take(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(Snapshot.SnapshotError):
+            Snapshot.take(self.dwarf, [(BASE, PAGE * 4)], self.path, cancel=cancel)
+        self.assertFalse(os.path.exists(os.path.join(self.path, SNAPSHOT_INDEX)))
+        with self.assertRaises(Snapshot.SnapshotError):
+            Snapshot(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import struct
+import threading
+import unittest
+
+from lib.memory_reader import MemoryReadResult
+from lib.value_scanner import ValueScanner
+
+BASE = 0x10000
+
+
+class FakeDwarf(object):
+    """ a readable block at BASE, readMemory and readValues answered from it
+    """
+
+    def __init__(self, size=0x1000):
+        self.memory = bytearray(size)
+
+    def read_memory_ex(self, ptr, length, progress=None, cancel=None):
+        offset = ptr - BASE
+        return MemoryReadResult(ptr, bytearray(self.memory[offset:offset + length]))
+
+    def dwarf_api(self, api, args):
+        assert api == 'readValues'
+        base = int(args[0], 16)
+        offsets, size = args[1], args[2]
+        values = bytearray()
+        flags = bytearray()
+        for offset in offsets:
+            start = base + offset - BASE
+            if 0 <= start and start + size <= len(self.memory):
+                values += self.memory[start:start + size]
+                flags.append(1)
+            else:
+                values += bytes(size)
+                flags.append(0)
+        return bytes(values + flags)
+
+
+class ValueScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dwarf = FakeDwarf()
+
+    def put(self, offset, fmt, value):
+        struct.pack_into(fmt, self.dwarf.memory, offset, value)
+
+    def test_first_scan_aligned(self):
+        self.put(0x10, '<i', 1337)
+        self.put(0x21, '<i', 1337)
+        self.put(0x40, '<i', 1337)
+        scanner = ValueScanner(self.dwarf, 'int32')
+        self.assertEqual(scanner.first_scan([(hex(BASE), len(self.dwarf.memory))], '1337'), 2)
+        self.assertEqual(scanner.results(), [(BASE + 0x10, 1337), (BASE + 0x40, 1337)])
+
+        unaligned = ValueScanner(self.dwarf, 'int32', aligned=False)
+        self.assertEqual(unaligned.first_scan([(hex(BASE), len(self.dwarf.memory))], '0x539'), 3)
+
+    def test_first_scan_big_endian(self):
+        self.put(0x20, '>H', 0xbeef)
+        scanner = ValueScanner(self.dwarf, 'uint16', endianness='big')
+        scanner.first_scan([(BASE, len(self.dwarf.memory))], 0xbeef)
+        self.assertEqual(scanner.results(), [(BASE + 0x20, 0xbeef)])
+
+    def test_cancelled_first_scan(self):
+        cancel = threading.Event()
+        cancel.set()
+        scanner = ValueScanner(self.dwarf, 'int32')
+        with self.assertRaises(ValueScanner.ValueScanError):
+            scanner.first_scan([(BASE, len(self.dwarf.memory))], 0, cancel=cancel)
+
+    def test_next_scan_state_conditions(self):
+        for offset in (0x10, 0x20, 0x30):
+            self.put(offset, '<i', 7)
+        scanner = ValueScanner(self.dwarf, 'int32')
+        scanner.first_scan([(BASE, 0x40)], 7)
+        self.put(0x20, '<i', 9)
+        self.put(0x30, '<i', 3)
+        self.assertEqual(scanner.next_scan('changed'), 2)
+        self.assertEqual(scanner.results(), [(BASE + 0x20, 9), (BASE + 0x30, 3)])
+        self.assertEqual(scanner.next_scan('unchanged'), 2)
+        self.put(0x20, '<i', 10)
+        self.assertEqual(scanner.next_scan('increased'), 1)
+        self.assertEqual(scanner.results(), [(BASE + 0x20, 10)])
+        self.assertEqual(scanner.scans, 4)
+
+    def test_next_scan_value_conditions(self):
+        for offset, value in ((0x10, 5), (0x20, 6), (0x30, 7)):
+            self.put(offset, '<i', value)
+        scanner = ValueScanner(self.dwarf, 'int32')
+        for offset in (0x10, 0x20, 0x30):
+            scanner.addresses.append(BASE + offset)
+            scanner.values.append(0)
+        scanner.scans = 1
+        self.assertEqual(scanner.next_scan('greater', '5'), 2)
+        self.assertEqual(scanner.next_scan('not_equal', 6), 1)
+        self.assertEqual(scanner.results(), [(BASE + 0x30, 7)])
+
+    def test_increased_by_wraps_at_the_type_width(self):
+        self.put(0x10, '<B', 250)
+        self.put(0x11, '<B', 250)
+        scanner = ValueScanner(self.dwarf, 'uint8')
+        scanner.first_scan([(BASE, 0x20)], 250)
+        self.put(0x10, '<B', 4)
+        self.put(0x11, '<B', 5)
+        self.assertEqual(scanner.next_scan('increased_by', 10), 1)
+        self.assertEqual(scanner.results(), [(BASE + 0x10, 4)])
+
+    def test_decreased_by_signed(self):
+        self.put(0x10, '<b', -126)
+        scanner = ValueScanner(self.dwarf, 'int8')
+        scanner.first_scan([(BASE, 0x20)], -126)
+        self.put(0x10, '<b', 127)
+        self.assertEqual(scanner.next_scan('decreased_by', 3), 1)
+
+    def test_unreadable_candidates_are_dropped(self):
+        scanner = ValueScanner(self.dwarf, 'int32')
+        scanner.addresses.extend([BASE, BASE + len(self.dwarf.memory)])
+        scanner.values.extend([0, 0])
+        scanner.scans = 1
+        self.assertEqual(scanner.next_scan('equal', 0), 1)
+        self.assertEqual(scanner.results(), [(BASE, 0)])
+
+    def test_bad_input(self):
+        with self.assertRaises(ValueScanner.ValueScanError):
+            ValueScanner(self.dwarf, 'int128')
+        scanner = ValueScanner(self.dwarf, 'uint8')
+        with self.assertRaises(ValueScanner.ValueScanError):
+            scanner.next_scan('changed')
+        scanner.scans = 1
+        with self.assertRaises(ValueScanner.ValueScanError):
+            scanner.next_scan('equal', '256')
+        with self.assertRaises(ValueScanner.ValueScanError):
+            scanner.next_scan('equal')
+
+
+if __name__ == '__main__':
+    unittest.main()
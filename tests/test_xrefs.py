@@ -0,0 +1,73 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import shutil
+import tempfile
+import unittest
+
+from lib.analysis import ModuleAnalyzer
+from lib.xrefs import XREF_CALL, XREF_DATA, XREF_JUMP, XREF_POINTER, XrefIndex, XrefIndexer, XrefThread
+
+from test_analysis import BASE, FakeDwarf, _image, run_thread
+
+
+class XrefIndexTest(unittest.TestCase):
+
+    def test_build_sorts_by_target(self):
+        index = XrefIndex.build('test', BASE, 0x100, [0x10, 0x20, 0x30], [0x50, 0x40, 0x50], [0, 1, 2])
+        self.assertEqual(list(index.targets), [0x40, 0x50, 0x50])
+        self.assertEqual(index.references(0x50), [(0x10, 0), (0x30, 2)])
+        self.assertEqual(index.references_in(0x41, 0x50), [])
+        self.assertEqual(index.references_in(0x40, 0x51), [(0x20, 0x40, 1), (0x10, 0x50, 0), (0x30, 0x50, 2)])
+
+
+class XrefIndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.dwarf = FakeDwarf(_image())
+        self.module = {'name': 'test', 'base': BASE, 'size': len(self.dwarf.image)}
+        self.analyzer = ModuleAnalyzer(self.dwarf, self.module, path=path)
+
+    def test_references(self):
+        indexer = XrefIndexer(self.dwarf, self.module, analyzer=self.analyzer)
+        index = indexer.run()
+        self.assertIsNotNone(indexer.analysis)
+        self.assertEqual(len(index), 4)
+        # called from the code, pointed to from the data page
+        self.assertEqual(index.references(BASE + 0x10), [(BASE, XREF_CALL), (BASE + 0x100, XREF_POINTER)])
+        self.assertEqual(index.references(BASE + 0x15), [(BASE + 0x12, XREF_JUMP)])
+        self.assertEqual(index.references(BASE + 0x108), [(BASE + 0x15, XREF_DATA)])
+        self.assertEqual(index.references(BASE + 0x20), [])
+
+    def test_cancelled_run(self):
+        self.analyzer.run = lambda cancel=None, progress=None, status=None: None
+        indexer = XrefIndexer(self.dwarf, self.module, analyzer=self.analyzer)
+        self.assertIsNone(indexer.run())
+        self.assertEqual(run_thread(XrefThread(indexer)), [('error', 'cancelled')])
+
+    def test_unexpected_error(self):
+        def fail(cancel=None, progress=None, status=None):
+            raise KeyError('base')
+
+        self.analyzer.run = fail
+        indexer = XrefIndexer(self.dwarf, self.module, analyzer=self.analyzer)
+        self.assertEqual(run_thread(XrefThread(indexer)), [('error', "KeyError: 'base'")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,10 +25,12 @@ from PyQt5.QtGui import *  # QIcon, QFontDatabase
 from PyQt5.QtWidgets import *
 
 from lib.session_manager import SessionManager
+from lib.xrefs import XREF_POINTER
 
 from ui.welcome_window import WelcomeDialog
 from ui.hex_edit import HighLight, HighlightExistsError
 from ui.panel_trace import TraceEvent
+from ui.dialog_xrefs import XrefsDialog
 
 
 class AppWindow(QMainWindow):
@@ -69,6 +71,9 @@ class AppWindow(QMainWindow):
         self.watchers_panel = None
         self.welcome_window = None
 
+        # hit shown in the context panels, details get merged in when fetched
+        self._applied_context = None
+
         self._ui_elems = []
 
         self.setWindowTitle(
@@ -275,6 +280,34 @@ class AppWindow(QMainWindow):
                 self.show_main_tab('memory')
             self.memory_panel.read_memory(ptr)
 
+    def show_xrefs(self, ptr):
+        """ references to ptr out of the indexed modules
+        """
+        ptr = utils.parse_ptr(ptr)
+        xrefs = self.dwarf.xrefs_to(ptr)
+        if xrefs is None:
+            self.dwarf.log('no module indexed yet, use Index Xrefs in the modules panel')
+            return
+        if not xrefs:
+            self.dwarf.log('no references to 0x%x' % ptr)
+            return
+        dialog = XrefsDialog(self, ptr, xrefs)
+        dialog.onXrefSelected.connect(self._on_xref_selected)
+        dialog.exec_()
+
+    def _on_xref_selected(self, data):
+        """ Xref in XrefsDialog was doubleclicked
+        """
+        ptr, kind = data
+        ptr = utils.parse_ptr(ptr)
+        if kind == XREF_POINTER:
+            self.jump_to_address(ptr)
+            return
+        if self.asm_panel is None:
+            self._create_ui_elem('disassembly')
+        self.asm_panel.read_memory(ptr)
+        self.show_main_tab('disassembly')
+
     @pyqtSlot(name='mainMenuGitHub')
     def _menu_github(self):
         QDesktopServices.openUrl(QUrl('https://github.com/iGio90/Dwarf'))
@@ -333,6 +366,7 @@ class AppWindow(QMainWindow):
             self.context_panel = ContextPanel(self)
             self.registers_dock.setWidget(self.context_panel)
             self.registers_dock.setObjectName('ContextsPanel')
+            self.registers_dock.visibilityChanged.connect(self._on_context_dock_visibility)
             self.addDockWidget(Qt.RightDockWidgetArea, self.registers_dock)
             self.view_menu.addAction(self.registers_dock.toggleViewAction())
         elif elem == 'memory':
@@ -342,6 +376,7 @@ class AppWindow(QMainWindow):
                 self._disassemble_range)
             self.memory_panel.dataChanged.connect(self._on_memory_modified)
             self.memory_panel.statusChanged.connect(self.set_status_text)
+            self.memory_panel.rangeChanged.connect(self._on_memory_range_changed)
             self.main_tabs.addTab(self.memory_panel, 'Memory')
         elif elem == 'java-explorer':
             from ui.panel_java_explorer import JavaExplorerPanel
@@ -367,6 +402,7 @@ class AppWindow(QMainWindow):
             self.backtrace_panel = BacktracePanel(self)
             self.backtrace_dock.setWidget(self.backtrace_panel)
             self.backtrace_dock.setObjectName('BacktracePanel')
+            self.backtrace_dock.visibilityChanged.connect(self._on_context_dock_visibility)
             self.backtrace_panel.onShowMemoryRequest.connect(self._on_watcher_clicked)
             self.addDockWidget(Qt.RightDockWidgetArea, self.backtrace_dock)
             self.view_menu.addAction(self.backtrace_dock.toggleViewAction())
@@ -389,12 +425,17 @@ class AppWindow(QMainWindow):
                 self._on_modulefunc_dblclicked)
             self.modules_panel.onAddHook.connect(self._on_addmodule_hook)
             self.modules_panel.onDumpBinary.connect(self._on_dumpmodule)
+            self.modules_panel.onDisassemble.connect(self._on_disassemble_listing)
+            self.modules_panel.onAnalyze.connect(self.dwarf.analyze_module)
+            self.modules_panel.onIndexXrefs.connect(self.dwarf.index_xrefs)
+            self.modules_panel.onShowXrefs.connect(self.show_xrefs)
             self.main_tabs.addTab(self.modules_panel, 'Modules')
         elif elem == 'ranges':
             from ui.panel_ranges import RangesPanel
             self.ranges_panel = RangesPanel(self)
             self.ranges_panel.onItemDoubleClicked.connect(self._range_dblclicked)
             self.ranges_panel.onDumpBinary.connect(self._on_dumpmodule)
+            self.ranges_panel.onDisassemble.connect(self._on_disassemble_listing)
             # connect to watcherpanel func
             self.ranges_panel.onAddWatcher.connect(self.watchers_panel.do_addwatcher_dlg)
             self.main_tabs.addTab(self.ranges_panel, 'Ranges')
@@ -548,10 +589,12 @@ class AppWindow(QMainWindow):
 
         self.dwarf.onAddNativeHook.connect(self._on_add_hook)
         self.dwarf.onApplyContext.connect(self._apply_context)
+        self.dwarf.onContextDetails.connect(self._on_context_details)
         self.dwarf.onThreadResumed.connect(self.on_tid_resumed)
 
         self.dwarf.onTraceData.connect(self._on_tracer_data)
         self.dwarf.onSetData.connect(self._on_set_data)
+        self.dwarf.onSnapshotDiff.connect(self._on_snapshot_diff)
 
         self.session_manager.start_session(self.dwarf_args)
         q_settings = QSettings("dwarf_window_pos.ini", QSettings.IniFormat)
@@ -635,7 +678,11 @@ class AppWindow(QMainWindow):
         q_settings.setValue('dwarf_ui_window', self.saveState())
 
         if self.dwarf:
-            self.dwarf.detach()
+            try:
+                self.dwarf.detach()
+            finally:
+                # no worker thread may outlive the window
+                self.dwarf.stop_workers()
         super().closeEvent(event)
 
     def _on_watcher_clicked(self, ptr):
@@ -657,10 +704,36 @@ class AppWindow(QMainWindow):
         """ Address in Disasm was clicked
             adds temphighlight for bytes from current instruction
         """
-        self.memory_panel.read_memory(ptr)
-        self.memory_panel.add_highlight(HighLight('attention', utils.parse_ptr(ptr), length))
+        def _on_loaded(init):
+            if init <= 0:
+                self.memory_panel.add_highlight(HighLight('attention', utils.parse_ptr(ptr), length))
+
+        self.memory_panel.read_memory(ptr, callback=_on_loaded)
         self.show_main_tab('memory')
 
+    def _on_memory_range_changed(self, base, size):
+        """ Memory panel loaded a range
+            brings the search hits of the range in
+        """
+        if self.search_panel is not None:
+            self.search_panel.highlight_range(base, size)
+
+    def _on_snapshot_diff(self, diff):
+        """ Snapshot was diffed
+            highlights the changed bytes of the range in the memory panel
+        """
+        if self.memory_panel is None:
+            return
+        self.memory_panel.remove_highlights('diff')
+        if self.memory_panel.data is None:
+            return
+        start = self.memory_panel.base
+        end = start + len(self.memory_panel.data)
+        self.memory_panel.add_highlights([
+            HighLight('diff', address, length) for address, length in diff.runs
+            if address < end and address + length > start
+        ])
+
     def _on_watcher_added(self, ptr):
         """ Watcher Entry was added
         """
@@ -701,6 +774,15 @@ class AppWindow(QMainWindow):
         size = int(size, 10)
         self.dwarf.dump_memory(ptr=ptr, length=size)
 
+    def _on_disassemble_listing(self, data):
+        """ Disassemble MenuItem in ModulePanel or RangesPanel was selected
+        """
+        ptr, size = data
+        if self.asm_panel is None:
+            self._create_ui_elem('disassembly')
+        self.asm_panel.show_listing(utils.parse_ptr(ptr), int(size, 10))
+        self.show_main_tab('disassembly')
+
     def _disassemble_range(self, mem_range):
         """ Disassemble MenuItem in Hexview was selected
         """
@@ -769,13 +851,14 @@ class AppWindow(QMainWindow):
 
                 # todo: windows jump to disasm pc
                 if 'pc' in context['context']:
-                    off = int(context['context']['pc']['value'], 16)
+                    pc = context['context']['pc']
+                    off = int(pc['value'] if isinstance(pc, dict) else pc, 16)
                     should_jump_to_asm = True
                     if self.asm_panel is not None and self.asm_panel._range is not None:
                         if self.asm_panel._range.start_offset == off:
                             should_jump_to_asm = False
                     if should_jump_to_asm:
-                        self.jump_to_address(int(context['context']['pc']['value'], 16), show_panel=False)
+                        self.jump_to_address(off, show_panel=False)
                         self.memory_panel.on_cm_showasm()
 
         if 'backtrace' in context:
@@ -784,6 +867,33 @@ class AppWindow(QMainWindow):
         # update current context tid
         self.dwarf.context_tid = context['tid']
 
+        if 'context' in context:
+            self._applied_context = context
+            if 'backtrace' not in context:
+                self._request_context_details()
+
+    def _request_context_details(self):
+        # backtrace, telescope and symbols are fetched only when shown
+        for panel in [self.context_panel, self.backtrace_panel]:
+            if panel is not None and panel.isVisible():
+                self.dwarf.request_context_details(self.dwarf.context_tid)
+                break
+
+    def _on_context_dock_visibility(self, visible):
+        if visible and self._applied_context is not None and 'backtrace' not in self._applied_context:
+            self._request_context_details()
+
+    def _on_context_details(self, details):
+        if self.contexts_list_panel is not None:
+            self.contexts_list_panel.set_details(details)
+        if self._applied_context is None or self._applied_context['tid'] != details['tid']:
+            return
+        self._applied_context.update(details)
+        if 'context' in details and self.context_panel is not None:
+            self.context_panel.set_context(self._applied_context['ptr'], 0, details['context'])
+        if 'backtrace' in details and self.backtrace_panel is not None:
+            self.backtrace_panel.set_backtrace(details['backtrace'])
+
     def _on_add_hook(self, hook):
         try:
             # set highlight
@@ -805,6 +915,7 @@ class AppWindow(QMainWindow):
     def on_tid_resumed(self, tid):
         if self.dwarf:
             if self.dwarf.context_tid == tid:
+                self._applied_context = None
 
                 # clear backtrace
                 if 'backtrace' in self._ui_elems:
@@ -837,14 +948,8 @@ class AppWindow(QMainWindow):
             self.show_main_tab('Trace')
             self.trace_panel.start()
 
-            trace_events_parts = data[1].split(',')
-            while trace_events_parts:
-                trace_event = TraceEvent(
-                    trace_events_parts.pop(0),
-                    trace_events_parts.pop(0),
-                    trace_events_parts.pop(0),
-                    trace_events_parts.pop(0)
-                )
+            for event in data:
+                trace_event = TraceEvent(event[0], event[1], event[2], event[3])
                 self.trace_panel.event_queue.append(trace_event)
 
     def _on_set_data(self, data):
@@ -874,7 +979,7 @@ class AppWindow(QMainWindow):
         data = self.memory_panel.data[pos:pos + length]
         data = [data[0]]  # todo: strange js part
 
-        if self.dwarf.dwarf_api('writeBytes', [data_pos, data]):
+        if self.dwarf.write_memory(data_pos, data):
             pass
         else:
             utils.show_message_box('Failed to write Memory')
@@ -0,0 +1,74 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHeaderView
+
+from lib.xrefs import XREF_KINDS
+from ui.list_view import DwarfListView
+
+
+class XrefsDialog(QDialog):
+    """ references to an address, double click jumps to the source
+
+        Signals:
+            onXrefSelected([ptr, kind#int]) - ItemDoubleClicked
+    """
+
+    onXrefSelected = pyqtSignal(list, name='onXrefSelected')
+
+    def __init__(self, parent, address, xrefs):
+        super(XrefsDialog, self).__init__(parent)
+        self.dwarf = parent.dwarf
+        self.setWindowTitle('xrefs to 0x%x' % address)
+        self.setMinimumWidth(500)
+
+        layout = QVBoxLayout(self)
+        self.list = DwarfListView(self)
+        self.model = QStandardItemModel(0, 3)
+        self.model.setHeaderData(0, Qt.Horizontal, 'Address')
+        self.model.setHeaderData(1, Qt.Horizontal, 'Type')
+        self.model.setHeaderData(2, Qt.Horizontal, 'Symbol')
+        self.list.setModel(self.model)
+        self.list.header().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.list.header().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        self.list.doubleClicked.connect(self._item_doubleclicked)
+        layout.addWidget(self.list)
+
+        if self.list.uppercase_hex:
+            str_fmt = '0x{0:X}'
+        else:
+            str_fmt = '0x{0:x}'
+        for source, kind in xrefs:
+            address_col = QStandardItem()
+            address_col.setText(str_fmt.format(source))
+            address_col.setData(kind, Qt.UserRole + 1)
+            kind_col = QStandardItem()
+            kind_col.setText(XREF_KINDS[kind])
+            symbol_col = QStandardItem()
+            # no round trips for a long list, modules seen before only
+            symbol = self.dwarf.symbols.lookup(source, fetch=False)
+            if symbol is not None:
+                symbol_col.setText('{0} - {1}'.format(symbol['moduleName'], symbol['name']))
+            self.model.appendRow([address_col, kind_col, symbol_col])
+
+    def _item_doubleclicked(self, model_index):
+        row = self.model.itemFromIndex(model_index).row()
+        if row != -1:
+            item = self.model.item(row, 0)
+            self.onXrefSelected.emit([item.text(), item.data(Qt.UserRole + 1)])
+            self.accept()
@@ -6,7 +6,9 @@ from PyQt5.QtWidgets import *
 
 from capstone import *
 from capstone.x86_const import *
+from lib.disassembler import DisassembleThread
 from lib.range import Range
+from lib.virtual_listing import VirtualListing
 from lib import utils
 from lib.instruction import Instruction
 
@@ -39,6 +41,13 @@ class DisassemblyView(QAbstractScrollArea):
         self._history = []
         self._lines = []
         self._range = None
+        # id of the listing being decoded, workers still running
+        self._job = 0
+        self._workers = []
+        # whole module listing, shown in place of _lines. the anchor is the
+        # address of the top line, kept there while windows get decoded
+        self._listing = None
+        self._listing_anchor = None
         self._max_instructions = 128
         self._longest_bytes = 0
         self._longest_mnemonic = 0
@@ -162,24 +171,9 @@ class DisassemblyView(QAbstractScrollArea):
         self.adjust()
 
     def disassemble(self, dwarf_range, num_instructions=256, stop_on_ret=True):
-        progress = QProgressDialog()
-        progress.setFixedSize(300, 50)
-        progress.setAutoFillBackground(True)
-        progress.setWindowModality(Qt.WindowModal)
-        progress.setWindowTitle('Please wait')
-        progress.setLabelText('Disassembling...')
-        progress.setSizeGripEnabled(False)
-        progress.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-        progress.setWindowFlag(Qt.WindowContextHelpButtonHint, False)
-        progress.setWindowFlag(Qt.WindowCloseButtonHint, False)
-        # progress.setModal(True)
-        progress.setCancelButton(None)
-        progress.setRange(0, 0)
-        progress.setMinimumDuration(0)
-        progress.show()
-        QApplication.processEvents()
-
-        self._lines.clear()
+        self._cancel_disassembly()
+        self._listing = None
+        self._lines = []
 
         if len(self._history) == 0 or self._history[len(self._history) - 1] != dwarf_range.start_address:
             self._history.append(dwarf_range.start_address)
@@ -187,44 +181,92 @@ class DisassemblyView(QAbstractScrollArea):
                 self._history.pop(0)
 
         self._longest_bytes = 0
-        try:
-            capstone = Cs(self.capstone_arch, self.capstone_mode)
-            capstone.detail = True
-        except CsError:
-            print('[DisasmView] failed to initialize capstone with %d, %d' % (self.capstone_arch, self.capstone_mode))
-            return
-
         self._range = dwarf_range
         self._max_instructions = num_instructions
-        _counter = 0
 
-        for cap_inst in capstone.disasm(dwarf_range.data[dwarf_range.start_offset:], dwarf_range.start_address):
-            QApplication.processEvents()
-            if _counter > self._max_instructions:
-                break
+        self._job += 1
+        worker = DisassembleThread(self._app_window.dwarf, self._job, dwarf_range, self.capstone_arch,
+                                   self.capstone_mode, num_instructions=num_instructions,
+                                   stop_on_ret=stop_on_ret, parent=self)
+        worker.onChunk.connect(self._on_disassembled_chunk)
+        worker.onError.connect(self._on_disassemble_error)
+        worker.finished.connect(lambda: self._workers.remove(worker))
+        self._workers.append(worker)
+        worker.start()
+        self.adjust()
 
-            dwarf_instruction = Instruction(self._app_window.dwarf, cap_inst)
-            self.add_instruction(dwarf_instruction)
+    def show_listing(self, base, size):
+        """ scrollable listing of a whole module or range
+        """
+        self._cancel_disassembly()
+        if self.capstone_arch == CS_ARCH_X86:
+            instruction_size = 4 if self.capstone_mode == CS_MODE_64 else 3
+        elif self.capstone_mode == CS_MODE_THUMB:
+            instruction_size = 2
+        else:
+            instruction_size = 4
+        self._listing = VirtualListing(self._app_window.dwarf, base, size, self.capstone_arch,
+                                       self.capstone_mode, instruction_size=instruction_size)
+        self._lines = self._listing
+        self._listing_anchor = base
+        self._longest_bytes = 0
+        self.verticalScrollBar().setValue(0)
+        self.adjust()
 
-            _counter += 1
+    def scroll_to_address(self, address):
+        """ bring address to the top of the listing
+        """
+        if self._listing is None or address not in self._listing:
+            return False
+        if len(self._history) == 0 or self._history[len(self._history) - 1] != address:
+            self._history.append(address)
+            if len(self._history) > 25:
+                self._history.pop(0)
+        self._listing_anchor = address
+        self.verticalScrollBar().setValue(self._listing.line_of_address(address)[0])
+        self.viewport().update()
+        return True
 
-            if stop_on_ret and cap_inst.group(CS_GRP_RET):
-                break
+    def _on_listing_window(self, listing):
+        if listing is not self._listing:
+            return
+        # counts changed, keep the same address on top
+        anchor = self._listing_anchor
+        self.adjust()
+        if anchor is not None:
+            self.verticalScrollBar().setValue(listing.line_of_address(anchor)[0])
+            self._listing_anchor = anchor
+        self.viewport().update()
 
+    def _cancel_disassembly(self):
+        # a running worker drops its results, its lines would belong to the old listing
+        for worker in self._workers:
+            worker.cancel()
+
+    def _on_disassembled_chunk(self, job, instructions):
+        if job != self._job:
+            return
+        self._lines.extend(instructions)
         self.adjust()
-        progress.cancel()
+
+    def _on_disassemble_error(self, job, error):
+        print('[DisasmView] ' + error)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.adjust()
 
     def adjust(self):
-        for line in self._lines:
-            if line:
-                if len(line.bytes) > self._longest_bytes:
-                    self._longest_bytes = len(line.bytes)
-                if len(line.mnemonic) > self._longest_mnemonic:
-                    self._longest_mnemonic = len(line.mnemonic)
+        if self._listing is not None:
+            self._longest_bytes = max(self._longest_bytes, self._listing.longest_bytes)
+            self._longest_mnemonic = max(self._longest_mnemonic, self._listing.longest_mnemonic)
+        else:
+            for line in self._lines:
+                if line:
+                    if len(line.bytes) > self._longest_bytes:
+                        self._longest_bytes = len(line.bytes)
+                    if len(line.mnemonic) > self._longest_mnemonic:
+                        self._longest_mnemonic = len(line.mnemonic)
         self.verticalScrollBar().setRange(0, len(self._lines) - self.visible_lines() + 1)
         self.verticalScrollBar().setPageStep(self.visible_lines())
         self.viewport().update()
@@ -275,10 +317,15 @@ class DisassemblyView(QAbstractScrollArea):
                     menu_actions[action]()
 
     def read_memory(self, ptr, length=0):
-        self._lines.clear()
+        if self.scroll_to_address(ptr):
+            return 0
+
+        self._cancel_disassembly()
+        self._listing = None
+        self._lines = []
 
         if self._range is None:
-            self._range = Range(Range.SOURCE_TARGET, self.dwarf)
+            self._range = Range(Range.SOURCE_TARGET, self._app_window.dwarf)
 
         init = self._range.init_with_address(ptr, length)
         if init > 0:
@@ -291,13 +338,14 @@ class DisassemblyView(QAbstractScrollArea):
     # ************************************************************************
     def paint_jumps(self, painter):
         painter.setRenderHint(QPainter.HighQualityAntialiasing)
-        jump_list = [x.address for x in self._lines[self.pos:self.pos + self.visible_lines()] if x.is_jump]
-        jump_targets = [x.jump_address for x in self._lines[self.pos:self.pos + self.visible_lines()] if x.address in jump_list]
+        visible = self._lines[self.pos:self.pos + self.visible_lines()]
+        jump_list = [x.address for x in visible if x and x.is_jump]
+        jump_targets = [x.jump_address for x in visible if x and x.address in jump_list]
 
         drawing_pos_x = self._jumps_width - 10
 
-        for index, line in enumerate(self._lines[self.pos:self.pos + self.visible_lines()]):
-            if line.address in jump_list:  # or line.address in jump_targets:
+        for index, line in enumerate(visible):
+            if line and line.address in jump_list:  # or line.address in jump_targets:
                 if line.address == self.current_jump:
                     self._solid_pen.setColor(self._ctrl_colors['jump_arrows_hover'])
                     self._dash_pen.setColor(self._ctrl_colors['jump_arrows_hover'])
@@ -316,11 +364,12 @@ class DisassemblyView(QAbstractScrollArea):
                 if line.address not in jump_targets:
                     painter.drawLine(drawing_pos_x + 2, drawing_pos_y, self._jumps_width, drawing_pos_y)
                     if line.jump_address in jump_targets:
-                        entry1 = [x for x in self._lines if x.address == line.address]
-                        entry2 = [x for x in self._lines if x.address == line.jump_address]
+                        # targets off screen get an arrow to the edge below
+                        entry1 = [x for x in visible if x and x.address == line.address]
+                        entry2 = [x for x in visible if x and x.address == line.jump_address]
                         if entry1 and entry2:
                             skip = True
-                            pos2 = (self._lines.index(entry1[0]) - self._lines.index(entry2[0])) * (self._char_height + self._ver_spacing)
+                            pos2 = (visible.index(entry1[0]) - visible.index(entry2[0])) * (self._char_height + self._ver_spacing)
                             painter.drawLine(drawing_pos_x, drawing_pos_y - pos2, drawing_pos_x, drawing_pos_y)
                             painter.drawLine(drawing_pos_x, drawing_pos_y - pos2, 100, drawing_pos_y - pos2)
                             arrow = QPolygon()
@@ -488,6 +537,9 @@ class DisassemblyView(QAbstractScrollArea):
             return
 
         self.pos = self.verticalScrollBar().value()
+        if self._listing is not None:
+            self._listing_anchor = self._listing.address_of_line(self.pos)
+            self._listing.fetch(self.pos, self.pos + self.visible_lines(), self._on_listing_window)
         painter = QPainter(self.viewport())
 
         # fill background
@@ -537,12 +589,6 @@ class DisassemblyView(QAbstractScrollArea):
             # dispatch those to super
             super().keyPressEvent(event)
 
-        if self.capstone_mode == CS_MODE_ARM:
-            self.capstone_mode = CS_MODE_THUMB
-        else:
-            self.capstone_mode = CS_MODE_ARM
-        self.disassemble(self._range)
-
     def on_arch_changed(self):
         if self._app_window.dwarf.arch == 'arm64':
             self.capstone_arch = CS_ARCH_ARM64
@@ -615,7 +661,7 @@ class DisassemblyView(QAbstractScrollArea):
     def mousePressEvent(self, event):
         # context menu
         if event.button() == Qt.RightButton:
-            if self._range is None:
+            if self._range is None and self._listing is None:
                 return
             self._on_context_menu(event)
             return
@@ -661,19 +707,24 @@ class DisassemblyView(QAbstractScrollArea):
                             context_menu.addAction('Remove Hook', lambda: self._app_window.dwarf.dwarf_api('deleteHook', addr_str))
                         else:
                             context_menu.addAction('Hook Address', lambda: self._app_window.dwarf.hook_native(addr_str))
+                    context_menu.addAction('Xrefs to', lambda: self._app_window.show_xrefs(addr_str))
 
         glbl_pt = self.mapToGlobal(event.pos())
         context_menu.exec_(glbl_pt)
 
     def _on_switch_mode(self):
-        if self._range is None:
+        if self._range is None and self._listing is None:
             return
 
         if self._app_window.dwarf.arch == 'arm':
-            self._lines.clear()
-
             if self.capstone_mode == CS_MODE_ARM:
                 self.capstone_mode = CS_MODE_THUMB
             else:
                 self.capstone_mode = CS_MODE_ARM
-            self.disassemble(self._range)
+            if self._listing is not None:
+                listing = self._listing
+                anchor = self._listing_anchor
+                self.show_listing(listing.base, listing.size)
+                self.scroll_to_address(anchor)
+            else:
+                self.disassemble(self._range)
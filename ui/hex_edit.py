@@ -15,6 +15,7 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
 
+import bisect
 import sys
 from math import ceil, floor
 
@@ -210,7 +211,7 @@ class HighLight(QObject):
 
         what:   default='attention'
                 allowed='attention', 'hook', 'changed', 'edited',\
-                        'patched', 'pointer', 'search', 'string'
+                        'patched', 'pointer', 'search', 'string', 'diff'
                 'attention, changed': are removed after x sec
 
         offset: address
@@ -254,6 +255,8 @@ class HexEditor(QAbstractScrollArea):
     dataChanged = pyqtSignal(int, int, name='dataChanged')
     statusChanged = pyqtSignal(str, name='statusChanged')
     onShowDisassembly = pyqtSignal(Range, name='onShowDisassembly')
+    # base, size of the range loaded in the view
+    rangeChanged = pyqtSignal(object, object, name='rangeChanged')
 
     def __init__(self, app):
         super(HexEditor, self).__init__()
@@ -284,7 +287,8 @@ class HexEditor(QAbstractScrollArea):
             'patched': QColor('#ff5722'),
             'string': QColor('#8bc34a'),
             'pointer': QColor('#ff9900'),
-            'search': QColor('#fc3')
+            'search': QColor('#fc3'),
+            'diff': QColor('#ba68c8')
         }
 
         self.app = app
@@ -391,6 +395,8 @@ class HexEditor(QAbstractScrollArea):
 
         # highlights
         self._highlights = []
+        # (sorted offsets, positions in _highlights, longest length), rebuilt on demand
+        self._highlight_index = None
         self._highlight_timer = QTimer()
         self._highlight_timer.setSingleShot(True)
         self._highlight_timer.timeout.connect(self._clear_highlights)
@@ -772,7 +778,7 @@ class HexEditor(QAbstractScrollArea):
         start = self.caret.position
         end = self.caret.position + ptr_size
         ptr = int.from_bytes(self.data[start:end], sys.byteorder)
-        is_valid_ptr = self.app.dwarf.dwarf_api('isValidPointer', ptr)
+        is_valid_ptr = self.app.dwarf.memory_map.is_valid_pointer(ptr)
         if ptr > 0 and is_valid_ptr:
             return ptr
 
@@ -804,9 +810,9 @@ class HexEditor(QAbstractScrollArea):
             return
 
         # change byte in data
-        data_bt = bytearray(self.data)
-        data_bt[self.caret.position] = _byte
-        self.data = bytes(data_bt)
+        if isinstance(self.data, bytes):
+            self.data = bytearray(self.data)
+        self.data[self.caret.position] = _byte
 
         # emit datachanged
         self.dataChanged.emit(self.caret.position, 1)
@@ -829,17 +835,30 @@ class HexEditor(QAbstractScrollArea):
             self.caret.move_right(len(self.data))
         self._force_repaint(True)
 
+    def _build_highlight_index(self):
+        order = sorted(range(len(self._highlights)), key=lambda i: self._highlights[i].offset)
+        offsets = [self._highlights[i].offset for i in order]
+        longest = max((x.length for x in self._highlights), default=0)
+        self._highlight_index = (offsets, order, longest)
+
     def get_highlight(self, address):
         """ Checks if given pos is already colored
-            returns False or highlighttype
-        """
-        is_highlight = [
-            x for x in self._highlights
-            if x.offset <= address <= x.offset + x.length - 1
-        ]
-        if is_highlight:
-            if is_highlight[0]:
-                return is_highlight[0]
+            returns None or the first added highlight holding address
+        """
+        if self._highlight_index is None:
+            self._build_highlight_index()
+        offsets, order, longest = self._highlight_index
+
+        # only highlights starting in [address - longest, address] can hold it
+        found = None
+        i = bisect.bisect_right(offsets, address) - 1
+        while i >= 0 and offsets[i] > address - longest:
+            highlight = self._highlights[order[i]]
+            if address < highlight.offset + highlight.length and (found is None or order[i] < found):
+                found = order[i]
+            i -= 1
+        if found is not None:
+            return self._highlights[found]
 
         return None
 
@@ -847,13 +866,9 @@ class HexEditor(QAbstractScrollArea):
         """ Checks if given pos is already colored
             returns False or highlighttype
         """
-        is_highlight = [
-            x for x in self._highlights
-            if x.offset <= address <= x.offset + x.length - 1
-        ]
-        if is_highlight:
-            if is_highlight[0]:
-                return is_highlight[0].what
+        highlight = self.get_highlight(address)
+        if highlight is not None:
+            return highlight.what
 
         return False
 
@@ -870,6 +885,7 @@ class HexEditor(QAbstractScrollArea):
         # is given highlight is a temp highlight its added too (autoremoved later anyway)
         if not is_highlight or highlight.what == 'changed' or highlight.what == 'attention':
             self._highlights.append(highlight)
+            self._highlight_index = None
         else:
             error_msg = ('Existing Highlight at 0x{0:x} type {1}'.format(
                 highlight.offset, is_highlight))
@@ -880,6 +896,16 @@ class HexEditor(QAbstractScrollArea):
         if highlight.what == 'changed' or highlight.what == 'attention':
             self._highlight_timer.start()
 
+    def add_highlights(self, highlights):
+        """ Add many highlights at once, repaints only once
+
+            existing highlights are not checked
+        """
+        self._highlights.extend(highlights)
+        self._highlight_index = None
+        self.viewChanged.emit()
+        self.viewport().update()
+
     def _clear_highlights(self):
         """ handles temporary highlights
             'changed', 'attention'
@@ -888,6 +914,7 @@ class HexEditor(QAbstractScrollArea):
             x for x in self._highlights
             if x.what != 'changed' and x.what != 'attention'
         ]
+        self._highlight_index = None
         self.viewChanged.emit()
         self.viewport().update()
 
@@ -898,6 +925,7 @@ class HexEditor(QAbstractScrollArea):
             x for x in self._highlights
             if x.offset > address >= x.offset + x.length
         ]
+        self._highlight_index = None
         self.viewChanged.emit()
         self.viewport().update()
 
@@ -907,6 +935,7 @@ class HexEditor(QAbstractScrollArea):
         self._highlights = [
             x for x in self._highlights if x.what != highlight_type
         ]
+        self._highlight_index = None
         self.viewChanged.emit()
         self.viewport().update()
 
@@ -914,6 +943,7 @@ class HexEditor(QAbstractScrollArea):
         """ Clear all highlights
         """
         self._highlights.clear()
+        self._highlight_index = None
         self.viewChanged.emit()
         self.viewport().update()
 
@@ -1270,6 +1300,8 @@ class HexEditor(QAbstractScrollArea):
 
             follow_pointer = context_menu.addAction("Follow &pointer")
             menu_actions[follow_pointer] = self.on_cm_followpointer
+            xrefs = context_menu.addAction("&Xrefs to")
+            menu_actions[xrefs] = self.on_cm_xrefs
             context_menu.addSeparator()
 
             if self.caret.position + 4 < self.range.tail:
@@ -1342,6 +1374,11 @@ class HexEditor(QAbstractScrollArea):
         ptr = self.base + self.caret.position
         self.app.dwarf.hook_native(input_=hex(ptr))
 
+    def on_cm_xrefs(self):
+        """ ContextMenu XrefsTo
+        """
+        self.app.show_xrefs(self.base + self.caret.position)
+
     def on_cm_showasm(self):
         """ ContextMenu Disassemble
         """
@@ -1459,12 +1496,10 @@ class HexEditor(QAbstractScrollArea):
         else:
             start_loc = start
 
-        data_bt = bytearray(self.data)
-
-        for i in range(start_loc, start_loc + count):
-            data_bt[i] = byte
-
-        self.data = bytes(data_bt)
+        if isinstance(self.data, bytes):
+            self.data = bytearray(self.data)
+        end = min(start_loc + count, len(self.data))
+        self.data[start_loc:end] = bytes([byte]) * (end - start_loc)
         self.add_highlight(HighLight('edited', start_loc + self.base, count))
         self.dataChanged.emit(start_loc, count)
         self.viewChanged.emit()
@@ -1936,8 +1971,10 @@ class HexEditor(QAbstractScrollArea):
     # required
     # todo: remove!!!
     # pylint: disable=missing-docstring
-    def read_memory(self, ptr, length=0, base=0):
+    def read_memory(self, ptr, length=0, base=0, callback=None):
         # todo: remove it is mostly copy&pasta from old code
+        # the range loads in the rpc worker, work needing the data goes in
+        # callback(ret), called once it's shown. ret > 0 when it couldn't be loaded
         if self.range is None:
             self.range = Range(self.get_source_type(), self.app.dwarf)
 
@@ -1948,12 +1985,21 @@ class HexEditor(QAbstractScrollArea):
 
         self._addr_width_changed()
 
-        init = self.range.init_with_address(ptr, length, base)
+        self.range.init_with_address_async(ptr, length, base,
+                                           callback=lambda init: self._on_range_initialized(init, callback))
+        return 0
+
+    def _on_range_initialized(self, init, callback=None):
+        if self.range is None:
+            return
+
         if init > 0:
             self.adjust()
             self.range = None
             self.display_error('Unable to init range at addr')
-            return 1
+            if callback is not None:
+                callback(init)
+            return
 
         self.adjust()
         self.set_data(self.range.data)
@@ -1981,8 +2027,10 @@ class HexEditor(QAbstractScrollArea):
 
         # add a temp attention highlight
         self.add_highlight(HighLight('attention', self.range.start_address, 1))
+        self.rangeChanged.emit(self.base, len(self.data))
         self._force_repaint(True)
-        return 0
+        if callback is not None:
+            callback(init)
 
     def on_script_destroyed(self):
         self.range = None
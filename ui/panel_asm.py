@@ -133,23 +133,32 @@ class AsmPanel(QTableWidget):
             if len(self.history) > 25:
                 self.history.pop(0)
 
-        md = Cs(self.cs_arch, self.cs_mode)
-        md.detail = True
-
-        insts = 0
-        for i in md.disasm(self.range.data[self.range.start_offset:], self.range.start_address):
-            if insts > 128:
-                break
+        cache = self.dwarf.disasm_cache
+        code = self.range.read(self.range.start_offset, 130 * Range.MAX_INSTRUCTION_SIZE)
+        key = cache.key(self.range.start_address, self.cs_arch, self.cs_mode, code, 128)
+        instructions = cache.get(key)
+        if instructions is None:
+            md = cache.capstone(self.cs_arch, self.cs_mode)
+            instructions = []
+            try:
+                for i in md.disasm(code, self.range.start_address):
+                    if len(instructions) > 128:
+                        break
+                    instructions.append(Instruction(self.dwarf, i, resolve=False))
+            finally:
+                cache.release(md)
 
-            instruction = Instruction(self.dwarf, i)
+            Instruction.resolve_batch(self.dwarf, instructions)
+            cache.put(key, instructions)
 
+        for instruction in instructions:
             row = self.rowCount()
             self.insertRow(row)
 
-            w = MemoryAddressWidget('0x%x' % i.address)
+            w = MemoryAddressWidget('0x%x' % instruction.address)
             w.setFlags(Qt.NoItemFlags)
             w.setForeground(Qt.red)
-            w.set_offset(self.range.base - i.address)
+            w.set_offset(self.range.base - instruction.address)
             self.setItem(row, 0, w)
 
             w = NotEditableTableWidgetItem(binascii.hexlify(instruction.bytes).decode('utf8'))
@@ -179,8 +188,6 @@ class AsmPanel(QTableWidget):
                 w.setForeground(Qt.lightGray)
                 self.setItem(row, 4, w)
 
-            insts += 1
-
         self.scrollToTop()
         return 0
 
@@ -230,17 +237,13 @@ class AsmPanel(QTableWidget):
                                  getattr(keystone.keystone_const, self.ks_mode))
                 encoding, count = ks.asm(inst)
                 asm_widget = self.item(item.row(), 0)
-                offset = asm_widget.get_offset()
-                if self.dwarf.dwarf_api('writeBytes', [asm_widget.get_address(), encoding]):
-                    new_data = bytearray(self.range.data)
-                    for i in range(0, len(encoding)):
-                        try:
-                            new_data[self.asm_data_start + offset + i] = encoding[i]
-                        except Exception as e:
-                            if isinstance(e, IndexError):
-                                break
-                    self.range.data = bytes(new_data)
-                    self.disa()
+                offset = asm_widget.get_address() - self.range.base
+                if self.dwarf.write_memory(asm_widget.get_address(), encoding):
+                    if isinstance(self.range.data, bytes):
+                        self.range.data = bytearray(self.range.data)
+                    end = min(offset + len(encoding), len(self.range.data))
+                    self.range.data[offset:end] = bytes(encoding[:end - offset])
+                    self.disasm()
             except Exception as e:
                 self.dwarf.log(e)
 
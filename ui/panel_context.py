@@ -182,6 +182,10 @@ class ContextPanel(QTabWidget):
 
         sorted_regs = {b: i for i, b in enumerate(reg_order)}
 
+        # hits carry plain values until the context details are in
+        context = {register: value if isinstance(value, dict) else {'value': value, 'isValidPointer': False}
+                   for register, value in context.items()}
+
         for register in sorted(context, key=lambda x: sorted_regs[x]):
             reg_name = QStandardItem()
             reg_name.setTextAlignment(Qt.AlignCenter)
@@ -87,9 +87,9 @@ class ContextsListPanel(DwarfListView):
         symb_col = QStandardItem()
         if library_onload is None:
             if not is_java:
-                if 'symbol' in data['context']['pc']:
-                    str_fmt = ('{0} - {1}'.format(
-                        data['context']['pc']['symbol']['moduleName'], data['context']['pc']['symbol']['name']))
+                symbol = self.dwarf.symbols.lookup(data['ptr'], fetch=False)
+                if symbol is not None:
+                    str_fmt = ('{0} - {1}'.format(symbol['moduleName'], symbol['name']))
                     symb_col.setText(str_fmt)
             else:
                 symb_col.setText('.'.join(parts[:len(parts) - 1]))
@@ -101,6 +101,21 @@ class ContextsListPanel(DwarfListView):
         self.resizeColumnToContents(0)
         self.resizeColumnToContents(1)
 
+    def set_details(self, details):
+        # keep the fetched details in the row, so applying it again needs no round trip
+        for i in range(self.threads_model.rowCount()):
+            item = self.threads_model.item(i, 0)
+            if item is None or item.text() != str(details['tid']):
+                continue
+            data = item.data(Qt.UserRole + 1)
+            data.update(details)
+            item.setData(data, Qt.UserRole + 1)
+            if not data['is_java'] and 'context' in details and not self.threads_model.item(i, 2).text():
+                symbol = details['context']['pc'].get('symbol') or {}
+                if symbol.get('name') is not None:
+                    self.threads_model.item(i, 2).setText('{0} - {1}'.format(
+                        symbol['moduleName'], symbol['name']))
+
     def resume_tid(self, tid):
         # todo: check why removing here and removing in on_proc_resume
         for i in range(self.threads_model.rowCount()):
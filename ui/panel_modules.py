@@ -31,6 +31,10 @@ class ModulesPanel(QWidget):
         Signals:
             onAddHook([ptr, funcname]) - MenuItem AddHook
             onDumpBinary([ptr, size#int]) - MenuItem DumpBinary
+            onDisassemble([ptr, size#int]) - MenuItem Disassemble
+            onAnalyze(name) - MenuItem Analyze
+            onIndexXrefs(name) - MenuItem IndexXrefs
+            onShowXrefs(ptr) - MenuItem XrefsTo
             onModuleSelected([ptr, size#int]) - ModuleDoubleClicked
             onModuleFuncSelected(ptr) - FunctionDoubleClicked
     """
@@ -38,6 +42,10 @@ class ModulesPanel(QWidget):
 
     onAddHook = pyqtSignal(list, name='onAddHook')
     onDumpBinary = pyqtSignal(list, name='onDumpBinary')
+    onDisassemble = pyqtSignal(list, name='onDisassemble')
+    onAnalyze = pyqtSignal(str, name='onAnalyze')
+    onIndexXrefs = pyqtSignal(str, name='onIndexXrefs')
+    onShowXrefs = pyqtSignal(str, name='onShowXrefs')
     onModuleSelected = pyqtSignal(list, name='onModuleSelected')
     onModuleFuncSelected = pyqtSignal(str, name='onModuleFuncSelected')
 
@@ -53,6 +61,9 @@ class ModulesPanel(QWidget):
 
         self._uppercase_hex = True
 
+        # in flight enumeration of the selected module
+        self._pending_module = None
+
         # setup models
         self.modules_list = None
         self.modules_model = QStandardItemModel(0, 4, self)
@@ -312,8 +323,20 @@ class ModulesPanel(QWidget):
         if module is None:
             return
 
-        imports = self._app_window.dwarf.dwarf_api('enumerateImports',
-                                                   module.text())
+        # enumerating big modules is slow, don't block the ui
+        self._app_window.dwarf.cancel_async(self._pending_module)
+        self._pending_module = self._app_window.dwarf.dwarf_api_batch_async([
+            ('enumerateImports', module.text()),
+            ('enumerateExports', module.text()),
+            ('enumerateSymbols', module.text())
+        ], callback=self._on_module_enumerated)
+
+    def _on_module_enumerated(self, results):
+        self._pending_module = None
+        if results is None:
+            return
+
+        imports, exports, symbols = results
         if imports and (imports is not None):
             imports = json.loads(imports)
             if imports:
@@ -322,8 +345,6 @@ class ModulesPanel(QWidget):
             else:
                 self.imports_list.setVisible(False)
 
-        exports = self._app_window.dwarf.dwarf_api('enumerateExports',
-                                                   module.text())
         if exports and exports is not None:
             exports = json.loads(exports)
             if exports:
@@ -332,8 +353,6 @@ class ModulesPanel(QWidget):
             else:
                 self.exports_list.setVisible(False)
 
-        symbols = self._app_window.dwarf.dwarf_api('enumerateSymbols',
-                                                   module.text())
         if symbols and symbols is not None:
             symbols = json.loads(symbols)
             if symbols:
@@ -382,6 +401,16 @@ class ModulesPanel(QWidget):
                 'Dump Binary', lambda: self._on_dumpmodule(
                     self.modules_model.item(index, 1).text(),
                     self.modules_model.item(index, 2).text()))
+            context_menu.addAction(
+                'Disassemble', lambda: self.onDisassemble.emit([
+                    self.modules_model.item(index, 1).text(),
+                    self.modules_model.item(index, 2).text().replace(',', '')]))
+            context_menu.addAction(
+                'Analyze', lambda: self.onAnalyze.emit(
+                    self.modules_model.item(index, 0).text()))
+            context_menu.addAction(
+                'Index Xrefs', lambda: self.onIndexXrefs.emit(
+                    self.modules_model.item(index, 0).text()))
             context_menu.addAction(
                 'Copy address', lambda: utils.copy_hex_to_clipboard(
                     self.modules_model.item(index, 1).text()))
@@ -408,6 +437,7 @@ class ModulesPanel(QWidget):
             addr = self.imports_model.item(index, 1).text()
             context_menu.addAction(
                 'Add Hook', lambda: self._add_hook(addr, func_name))
+            context_menu.addAction('Xrefs to', lambda: self.onShowXrefs.emit(addr))
             context_menu.addSeparator()
             context_menu.addAction(
                 'Copy address', lambda: utils.copy_hex_to_clipboard(
@@ -432,6 +462,7 @@ class ModulesPanel(QWidget):
             addr = self.exports_model.item(index, 1).text()
             context_menu.addAction(
                 'Add Hook', lambda: self._add_hook(addr, func_name))
+            context_menu.addAction('Xrefs to', lambda: self.onShowXrefs.emit(addr))
             context_menu.addSeparator()
             context_menu.addAction(
                 'Copy address', lambda: utils.copy_hex_to_clipboard(
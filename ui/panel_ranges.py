@@ -14,6 +14,8 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
+import bisect
+
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtWidgets import QHeaderView, QMenu
@@ -29,11 +31,13 @@ class RangesPanel(DwarfListView):
         Signals:
             onItemDoubleClicked(str) - only fired when prot has +r
             onDumpBinary([ptr, size#int]) - MenuItem DumpBinary
+            onDisassemble([ptr, size#int]) - MenuItem Disassemble
             onAddWatcher(str) - MenuItem AddWatcher
     """
 
     onItemDoubleClicked = pyqtSignal(str, name='onItemDoubleClicked')
     onDumpBinary = pyqtSignal(list, name='onDumpBinary')
+    onDisassemble = pyqtSignal(list, name='onDisassemble')
     onAddWatcher = pyqtSignal(str, name='onAddWatcher')
 
     def __init__(self, parent=None):
@@ -46,6 +50,7 @@ class RangesPanel(DwarfListView):
 
         # connect to dwarf
         self._app_window.dwarf.onSetRanges.connect(self.set_ranges)
+        self._app_window.dwarf.onRangesDelta.connect(self.apply_ranges_delta)
 
         self._uppercase_hex = True
 
@@ -112,48 +117,68 @@ class RangesPanel(DwarfListView):
         if isinstance(ranges, list):
             self._ranges_model.removeRows(0, self._ranges_model.rowCount())
             for range_entry in ranges:
-                # create items to add
-                str_frmt = ''
-                if self._uppercase_hex:
-                    str_frmt = '0x{0:X}'
-                else:
-                    str_frmt = '0x{0:x}'
-
-                addr = QStandardItem()
-                addr.setTextAlignment(Qt.AlignCenter)
-                addr.setText(str_frmt.format(int(range_entry['base'], 16)))
-
-                size = QStandardItem()
-                size.setTextAlignment(Qt.AlignRight)
-                size.setText("{0:,d}".format(int(range_entry['size'])))
-
-                protection = QStandardItem()
-                protection.setTextAlignment(Qt.AlignCenter)
-                protection.setText(range_entry['protection'])
-
-                file_path = None
-                file_addr = None
-                file_size = None
-
-                if len(range_entry) > 3:
-                    if range_entry['file']['path']:
-                        file_path = QStandardItem()
-                        file_path.setText(range_entry['file']['path'])
-
-                    if range_entry['file']['offset']:
-                        file_addr = QStandardItem()
-                        file_addr.setTextAlignment(Qt.AlignCenter)
-                        file_addr.setText(
-                            str_frmt.format(range_entry['file']['offset']))
-
-                    if range_entry['file']['size']:
-                        file_size = QStandardItem()
-                        file_size.setTextAlignment(Qt.AlignRight)
-                        file_size.setText("{0:,d}".format(
-                            int(range_entry['file']['size'])))
-
-                self._ranges_model.appendRow(
-                    [addr, size, protection, file_addr, file_size, file_path])
+                self._ranges_model.appendRow(self._range_items(range_entry))
+
+    def apply_ranges_delta(self, added, removed):
+        """ Updates only the rows of changed ranges
+        """
+        removed = set(int(base, 16) for base in removed)
+        bases = []
+        for row in reversed(range(self._ranges_model.rowCount())):
+            base = int(self._ranges_model.item(row, 0).text(), 16)
+            if base in removed:
+                self._ranges_model.removeRow(row)
+            else:
+                bases.insert(0, base)
+
+        for range_entry in sorted(added, key=lambda entry: int(entry['base'], 16)):
+            base = int(range_entry['base'], 16)
+            row = bisect.bisect_left(bases, base)
+            bases.insert(row, base)
+            self._ranges_model.insertRow(row, self._range_items(range_entry))
+
+    def _range_items(self, range_entry):
+        # create items to add
+        str_frmt = ''
+        if self._uppercase_hex:
+            str_frmt = '0x{0:X}'
+        else:
+            str_frmt = '0x{0:x}'
+
+        addr = QStandardItem()
+        addr.setTextAlignment(Qt.AlignCenter)
+        addr.setText(str_frmt.format(int(range_entry['base'], 16)))
+
+        size = QStandardItem()
+        size.setTextAlignment(Qt.AlignRight)
+        size.setText("{0:,d}".format(int(range_entry['size'])))
+
+        protection = QStandardItem()
+        protection.setTextAlignment(Qt.AlignCenter)
+        protection.setText(range_entry['protection'])
+
+        file_path = None
+        file_addr = None
+        file_size = None
+
+        if len(range_entry) > 3:
+            if range_entry['file']['path']:
+                file_path = QStandardItem()
+                file_path.setText(range_entry['file']['path'])
+
+            if range_entry['file']['offset']:
+                file_addr = QStandardItem()
+                file_addr.setTextAlignment(Qt.AlignCenter)
+                file_addr.setText(
+                    str_frmt.format(range_entry['file']['offset']))
+
+            if range_entry['file']['size']:
+                file_size = QStandardItem()
+                file_size.setTextAlignment(Qt.AlignRight)
+                file_size.setText("{0:,d}".format(
+                    int(range_entry['file']['size'])))
+
+        return [addr, size, protection, file_addr, file_size, file_path]
 
     def update_ranges(self):
         """ DwarfApiCall updateRanges
@@ -177,6 +202,10 @@ class RangesPanel(DwarfListView):
                     'Dump Binary', lambda: self._on_dumprange(
                         self._ranges_model.item(index, 0).text(),
                         self._ranges_model.item(index, 1).text()))
+                context_menu.addAction(
+                    'Disassemble', lambda: self.onDisassemble.emit([
+                        self._ranges_model.item(index, 0).text(),
+                        self._ranges_model.item(index, 1).text().replace(',', '')]))
                 context_menu.addSeparator()
 
             context_menu.addAction(
@@ -188,6 +217,10 @@ class RangesPanel(DwarfListView):
                     self._ranges_model.item(index, 0).text()))
             context_menu.addSeparator()
 
+        # through lambdas, triggered would pass checked as the first argument
+        context_menu.addAction('Dump process', lambda: self._app_window.dwarf.dump_process())
+        context_menu.addAction('Take snapshot', lambda: self._app_window.dwarf.take_snapshot())
+        context_menu.addAction('Diff with snapshot', self._app_window.dwarf.diff_snapshot)
         context_menu.addAction('Refresh', self.update_ranges)
         context_menu.exec_(glbl_pt)
 
@@ -14,46 +14,163 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QModelIndex
+from array import array
+from itertools import count
+
+from PyQt5.QtCore import Qt, pyqtSignal, QModelIndex, QAbstractTableModel
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtWidgets import QWidget, QLineEdit, QVBoxLayout, QHBoxLayout, QRadioButton, QPushButton, QProgressDialog, \
-    QSizePolicy, QApplication, QHeaderView
+    QSizePolicy, QApplication, QHeaderView, QComboBox, QPlainTextEdit, QMenu, QFileDialog
 
 from ui.list_view import DwarfListView
 from lib import utils
-from ui.hex_edit import HighLight, HighlightExistsError
-
+from lib.process_dump import DumpSearchThread, ProcessDump
+from lib.scan_patterns import PatternError, parse_hex, parse_needles, parse_string
+from lib.search_results import SearchResults
+from lib.value_scanner import ValueScanner, ValueScanThread, VALUE_TYPES, VALUE_CONDITIONS
+from ui.hex_edit import HighLight
 
-class SearchThread(QThread):
-    onCmdCompleted = pyqtSignal(str, name='onCmdCompleted')
-    onError = pyqtSignal(str, name='onError')
 
-    dwarf = None
-    ranges = []
-    pattern = ''
+class SearchResultsModel(QAbstractTableModel):
+    """ lazy view over a SearchResults store
 
-    def __init__(self, dwarf=None, parent=None):
-        super().__init__(parent=parent)
-        self.dwarf = dwarf
+        holds only the row ids passing the filters, cells are formatted
+        when the view asks for them
+    """
 
-    def run(self):
-        if self.dwarf is None:
-            self.onError.emit('Dwarf missing')
+    HEADERS = ('Address', 'Pattern')
+
+    def __init__(self, results, parent=None):
+        super(SearchResultsModel, self).__init__(parent)
+        self._results = results
+        self._rows = array('L')
+        self._range = None
+        self._pattern = None
+        # (column, reverse) or None to keep the hits order
+        self._sort = None
+        self.needles = []
+        self.uppercase_hex = True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if index.column() == 0:
+            if self.uppercase_hex:
+                return '0x{0:X}'.format(self._results.addresses[row])
+            return '0x{0:x}'.format(self._results.addresses[row])
+        pattern = self._results.patterns[row]
+        return self.needles[pattern].name if pattern < len(self.needles) else ''
+
+    def address(self, index):
+        return self._results.addresses[self._rows[index]]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column < 0:
+            self._sort = None
             return
-        if self.pattern is '' or len(self.pattern) <= 0:
-            self.onError.emit('Pattern missing')
-            return
-        if len(self.ranges) <= 0:
-            self.onError.emit('Ranges missing')
+        self.layoutAboutToBeChanged.emit()
+        self._sort = (column, order == Qt.DescendingOrder)
+        self._rows = self._results.sort(self._rows, column, reverse=self._sort[1])
+        self.layoutChanged.emit()
+
+    def set_filter(self, range_index=None, pattern=None):
+        self.beginResetModel()
+        self._range = range_index
+        self._pattern = pattern
+        self._rows = self._results.select(range_index, pattern)
+        if self._sort is not None:
+            self._rows = self._results.sort(self._rows, self._sort[0], reverse=self._sort[1])
+        self.endResetModel()
+
+    def added(self, first):
+        """ hits from row id first on were added to the store
+        """
+        if self._sort is not None:
+            # sorted views are rebuilt
+            self.set_filter(self._range, self._pattern)
             return
+        rows = self._results.select(self._range, self._pattern, start=first)
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
 
-        #_list = []
-        for r in self.ranges:
-            self.dwarf.search(r[0], int(r[1].replace(',', '')), self.pattern)
-            #_list.append({'start': r[0], 'size': int(r[1].replace(',', ''))})
+    def clear(self):
+        self.beginResetModel()
+        self._rows = array('L')
+        self.endResetModel()
 
-        #self.dwarf.search_list(_list, self.pattern)
-        self.onCmdCompleted.emit('finished')
+
+class ValueResultsModel(QAbstractTableModel):
+    """ lazy view over the candidates of a ValueScanner
+    """
+
+    HEADERS = ('Address', 'Value')
+
+    def __init__(self, parent=None):
+        super(ValueResultsModel, self).__init__(parent)
+        self._scanner = None
+        # fixed until the next reset, the scanner swaps its arrays at the end of a scan
+        self._count = 0
+        self.uppercase_hex = True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._count
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        entry = self._scanner.results(index.row(), 1)
+        if not entry:
+            return None
+        address, value = entry[0]
+        if index.column() == 0:
+            if self.uppercase_hex:
+                return '0x{0:X}'.format(address)
+            return '0x{0:x}'.format(address)
+        if isinstance(value, float):
+            return '{0:g}'.format(value)
+        return str(value)
+
+    def address(self, index):
+        entry = self._scanner.results(index, 1)
+        return entry[0][0] if entry else None
+
+    def set_scanner(self, scanner):
+        """ lists the candidates of scanner, None clears
+        """
+        self.beginResetModel()
+        self._scanner = scanner
+        self._count = len(scanner) if scanner is not None else 0
+        self.endResetModel()
 
 
 class SearchPanel(QWidget):
@@ -62,6 +179,9 @@ class SearchPanel(QWidget):
 
     onShowMemoryRequest = pyqtSignal(str, name='onShowMemoryRequest')
 
+    # search highlights added to the memory panel at most
+    MAX_HIGHLIGHTS = 4096
+
     def __init__(self, parent=None, show_progress_dlg=False):
         super(SearchPanel, self).__init__(parent=parent)
         self._app_window = parent
@@ -70,7 +190,10 @@ class SearchPanel(QWidget):
             print('SearchPanel created before Dwarf exists')
             return
 
-        self._app_window.dwarf.onMemoryScanResult.connect(self._on_search_result)
+        self._app_window.dwarf.onMemoryScanBatch.connect(self._on_search_result)
+        self._app_window.dwarf.onMemoryScanProgress.connect(self._on_search_progress)
+        self._app_window.dwarf.onMemoryScanComplete.connect(self._on_search_complete)
+        self._app_window.dwarf.onRangesDelta.connect(self.apply_ranges_delta)
 
         self._ranges_model = None
         self._result_model = None
@@ -79,13 +202,53 @@ class SearchPanel(QWidget):
         self.progress = None
         self._pattern_length = 0
 
-        self._search_results = []
+        # running scan, range index in the request -> ranges model row
+        self._scan_id = 0
+        self._scan_rows = []
+        # hits of the running/last scan, the range column holds the ranges model row
+        self._results = SearchResults()
+        # ranges model row -> hits
+        self._row_counts = {}
+        # hits listed only for this pattern
+        self._shown_pattern = None
+        self._needles = []
+        self._counts_model = None
+        # row whose results are listed
+        self._shown_row = -1
+        # value mode, first scan and the next ones
+        self._value_scanner = None
+        self._value_thread = None
+        # offline source, searches go to the dump instead of the agent
+        self._dump = None
+        self._dump_thread = None
+        # negative, the agent scan ids count up
+        self._dump_scan_ids = count(-1, -1)
 
         box = QVBoxLayout()
 
+        self.mode = QComboBox()
+        self.mode.addItems(['hex', 'ascii', 'utf-16', 'multi', 'value'])
+        self.mode.currentTextChanged.connect(self._on_mode_changed)
+        self.value_type = QComboBox()
+        self.value_type.addItems(list(VALUE_TYPES.keys()))
+        self.value_type.setCurrentText('int32')
+        self.value_type.setVisible(False)
         self.input = QLineEdit()
         self.input.setPlaceholderText('search for a sequence of bytes in hex format: deadbeef123456aabbccddeeff...')
-        box.addWidget(self.input)
+        h_box = QHBoxLayout()
+        h_box.addWidget(self.mode)
+        h_box.addWidget(self.value_type)
+        h_box.addWidget(self.input)
+        box.addLayout(h_box)
+
+        self.multi_input = QPlainTextEdit()
+        self.multi_input.setPlaceholderText('one pattern per line, all of them are searched in a single pass:\n'
+                                            'dead??ef  - hex, ? wildcards a nibble\n'
+                                            '"text"    - ascii\n'
+                                            'u"text"   - utf-16')
+        self.multi_input.setMaximumHeight(120)
+        self.multi_input.setVisible(False)
+        box.addWidget(self.multi_input)
 
         self.check_all_btn = QPushButton('check all')
         self.check_all_btn.clicked.connect(self._on_click_check_all)
@@ -93,21 +256,51 @@ class SearchPanel(QWidget):
         self.uncheck_all_btn.clicked.connect(self._on_click_uncheck_all)
         self.search_btn = QPushButton('search')
         self.search_btn.clicked.connect(self._on_click_search)
+        self.dump_btn = QPushButton('open dump')
+        self.dump_btn.clicked.connect(self._on_click_dump)
 
         h_box = QHBoxLayout()
         h_box.addWidget(self.check_all_btn)
         h_box.addWidget(self.uncheck_all_btn)
         h_box.addWidget(self.search_btn)
+        h_box.addWidget(self.dump_btn)
         box.addLayout(h_box)
 
+        # next scans compare against the value in input or against the previous scan
+        self.condition = QComboBox()
+        for name, condition in (('exact', 'equal'), ('changed', 'changed'), ('unchanged', 'unchanged'),
+                                ('increased', 'increased'), ('decreased', 'decreased'),
+                                ('not equal', 'not_equal'), ('greater', 'greater'), ('less', 'less'),
+                                ('increased by', 'increased_by'), ('decreased by', 'decreased_by')):
+            self.condition.addItem(name, condition)
+        self.next_scan_btn = QPushButton('next scan')
+        self.next_scan_btn.clicked.connect(self._on_click_next_scan)
+        self.next_scan_btn.setEnabled(False)
+        self.value_box = QWidget()
+        h_box = QHBoxLayout(self.value_box)
+        h_box.setContentsMargins(0, 0, 0, 0)
+        h_box.addWidget(self.condition)
+        h_box.addWidget(self.next_scan_btn)
+        self.value_box.setVisible(False)
+        box.addWidget(self.value_box)
+
         self.ranges = DwarfListView(self)
         self.ranges.clicked.connect(self._on_show_results)
         self.results = DwarfListView(self)
+        self.results.setUniformRowHeights(True)
         self.results.setVisible(False)
+        self.pattern_counts = DwarfListView(self)
+        self.pattern_counts.clicked.connect(self._on_pattern_clicked)
+        self.pattern_counts.setVisible(False)
+        self.value_results = DwarfListView(self)
+        self.value_results.setUniformRowHeights(True)
+        self.value_results.setVisible(False)
 
         h_box = QHBoxLayout()
         h_box.addWidget(self.ranges)
         h_box.addWidget(self.results)
+        h_box.addWidget(self.pattern_counts)
+        h_box.addWidget(self.value_results)
         box.addLayout(h_box)
 
         self.setLayout(box)
@@ -152,71 +345,114 @@ class SearchPanel(QWidget):
         self.ranges.doubleClicked.connect(self._on_range_dblclick)
 
         # setup results model
-        self._result_model = QStandardItemModel(0, 1)
-        self._result_model.setHeaderData(0, Qt.Horizontal, 'Address')
+        self._result_model = SearchResultsModel(self._results, self)
+        self._result_model.uppercase_hex = self.results.uppercase_hex
         self.results.setModel(self._result_model)
+        self.results.header().setSortIndicator(-1, Qt.AscendingOrder)
+        self.results.setSortingEnabled(True)
+
+        # hits per pattern of multi pattern searches
+        self._counts_model = QStandardItemModel(0, 2)
+        self._counts_model.setHeaderData(0, Qt.Horizontal, 'Pattern')
+        self._counts_model.setHeaderData(1, Qt.Horizontal, 'Hits')
+        self.pattern_counts.setModel(self._counts_model)
         self.results.doubleClicked.connect(self._on_dblclicked)
+        self.results.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.results.customContextMenuRequested.connect(self._on_results_contextmenu)
+
+        # candidates of value scans
+        self._value_model = ValueResultsModel(self)
+        self._value_model.uppercase_hex = self.value_results.uppercase_hex
+        self.value_results.setModel(self._value_model)
+        self.value_results.doubleClicked.connect(self._on_value_dblclicked)
+        self.value_results.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.value_results.customContextMenuRequested.connect(self._on_value_results_contextmenu)
 
     def set_ranges(self, ranges):
         """ Fills Rangelist with Data
         """
+        if self._dump is not None:
+            # the live ranges are listed again once the dump is closed
+            return
         self.ranges.header().setSectionResizeMode(0, QHeaderView.Fixed)
         if isinstance(ranges, list):
             self._ranges_model.removeRows(0, self._ranges_model.rowCount())
             for range_entry in ranges:
-                if 'protection' in range_entry and isinstance(range_entry['protection'], str):
-                    if 'r' not in range_entry['protection']:
-                        # skip not readable range
-                        continue
-
-                else:
-                    continue
-                # create items to add
-                str_frmt = ''
-                if self.ranges._uppercase_hex:
-                    str_frmt = '0x{0:X}'
-                else:
-                    str_frmt = '0x{0:x}'
-
-                addr = QStandardItem()
-                addr.setTextAlignment(Qt.AlignCenter)
-                addr.setText(str_frmt.format(int(range_entry['base'], 16)))
-
-                size = QStandardItem()
-                size.setTextAlignment(Qt.AlignRight)
-                size.setText("{0:,d}".format(int(range_entry['size'])))
-
-                protection = QStandardItem()
-                protection.setTextAlignment(Qt.AlignCenter)
-                protection.setText(range_entry['protection'])
-
-                file_path = None
-                file_addr = None
-                file_size = None
-
-                if len(range_entry) > 3:
-                    if range_entry['file']['path']:
-                        file_path = QStandardItem()
-                        file_path.setText(range_entry['file']['path'])
-
-                    if range_entry['file']['offset']:
-                        file_addr = QStandardItem()
-                        file_addr.setTextAlignment(Qt.AlignCenter)
-                        file_addr.setText(
-                            str_frmt.format(range_entry['file']['offset']))
-
-                    if range_entry['file']['size']:
-                        file_size = QStandardItem()
-                        file_size.setTextAlignment(Qt.AlignRight)
-                        file_size.setText("{0:,d}".format(
-                            int(range_entry['file']['size'])))
-
-
-                checkbox = QStandardItem()
-                checkbox.setCheckable(True)
-
-                self._ranges_model.appendRow(
-                    [checkbox, addr, size, protection, file_addr, file_size, file_path])
+                if self._is_readable(range_entry):
+                    self._ranges_model.appendRow(self._range_items(range_entry))
+
+    def apply_ranges_delta(self, added, removed):
+        """ Updates only the rows of changed ranges
+        """
+        if self._dump is not None:
+            return
+        # hits point at ranges rows, rows are only dropped when there are none
+        if not self._scan_id and not len(self._results):
+            removed = set(int(base, 16) for base in removed)
+            for row in reversed(range(self._ranges_model.rowCount())):
+                if int(self._ranges_model.item(row, 1).text(), 16) in removed:
+                    self._ranges_model.removeRow(row)
+
+        for range_entry in added:
+            if not self._is_readable(range_entry):
+                continue
+            items = self._range_items(range_entry)
+            if self._ranges_model.columnCount() <= 4:
+                # the results column took the place of protection and file info
+                items = items[:3] + [QStandardItem('')]
+            self._ranges_model.appendRow(items)
+
+    @staticmethod
+    def _is_readable(range_entry):
+        if 'protection' in range_entry and isinstance(range_entry['protection'], str):
+            return 'r' in range_entry['protection']
+        return False
+
+    def _range_items(self, range_entry):
+        # create items to add
+        str_frmt = ''
+        if self.ranges._uppercase_hex:
+            str_frmt = '0x{0:X}'
+        else:
+            str_frmt = '0x{0:x}'
+
+        addr = QStandardItem()
+        addr.setTextAlignment(Qt.AlignCenter)
+        addr.setText(str_frmt.format(int(range_entry['base'], 16)))
+
+        size = QStandardItem()
+        size.setTextAlignment(Qt.AlignRight)
+        size.setText("{0:,d}".format(int(range_entry['size'])))
+
+        protection = QStandardItem()
+        protection.setTextAlignment(Qt.AlignCenter)
+        protection.setText(range_entry['protection'])
+
+        file_path = None
+        file_addr = None
+        file_size = None
+
+        if len(range_entry) > 3:
+            if range_entry['file']['path']:
+                file_path = QStandardItem()
+                file_path.setText(range_entry['file']['path'])
+
+            if range_entry['file']['offset']:
+                file_addr = QStandardItem()
+                file_addr.setTextAlignment(Qt.AlignCenter)
+                file_addr.setText(
+                    str_frmt.format(range_entry['file']['offset']))
+
+            if range_entry['file']['size']:
+                file_size = QStandardItem()
+                file_size.setTextAlignment(Qt.AlignRight)
+                file_size.setText("{0:,d}".format(
+                    int(range_entry['file']['size'])))
+
+        checkbox = QStandardItem()
+        checkbox.setCheckable(True)
+
+        return [checkbox, addr, size, protection, file_addr, file_size, file_path]
 
     # ************************************************************************
     # **************************** Handlers **********************************
@@ -238,28 +474,107 @@ class SearchPanel(QWidget):
             self._ranges_model.item(i, 0).setCheckState(Qt.Unchecked)
 
     def _on_dblclicked(self, model_index):
-        item = self._result_model.itemFromIndex(model_index)
-        if item:
-            self.onShowMemoryRequest.emit(
-                self._result_model.item(model_index.row(), 0).text())
+        if model_index.isValid():
+            self.onShowMemoryRequest.emit(hex(self._result_model.address(model_index.row())))
 
-    def _on_click_search(self):
-        pattern = self.input.text().replace(' ', '')
-        if pattern == '':
-            return 1
+    def _on_results_contextmenu(self, pos):
+        index = self.results.indexAt(pos).row()
+        if index == -1:
+            return
+        self._show_address_menu(self.results.mapToGlobal(pos), self._result_model.address(index))
 
+    def _on_value_dblclicked(self, model_index):
+        if model_index.isValid():
+            address = self._value_model.address(model_index.row())
+            if address is not None:
+                self.onShowMemoryRequest.emit(hex(address))
+
+    def _on_value_results_contextmenu(self, pos):
+        index = self.value_results.indexAt(pos).row()
+        if index == -1:
+            return
+        address = self._value_model.address(index)
+        if address is not None:
+            self._show_address_menu(self.value_results.mapToGlobal(pos), address)
+
+    def _show_address_menu(self, glbl_pt, address):
+        context_menu = QMenu(self)
+        address = hex(address)
+        context_menu.addAction('Copy address', lambda: utils.copy_hex_to_clipboard(address))
+        context_menu.addAction('Pointer scan', lambda: self._app_window.dwarf.pointer_scan(address))
+        context_menu.exec_(glbl_pt)
+
+    def _checked_ranges(self):
+        """ [[base, size]] and ranges model rows of the checked ranges
+        """
         ranges = []
-        self._search_results = []
+        rows = []
         for i in range(self._ranges_model.rowCount()):
             item = self._ranges_model.item(i, 0)
             if item.checkState() == Qt.Checked:
                 addr = self._ranges_model.item(i, 1)
                 size = self._ranges_model.item(i, 2)
-                ranges.append([addr.text(), size.text()])
+                ranges.append([addr.text(), size.text().replace(',', '')])
+                rows.append(i)
+        return ranges, rows
+
+    def _on_click_search(self):
+        if self._scan_id:
+            # the button cancels while a scan is running
+            self._on_cancel_search()
+            return 0
+        if self.mode.currentText() == 'value':
+            if self._dump is not None:
+                self._on_search_error('value scans need the live process, close the dump first')
+                return 1
+            return self._value_first_scan()
+
+        try:
+            needles = self._build_needles()
+        except PatternError as e:
+            self._on_search_error(str(e))
+            return 1
+        if not needles:
+            return 1
 
+        ranges, self._scan_rows = self._checked_ranges()
         if len(ranges) == 0:
             return 1
 
+        if self._dump is not None:
+            scan_id = self._search_dump(needles, ranges)
+        elif len(needles) == 1 and not needles[0].has_nibble_mask:
+            # frida native scanner
+            scan_id = self._app_window.dwarf.scan_memory(needles[0].to_frida_pattern(), ranges)
+        else:
+            scan_id = self._app_window.dwarf.scan_memory_multi(needles, ranges)
+        if not scan_id:
+            self._on_search_error('Unable to start the search')
+            return 1
+        self._scan_id = scan_id
+
+        # results are shown while they come in
+        if self._ranges_model.columnCount() > 4:
+            self._ranges_model.removeColumns(4, 3)
+            self._ranges_model.setHeaderData(3, Qt.Horizontal, 'Search Results')
+            self._ranges_model.setHeaderData(3, Qt.Horizontal, None, Qt.TextAlignmentRole)
+        for i in range(self._ranges_model.rowCount()):
+            self._ranges_model.item(i, 3).setText('')
+            self._ranges_model.item(i, 3).setTextAlignment(Qt.AlignLeft)
+        self._results.clear()
+        self._row_counts = {}
+        self._shown_row = -1
+        self._shown_pattern = None
+        self._needles = needles
+        self._counts_model.removeRows(0, self._counts_model.rowCount())
+        for needle in needles:
+            self._counts_model.appendRow([QStandardItem(needle.name), QStandardItem('0')])
+        self.pattern_counts.setVisible(len(needles) > 1)
+        self._result_model.needles = needles
+        self._result_model.clear()
+        if self._app_window.memory_panel:
+            self._app_window.memory_panel.remove_highlights('search')
+
         if self._blocking_search:
             self.progress = QProgressDialog()
             self.progress.setFixedSize(300, 50)
@@ -272,97 +587,274 @@ class SearchPanel(QWidget):
             self.progress.setWindowFlag(Qt.WindowContextHelpButtonHint, False)
             self.progress.setWindowFlag(Qt.WindowCloseButtonHint, False)
             self.progress.setModal(True)
-            self.progress.setCancelButton(None)
-            self.progress.setRange(0, 0)
+            self.progress.canceled.connect(self._on_cancel_search)
+            self.progress.setRange(0, 100)
             self.progress.setMinimumDuration(0)
             self.progress.forceShow()
 
         self._app_window.show_progress('searching...')
         self.input.setEnabled(False)
-        self.search_btn.setEnabled(False)
+        self.multi_input.setEnabled(False)
+        self.mode.setEnabled(False)
+        self.search_btn.setText('cancel')
         self.check_all_btn.setEnabled(False)
         self.uncheck_all_btn.setEnabled(False)
+        self.dump_btn.setEnabled(False)
 
-        self._pattern_length = len(pattern) * .5
+        self._pattern_length = max(len(needle) for needle in needles)
 
-        search_thread = SearchThread(self._app_window.dwarf, self)
-        search_thread.onCmdCompleted.connect(self._on_search_complete)
-        search_thread.onError.connect(self._on_search_error)
-        search_thread.pattern = pattern
-        search_thread.ranges = ranges
-        search_thread.start()
+    def _search_dump(self, needles, ranges):
+        self._dump_thread = DumpSearchThread(self._dump, next(self._dump_scan_ids), needles,
+                                             [(int(base, 16), int(size)) for base, size in ranges])
+        self._dump_thread.onMemoryScanBatch.connect(self._on_search_result)
+        self._dump_thread.onMemoryScanProgress.connect(self._on_search_progress)
+        self._dump_thread.onMemoryScanComplete.connect(self._on_search_complete)
+        self._dump_thread.start()
+        return self._dump_thread.scan_id
 
-    def _on_search_result(self, data):
-        self._search_results.append(data)
+    def _on_click_dump(self):
+        """ lists the ranges of a process dump to search them offline, click again to go back live
+        """
+        if self._dump is not None:
+            self._dump.close()
+            self._dump = None
+            self.dump_btn.setText('open dump')
+            self._clear_results()
+            self.set_ranges(self._app_window.dwarf.memory_map.ranges)
+            return
+        path = QFileDialog.getExistingDirectory(self, caption='Open process dump')
+        if not path:
+            return
+        try:
+            dump = ProcessDump(path)
+        except ProcessDump.InvalidDumpError as e:
+            self._on_search_error('not a process dump: {0}'.format(e))
+            return
+        self._clear_results()
+        self.set_ranges([{'base': entry['base'], 'size': entry['size'], 'protection': entry['protection']}
+                         for entry in dump.ranges])
+        self._dump = dump
+        self.dump_btn.setText('close dump')
+        self._app_window.set_status_text('{0}: {1} ranges'.format(path, len(dump.ranges)))
+
+    def _clear_results(self):
+        # hits point at ranges rows, they go with the ranges
+        self._results.clear()
+        self._result_model.clear()
+        self._row_counts = {}
+        self._shown_row = -1
+        self.results.setVisible(False)
+        if self._app_window.memory_panel:
+            self._app_window.memory_panel.remove_highlights('search')
+
+    def _build_needles(self):
+        mode = self.mode.currentText()
+        if mode == 'multi':
+            return parse_needles(self.multi_input.toPlainText())
+
+        text = self.input.text()
+        if text == '':
+            return []
+        if mode == 'hex':
+            return [parse_hex(text)]
+        return [parse_string(text, mode)]
+
+    def _on_mode_changed(self, mode):
+        value = mode == 'value'
+        self.input.setVisible(mode != 'multi')
+        self.multi_input.setVisible(mode == 'multi')
+        self.value_type.setVisible(value)
+        self.value_box.setVisible(value)
+        self.value_results.setVisible(value and self._value_scanner is not None)
+        self.results.setVisible(not value and self._shown_row >= 0)
+        self.pattern_counts.setVisible(not value and len(self._needles) > 1)
+        self.search_btn.setText('first scan' if value else 'search')
+        if mode == 'hex':
+            self.input.setPlaceholderText('search for a sequence of bytes in hex format: deadbeef123456aabbccddeeff...')
+        elif value:
+            self.input.setPlaceholderText('value to look for, next scans compare against it or the previous scan')
+        else:
+            self.input.setPlaceholderText('search for a string')
+
+    def _value_first_scan(self):
+        if self._value_thread is not None and self._value_thread.isRunning():
+            # the button cancels while a scan is running
+            self._value_thread.cancel()
+            return 0
+        text = self.input.text()
+        if text == '':
+            return 1
+        ranges, _ = self._checked_ranges()
+        if len(ranges) == 0:
+            return 1
+
+        self._value_scanner = ValueScanner(self._app_window.dwarf, self.value_type.currentText())
+        self._value_thread = ValueScanThread(self._value_scanner)
+        self._value_thread.onProgress.connect(self._on_value_scan_progress)
+        self._value_thread.onFinished.connect(self._on_value_scan_finished)
+        self._value_thread.onError.connect(self._on_value_scan_error)
+        self._value_model.set_scanner(None)
+        self._value_scan_started()
+        self._value_thread.first_scan(ranges, text)
+        return 0
+
+    def _on_click_next_scan(self):
+        if self._value_thread is None or self._value_thread.isRunning():
+            return 1
+        condition = self.condition.currentData()
+        value = None
+        if condition in VALUE_CONDITIONS:
+            value = self.input.text()
+            if value == '':
+                self._on_search_error('{0} needs a value'.format(self.condition.currentText()))
+                return 1
+        self._value_scan_started()
+        self._value_thread.next_scan(condition, value)
+        return 0
+
+    def _value_scan_started(self):
+        self._app_window.show_progress('scanning values...')
+        self.mode.setEnabled(False)
+        self.value_type.setEnabled(False)
+        self.next_scan_btn.setEnabled(False)
+        self.search_btn.setText('cancel')
+
+    def _value_scan_done(self):
+        self._app_window.hide_progress()
+        self.mode.setEnabled(True)
+        self.value_type.setEnabled(True)
+        self.search_btn.setText('first scan')
+        has_scan = self._value_scanner is not None and self._value_scanner.scans > 0
+        self.next_scan_btn.setEnabled(has_scan)
+        self.value_results.setVisible(has_scan)
+        self._value_model.set_scanner(self._value_scanner if has_scan else None)
+
+    def _on_value_scan_progress(self, percent):
+        self._app_window.set_status_text('scanning values... {0}%'.format(percent))
+
+    def _on_value_scan_finished(self, count):
+        self._value_scan_done()
+        self._app_window.set_status_text('Value scan {0}: {1} matches'.format(self._value_scanner.scans, count))
+
+    def _on_value_scan_error(self, msg):
+        self._value_scan_done()
+        if msg == 'cancelled':
+            self._app_window.set_status_text('Value scan cancelled')
+            return
+        self._app_window.set_status_text('')
+        self._on_search_error(msg)
+
+    def _on_cancel_search(self):
+        if self._scan_id < 0:
+            self._dump_thread.cancel()
+        elif self._scan_id:
+            self._app_window.dwarf.cancel_scan(self._scan_id)
+
+    def _on_search_result(self, scan_id, range_index, addresses, needles):
+        if scan_id != self._scan_id or range_index >= len(self._scan_rows):
+            return
+
+        row = self._scan_rows[range_index]
+        first = self._results.add(row, addresses, needles)
+        self._row_counts[row] = self._row_counts.get(row, 0) + len(addresses)
+        if len(self._needles) > 1:
+            counts = {}
+            for needle in needles:
+                counts[needle] = counts.get(needle, 0) + 1
+            for needle, count in counts.items():
+                item = self._counts_model.item(needle, 1)
+                item.setText(str(int(item.text()) + count))
+        self._ranges_model.item(row, 3).setText('Matches: {0}'.format(self._row_counts[row]))
+
+        if self._shown_row < 0:
+            # first range with hits gets listed
+            self._shown_row = row
+            self.ranges.setCurrentIndex(self._ranges_model.index(row, 0))
+            self.results.setVisible(True)
+            self._result_model.set_filter(row, self._shown_pattern)
+        elif row == self._shown_row:
+            self._result_model.added(first)
+
+    def _on_search_progress(self, progress):
+        if progress['id'] != self._scan_id:
+            return
+
+        range_index = progress['range']
+        if range_index < len(self._scan_rows):
+            self._ranges_model.item(self._scan_rows[range_index], 0).setCheckState(Qt.Unchecked)
+
+        percent = int(progress['scanned'] * 100 / max(progress['total'], 1))
+        self._app_window.set_status_text('searching... {0}% - {1} matches'.format(percent, len(self._results)))
+        if self._blocking_search and self.progress is not None:
+            self.progress.setValue(percent)
+
+    def _on_search_complete(self, result):
+        if result['id'] != self._scan_id:
+            return
+        self._scan_id = 0
 
-    def _on_search_complete(self):
         self.input.setEnabled(True)
-        self.search_btn.setEnabled(True)
+        self.multi_input.setEnabled(True)
+        self.mode.setEnabled(True)
+        self.search_btn.setText('search')
         self.check_all_btn.setEnabled(True)
         self.uncheck_all_btn.setEnabled(True)
+        self.dump_btn.setEnabled(True)
+        self._dump_thread = None
         self._app_window.hide_progress()
-        if self._blocking_search:
+        if self._blocking_search and self.progress is not None:
+            self.progress.canceled.disconnect(self._on_cancel_search)
             self.progress.cancel()
+            self.progress = None
 
-        self._ranges_model.removeColumns(4, 3)
-        self._ranges_model.setHeaderData(3, Qt.Horizontal, 'Search Results')
-        self._ranges_model.setHeaderData(3, Qt.Horizontal, None, Qt.TextAlignmentRole)
-
-        results_count = 0
-        is_selected = False
-        for i in range(self._ranges_model.rowCount()):
-            item = self._ranges_model.item(i, 0)
-            if item.checkState() == Qt.Checked:
-                item.setCheckState(Qt.Unchecked)
-                if not is_selected:
-                    is_selected = True
-                    self.ranges.setCurrentIndex(self._ranges_model.index(i, 0))
-            else:
-                self._search_results.insert(i, None)
-                self._ranges_model.item(i, 3).setText('')
-                self._ranges_model.item(i, 3).setTextAlignment(Qt.AlignLeft)
-                continue
-
-            if len(self._search_results[i]):
-                results_count += len(self._search_results[i])
-                self._ranges_model.item(i, 3).setText('Matches: {0}'.format(len(self._search_results[i])))
-                self._ranges_model.item(i, 3).setTextAlignment(Qt.AlignLeft)
-            else:
-                self._ranges_model.item(i, 3).setText('')
-                self._ranges_model.item(i, 3).setTextAlignment(Qt.AlignLeft)
+        if 'counts' in result:
+            for needle, count in enumerate(result['counts']):
+                self._counts_model.item(needle, 1).setText(str(count))
 
-        self._app_window.set_status_text('Search complete: {0} matches'.format(results_count))
-        if results_count:
-            for i in self._search_results:
-                if i and len(i):
-                    self.results.setVisible(True)
-                    for result in i:
-                        self._result_model.appendRow(QStandardItem(result['address']))
+        if 'error' in result:
+            self._on_search_error(result['error'])
+        status = 'Search complete: {0} matches'
+        if result['cancelled']:
+            status = 'Search cancelled: {0} matches'
+        self._app_window.set_status_text(status.format(len(self._results)))
 
-                    break
+        memory_panel = self._app_window.memory_panel
+        if memory_panel is not None and memory_panel.data is not None:
+            self.highlight_range(memory_panel.base, len(memory_panel.data))
 
     def _on_search_error(self, msg):
         utils.show_message_box(msg)
 
     def _on_show_results(self):
-        if self._search_results:
-            self.results.clear()
-            if self._app_window.memory_panel:
-                self._app_window.memory_panel.remove_highlights('search')
-            selected_index = self.ranges.selectionModel().currentIndex().row()
-            if selected_index is not None:
-                item_txt = self._ranges_model.item(selected_index, 3).text()
-                if item_txt == '':
-                    return
-
-                for result in self._search_results[selected_index]:
-                    self._result_model.appendRow(QStandardItem(result['address']))
-
-                    # TODO: fix hexview highlights performance
-                    """
-                    if self._app_window.memory_panel:
-                        try:
-                            self._app_window.memory_panel.add_highlight(
-                                HighLight('search', utils.parse_ptr(result['address']), self._pattern_length))
-                        except HighlightExistsError:
-                            pass"""
+        if not len(self._results):
+            return
+        selected_index = self.ranges.selectionModel().currentIndex().row()
+        if selected_index < 0 or selected_index not in self._row_counts:
+            return
+        self._shown_row = selected_index
+        self._result_model.set_filter(self._shown_row, self._shown_pattern)
+
+    def _on_pattern_clicked(self, model_index):
+        """ lists only the hits of the clicked pattern, click again to list all
+        """
+        pattern = model_index.row()
+        self._shown_pattern = None if pattern == self._shown_pattern else pattern
+        if self._shown_row >= 0:
+            self._result_model.set_filter(self._shown_row, self._shown_pattern)
+
+    def highlight_range(self, base, size):
+        """ highlights the hits in [base, base + size) of the memory panel
+        """
+        memory_panel = self._app_window.memory_panel
+        if memory_panel is None:
+            return
+        memory_panel.remove_highlights('search')
+        rows = self._results.in_range(base, base + size)[:self.MAX_HIGHLIGHTS]
+        if not rows:
+            return
+        highlights = []
+        for row in rows:
+            pattern = self._results.patterns[row]
+            length = len(self._needles[pattern]) if pattern < len(self._needles) else self._pattern_length
+            highlights.append(HighLight('search', self._results.addresses[row], length))
+        memory_panel.add_highlights(highlights)
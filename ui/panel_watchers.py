@@ -263,8 +263,7 @@ class WatchersPanel(QWidget):
                         if ptr == 0:
                             return
 
-                        if not self._app_window.dwarf.dwarf_api(
-                                'isValidPointer', ptr):
+                        if not self._app_window.dwarf.memory_map.is_valid_pointer(ptr):
                             return
                 else:
                     return
@@ -396,6 +395,12 @@ class WatchersPanel(QWidget):
             context_menu.addAction(
                 'Delete address', lambda: self.remove_address(
                     self._watchers_model.item(index, 0).text()))
+            context_menu.addAction(
+                'Pointer scan', lambda: self._app_window.dwarf.pointer_scan(
+                    self._watchers_model.item(index, 0).text()))
+        context_menu.addSeparator()
+        # triggered passes checked, which would end up as the file path
+        context_menu.addAction('Recheck pointer paths', lambda: self._app_window.dwarf.recheck_pointer_paths())
         context_menu.exec_(glbl_pt)
 
     def _on_item_dblclick(self, model_index):
@@ -43,8 +43,10 @@ class TableBaseWidget(QTableWidget):
         item = self.itemAt(pos)
         menu = QMenu()
         search = None
+        is_watched = False
         if isinstance(item, MemoryAddressWidget):
-            sym = self.app.dwarf.dwarf_api('getSymbolByAddress', item.get_address())
+            sym = self.app.dwarf.symbols.lookup(item.get_address())
+            is_watched = self.app.dwarf.dwarf_api('isAddressWatched', item.get_address())
             if sym is not None:
                 if sym['name'] == '' or sym['name'] is None:
                     sym['name'] = sym['address']
@@ -63,7 +65,7 @@ class TableBaseWidget(QTableWidget):
             if len(menu.actions()) > 0:
                 menu.addSeparator()
 
-            if self.app.dwarf.dwarf_api('isAddressWatched', item.get_address()):
+            if is_watched:
                 watcher = menu.addAction('Remove memory watcher')
             else:
                 watcher = menu.addAction('Add memory watcher')
@@ -82,7 +84,7 @@ class TableBaseWidget(QTableWidget):
                 if action == copy_address:
                     pyperclip.copy(hex(item.get_address()))
                 elif action == watcher:
-                    if self.app.dwarf.dwarf_api('isAddressWatched', item.get_address()):
+                    if is_watched:
                         self.app.dwarf.remove_watcher(item.get_address())
                     else:
                         self.app.dwarf.add_watcher(item.get_address())